@@ -245,6 +245,26 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(minute='*/15'), # La fiecare 15 minute
     },
 
+    'flush-trendyol-stock-price-every-minute': {
+        'task': 'ecommerce_trendyol.tasks.flush_trendyol_stock_price_updates',
+        'schedule': crontab(), # La fiecare minut: modificările din acest interval pleacă într-un singur lot
+    },
+
+    'publish-trendyol-listings-every-minute': {
+        'task': 'ecommerce_trendyol.tasks.publish_trendyol_listings',
+        'schedule': crontab(), # Listările create în acest interval pleacă în aceeași cerere, per cont
+    },
+
+    'poll-trendyol-batches-every-10-seconds': {
+        'task': 'ecommerce_trendyol.tasks.poll_trendyol_batches',
+        'schedule': 10.0, # Secunde: verifică doar batch-urile scadente, cu backoff per batch
+    },
+
+    'purge-finished-batch-checks-nightly': {
+        'task': 'ecommerce_trendyol.tasks.purge_finished_batch_checks_task',
+        'schedule': crontab(hour=4, minute=0),
+    },
+
     'sync-trendyol-claims-every-1-hour': {
         'task': 'ecommerce_trendyol.tasks.sync_trendyol_claims_periodic',
         'schedule': crontab(hour=1),
@@ -266,4 +286,11 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 # Cloudinary
 CLOUDINARY_CLOUD_NAME = os.getenv('CLOUDINARY_CLOUD_NAME')
 CLOUDINARY_API_KEY = os.getenv('CLOUDINARY_API_KEY')
-CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET')
\ No newline at end of file
+CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET')
+
+# Colaje bundle: câte upload-uri rulează simultan și (opțional) un folder local în loc de Cloudinary
+BUNDLE_UPLOAD_CONCURRENCY = int(os.getenv('BUNDLE_UPLOAD_CONCURRENCY', 4))
+BUNDLE_COLLAGE_LOCAL_DIR = os.getenv('BUNDLE_COLLAGE_LOCAL_DIR')
+BUNDLE_COLLAGE_LOCAL_URL = os.getenv('BUNDLE_COLLAGE_LOCAL_URL')
+# Texte marketing: câte apeluri LLM rulează simultan
+BUNDLE_LLM_CONCURRENCY = int(os.getenv('BUNDLE_LLM_CONCURRENCY', 4))
@@ -0,0 +1,172 @@
+"""
+Urmărirea batch-urilor trimise la marketplace-uri (ex: creare produse Trendyol).
+
+În loc de un task Celery cu retry fix pentru fiecare batch, batch-urile în așteptare
+stau în tabela BatchStatusCheck, fiecare cu momentul următoarei verificări. Task-ul
+periodic al platformei (ex: ecommerce_trendyol.tasks.poll_trendyol_batches) preia
+într-o singură trecere batch-urile scadente, cont cu cont, și le reprogramează cu
+backoff exponențial: primele verificări la câteva secunde, apoi tot mai rar.
+Fiecare verificare se salvează imediat, iar un rezultat final nu mai e suprascris.
+"""
+import logging
+import random
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from .models import BatchStatusCheck
+
+logger = logging.getLogger(__name__)
+
+BATCH_CHECK_FIRST_DELAY = 5 # secunde până la prima verificare
+BATCH_CHECK_MAX_DELAY = 300 # cel mult 5 minute între verificări
+# Un batch nefinalizat după atât timp e considerat expirat
+BATCH_CHECK_TIMEOUT = timedelta(hours=2)
+# Cât timp e rezervat un batch preluat de o trecere (dacă worker-ul moare, se reia după)
+BATCH_CHECK_LEASE = timedelta(minutes=2)
+# Batch-uri preluate per cont într-o trecere: câte o cerere GET fiecare, cu limita
+# de rată a contului (50 / 10s, comună cu celelalte task-uri), deci mult sub lease
+BATCH_CHECKS_PER_ACCOUNT = 60
+# Rândurile finalizate se păstrează pentru histogramă
+BATCH_CHECK_RETENTION = timedelta(days=30)
+
+# Limitele (în secunde) histogramei timpului până la finalizare
+COMPLETION_BUCKETS = (10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def next_check_delay(attempts: int) -> float:
+    """Secundele până la verificarea următoare, după `attempts` verificări fără rezultat."""
+    delay = min(BATCH_CHECK_MAX_DELAY, BATCH_CHECK_FIRST_DELAY * 2 ** attempts)
+    # Jitter: batch-urile trimise împreună nu se verifică mereu în aceeași trecere
+    return delay * random.uniform(0.8, 1.0)
+
+
+def track_batch(platform_account_id: int, batch_request_id: str, submitted_at=None) -> BatchStatusCheck:
+    """Înregistrează un batch trimis; prima verificare peste BATCH_CHECK_FIRST_DELAY secunde."""
+    submitted_at = submitted_at or timezone.now()
+    check, _ = BatchStatusCheck.objects.get_or_create(
+        platform_account_id=platform_account_id,
+        batch_request_id=batch_request_id,
+        defaults={
+            "submitted_at": submitted_at,
+            "next_check_at": submitted_at + timedelta(seconds=BATCH_CHECK_FIRST_DELAY),
+        },
+    )
+    return check
+
+
+def due_batch_accounts(platform: str) -> List[int]:
+    """Conturile platformei care au batch-uri în așteptare scadente."""
+    return list(
+        BatchStatusCheck.objects.filter(
+            platform_account__platform=platform,
+            outcome=BatchStatusCheck.Outcome.PENDING,
+            next_check_at__lte=timezone.now(),
+        )
+        .order_by()
+        .values_list("platform_account_id", flat=True)
+        .distinct()
+    )
+
+
+def claim_due_batch_checks(platform_account_id: int, limit: int = BATCH_CHECKS_PER_ACCOUNT) -> List[BatchStatusCheck]:
+    """
+    Cel mult `limit` batch-uri scadente ale contului (cu contul încărcat), cele mai vechi
+    întâi. Le mută next_check_at după BATCH_CHECK_LEASE, deci o trecere paralelă nu le
+    preia și ea cât timp aceasta le verifică.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        checks = list(
+            BatchStatusCheck.objects.filter(
+                platform_account_id=platform_account_id,
+                outcome=BatchStatusCheck.Outcome.PENDING,
+                next_check_at__lte=now,
+            )
+            .select_related("platform_account")
+            .select_for_update(skip_locked=True, of=("self",))
+            .order_by("next_check_at")[:limit]
+        )
+        BatchStatusCheck.objects.filter(id__in=[check.id for check in checks]).update(
+            next_check_at=now + BATCH_CHECK_LEASE
+        )
+    for check in checks:
+        check.next_check_at = now + BATCH_CHECK_LEASE
+    return checks
+
+
+def _save(check: BatchStatusCheck) -> bool:
+    # Doar dacă e încă în așteptare: un rezultat final nu se suprascrie niciodată
+    return bool(
+        BatchStatusCheck.objects.filter(id=check.id, outcome=BatchStatusCheck.Outcome.PENDING).update(
+            outcome=check.outcome,
+            attempts=check.attempts,
+            next_check_at=check.next_check_at,
+            completed_at=check.completed_at,
+        )
+    )
+
+
+def reschedule(check: BatchStatusCheck, now=None) -> None:
+    """Batch-ul e încă în procesare: salvează verificarea următoare, cu backoff."""
+    now = now or timezone.now()
+    check.attempts += 1
+    check.next_check_at = now + timedelta(seconds=next_check_delay(check.attempts))
+    _save(check)
+
+
+def finish(check: BatchStatusCheck, outcome: str, now=None) -> bool:
+    """
+    Salvează rezultatul final al batch-ului. False dacă altă trecere l-a finalizat
+    între timp (apelantul rulează în aceeași tranzacție cu aplicarea rezultatului).
+    """
+    check.attempts += 1
+    check.outcome = outcome
+    check.completed_at = now or timezone.now()
+    return _save(check)
+
+
+def release(checks: Iterable[BatchStatusCheck]) -> None:
+    """Batch-uri preluate dar neverificate: redevin scadente imediat, fără să aștepte lease-ul."""
+    BatchStatusCheck.objects.filter(
+        id__in=[check.id for check in checks], outcome=BatchStatusCheck.Outcome.PENDING
+    ).update(next_check_at=timezone.now())
+
+
+def purge_finished_batch_checks() -> int:
+    cutoff = timezone.now() - BATCH_CHECK_RETENTION
+    deleted, _ = BatchStatusCheck.objects.exclude(outcome=BatchStatusCheck.Outcome.PENDING).filter(
+        completed_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def batch_completion_histogram(since=None, platform_account=None) -> Dict[str, int]:
+    """
+    Câte batch-uri s-au finalizat (COMPLETED / FAILED) în fiecare interval de timp de la
+    trimitere: {"<=10s": n, "<=30s": n, ..., ">3600s": n}. O singură interogare agregată.
+    """
+    checks = BatchStatusCheck.objects.filter(
+        outcome__in=[BatchStatusCheck.Outcome.COMPLETED, BatchStatusCheck.Outcome.FAILED]
+    )
+    if since is not None:
+        checks = checks.filter(completed_at__gte=since)
+    if platform_account is not None:
+        checks = checks.filter(platform_account=platform_account)
+    checks = checks.annotate(
+        duration=ExpressionWrapper(F("completed_at") - F("submitted_at"), output_field=DurationField())
+    )
+
+    aggregates = {}
+    lower: Optional[int] = None
+    for upper in COMPLETION_BUCKETS:
+        condition = Q(duration__lte=timedelta(seconds=upper))
+        if lower is not None:
+            condition &= Q(duration__gt=timedelta(seconds=lower))
+        aggregates[f"<={upper}s"] = Count("id", filter=condition)
+        lower = upper
+    aggregates[f">{lower}s"] = Count("id", filter=Q(duration__gt=timedelta(seconds=lower)))
+    return checks.aggregate(**aggregates)
@@ -0,0 +1,139 @@
+"""
+Cache-uri persistente folosite de generatorul de pachete: în Redis (prin
+django.core.cache) valorile mici, pe disc local indexul de comenzi al fiecărui cont.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .bundle_sources import BundleInputs
+from .bundling_core import CooccurrenceIndex
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CACHE_PREFIX = "bundling:upload"
+LLM_CACHE_PREFIX = "bundling:llm"
+RANKING_CACHE_PREFIX = "bundling:ranking"
+RANKING_TTL = 60 * 60 * 24 # 24 de ore
+ORDER_STATE_TTL = 60 * 60 * 24 * 7 # 7 zile
+
+
+class CacheUploadIndex:
+    """
+    Hash-ul colajului (sha256 pe octeții JPEG) -> secure_url deja urcat.
+    Nu expiră: același conținut are mereu același URL.
+    """
+
+    def __init__(self, prefix: str = UPLOAD_CACHE_PREFIX):
+        self.prefix = prefix
+
+    def get(self, digest: str) -> Optional[str]:
+        return cache.get(f"{self.prefix}:{digest}")
+
+    def set(self, digest: str, url: str) -> None:
+        cache.set(f"{self.prefix}:{digest}", url, timeout=None)
+
+
+class CacheLLMResponses:
+    """
+    Răspunsurile JSON ale LLM-ului, după hash-ul promptului (vezi llm_client.prompt_cache_key).
+    Un bundle identic regenerat nu mai plătește un nou apel; TTL-ul îl dă apelantul.
+    """
+
+    def __init__(self, prefix: str = LLM_CACHE_PREFIX):
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return cache.get(f"{self.prefix}:{key}")
+
+    def set(self, key: str, value: Dict[str, Any], ttl: int) -> None:
+        cache.set(f"{self.prefix}:{key}", value, timeout=ttl)
+
+
+class GenerationCache:
+    """
+    Rezultatele generate_bundles + rank_bundles, după amprenta datelor de intrare:
+    versiunea catalogului, reperul comenzilor, PricingConfig, BundleConfig și top_n.
+    Orice schimbare în acestea dă o cheie nouă, deci intrările vechi nu mai sunt
+    citite (expiră singure după RANKING_TTL).
+
+    Separat păstrăm indexul de co-ocurență al fiecărui cont (BundleInputs fără produse),
+    ca la comenzi noi să citim doar liniile apărute de la ultima rulare. Indexul (perechile
+    de SKU-uri, vezi DatabaseBundleSource) stă pe disc local (.npz, fără pickle), nu în
+    Redis; un worker fără fișier îl reconstruiește din DB.
+    """
+
+    def __init__(self, order_state_dir: Optional[str] = None):
+        self.order_state_dir = order_state_dir or os.path.join(settings.BASE_DIR, ".bundling_cache", "orders")
+
+    def key(self, fingerprint, pricing, bundle_config, top_n) -> str:
+        payload = json.dumps([fingerprint, asdict(pricing), asdict(bundle_config), top_n], sort_keys=True)
+        return f"{RANKING_CACHE_PREFIX}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get_ranking(self, key) -> Optional[Tuple[List[Any], List[Tuple[Any, float]]]]:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        return entry["raw"], entry["ranked"]
+
+    def set_ranking(self, key, raw_bundles, ranked) -> None:
+        # Un singur obiect: bundle-urile din `ranked` rămân aceleași instanțe ca în `raw` la citire.
+        cache.set(key, {"raw": list(raw_bundles), "ranked": list(ranked)}, timeout=RANKING_TTL)
+
+    def _order_state_path(self, user) -> str:
+        return os.path.join(self.order_state_dir, f"{user.pk}.npz")
+
+    def get_order_state(self, user) -> Optional[BundleInputs]:
+        if user is None:
+            return None
+        path = self._order_state_path(user)
+        try:
+            if time.time() - os.path.getmtime(path) > ORDER_STATE_TTL:
+                return None
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Index comenzi ilizibil pentru {user}, se reconstruiește: {e}")
+            return None
+
+        demand = Counter(dict(zip(arrays.pop("demand_skus").tolist(), arrays.pop("demand_qty").tolist())))
+        watermark = tuple(int(value) for value in arrays.pop("order_watermark").tolist())
+        return BundleInputs(
+            products=[],
+            cooccurrence=CooccurrenceIndex.from_arrays(arrays),
+            demand=demand,
+            order_watermark=watermark,
+        )
+
+    def set_order_state(self, user, inputs) -> None:
+        if user is None or not inputs.order_watermark:
+            return
+        arrays = inputs.cooccurrence.to_arrays()
+        arrays["demand_skus"] = np.asarray(list(inputs.demand), dtype=str)
+        arrays["demand_qty"] = np.asarray(list(inputs.demand.values()), dtype=np.int64)
+        arrays["order_watermark"] = np.asarray(inputs.order_watermark, dtype=np.int64)
+
+        path = self._order_state_path(user)
+        tmp_path = None
+        try:
+            os.makedirs(self.order_state_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.order_state_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as fh:
+                np.savez(fh, **arrays)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Nu am putut salva indexul comenzilor pentru {user}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,128 @@
+"""
+Joburi asincrone de generare a pachetelor (Celery).
+
+Starea unui job (etapa curentă și sugestiile gata până acum) stă în cache (Redis),
+ca frontend-ul să poată afișa rezultatele parțiale. Etapele se scriu și într-un
+SystemEvent, la fel ca la procesarea facturilor.
+"""
+import logging
+import uuid
+
+from django.core.cache import cache
+
+from .bundle_sources import select_bundle_source
+from .models import SystemEvent
+
+logger = logging.getLogger(__name__)
+
+JOB_CACHE_PREFIX = "bundling:job"
+RESULT_CACHE_PREFIX = "bundling:result"
+INFLIGHT_CACHE_PREFIX = "bundling:inflight"
+JOB_TTL = 60 * 60 * 6 # 6 ore
+RESULT_TTL = 60 * 60 * 24 # 24 de ore
+EVENT_TYPE = "bundle_generation"
+
+
+def job_cache_key(job_id):
+    return f"{JOB_CACHE_PREFIX}:{job_id}"
+
+
+def result_cache_key(user, limit, fingerprint):
+    user_part = user.pk if user is not None else "anon"
+    return f"{RESULT_CACHE_PREFIX}:{user_part}:{limit}:{fingerprint}"
+
+
+def get_job(job_id):
+    return cache.get(job_cache_key(job_id))
+
+
+def start_bundle_generation(user, limit):
+    """
+    Pornește (sau refolosește) un job de generare și întoarce starea lui.
+
+    - Aceleași date de intrare (amprenta sursei) + același limit => rezultatul din cache, fără job nou.
+    - Un job identic deja în lucru => întoarcem acel job.
+    """
+    from .tasks import generate_bundle_suggestions_task
+
+    source = select_bundle_source(user)
+    if source is None:
+        # La fel ca înainte: fără date nu avem sugestii, dar nici eroare
+        return {"job_id": None, "status": "completed", "stage": "done", "suggestions": []}
+
+    result_key = result_cache_key(user, limit, source.fingerprint())
+    cached = cache.get(result_key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    job_id = uuid.uuid4().hex
+    inflight_key = f"{INFLIGHT_CACHE_PREFIX}:{result_key}"
+    if not cache.add(inflight_key, job_id, timeout=JOB_TTL):
+        running = get_job(cache.get(inflight_key))
+        if running is not None:
+            return running
+        cache.set(inflight_key, job_id, timeout=JOB_TTL)
+
+    event = SystemEvent.objects.create(
+        type=EVENT_TYPE,
+        message=f"Generare pachete pornită (job {job_id[:8]}).",
+        status="pending",
+    )
+    state = {
+        "job_id": job_id,
+        "status": "pending",
+        "stage": "queued",
+        "message": event.message,
+        "event_id": event.id,
+        "user_id": user.pk if user is not None else None,
+        "limit": limit,
+        "suggestions": [],
+    }
+    cache.set(job_cache_key(job_id), state, timeout=JOB_TTL)
+
+    generate_bundle_suggestions_task.delay(job_id, user.pk if user is not None else None, limit, result_key)
+    return state
+
+
+class BundleJobProgress:
+    """
+    Primește etapele și sugestiile de la run_bundle_generation_service și le publică:
+    starea jobului în cache, mesajul curent în SystemEvent.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.state = get_job(job_id) or {"job_id": job_id, "suggestions": []}
+        self.event = SystemEvent.objects.filter(id=self.state.get("event_id")).first()
+
+    def _save(self):
+        cache.set(job_cache_key(self.job_id), self.state, timeout=JOB_TTL)
+
+    def _event(self, message, status):
+        if self.event is None:
+            return
+        self.event.message = message[:255]
+        self.event.status = status
+        self.event.save(update_fields=["message", "status"])
+
+    def stage(self, stage, message):
+        self.state.update(status="processing", stage=stage, message=message)
+        self._save()
+        self._event(message, "processing")
+
+    def suggestion(self, suggestion):
+        self.state["suggestions"].append(suggestion)
+        self._save()
+
+    def complete(self, suggestions):
+        message = f"Generare finalizată: {len(suggestions)} sugestii."
+        self.state.update(status="completed", stage="done", message=message, suggestions=suggestions)
+        self._save()
+        self._event(message, "completed")
+        return self.state
+
+    def fail(self, error):
+        message = f"Eroare generare: {error}"
+        self.state.update(status="error", stage="error", message=message, error=str(error))
+        self._save()
+        self._event(message, "error")
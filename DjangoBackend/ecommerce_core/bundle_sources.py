@@ -0,0 +1,257 @@
+"""
+Surse de date pentru generatorul de pachete (bundling_core).
+
+Generatorul are nevoie de catalog (Product), de coșurile de comenzi (indexul de
+co-ocurență) și de cererea per SKU. Ambele surse întorc același BundleInputs,
+astfel încât serviciul nu depinde de unde vin datele.
+"""
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterator, List, Mapping, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .bundling_core import CooccurrenceIndex, read_orders, read_products
+from .bundling_core.models import Product as BundleProduct
+from .demand import account_demand
+from .models import OrderLineItem, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_BATCH_SIZE = 200_000
+DEFAULT_VAT_RATE = 21.0
+
+
+@dataclass
+class BundleInputs:
+    products: List[BundleProduct]
+    cooccurrence: CooccurrenceIndex
+    demand: Counter = field(default_factory=Counter)
+    # (nr. linii, ultimul ID) la momentul citirii; gol când sursa nu permite actualizări incrementale
+    order_watermark: Tuple[int, ...] = ()
+
+    @property
+    def has_orders(self) -> bool:
+        return self.cooccurrence.order_count > 0
+
+
+class ExcelBundleSource:
+    """
+    Sursa veche: foile 'products' și 'orders' dintr-un fișier Excel (data.xlsx).
+    """
+
+    def __init__(self, excel_path: str, use_cache: bool = True):
+        self.excel_path = excel_path
+        self.use_cache = use_cache
+
+    def fingerprint(self) -> str:
+        """Se schimbă când fișierul e rescris (mtime/dimensiune)."""
+        stat = os.stat(self.excel_path)
+        return f"xlsx:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def load(self, previous: Optional[BundleInputs] = None) -> BundleInputs:
+        # Fișierul se citește mereu integral; `previous` există doar pentru interfață comună.
+        products = read_products(self.excel_path, use_cache=self.use_cache)
+        orders = read_orders(self.excel_path, use_cache=self.use_cache)
+
+        demand: Counter = Counter()
+        for order in orders:
+            demand[order.product_sku] += order.quantity
+        return BundleInputs(
+            products=products,
+            cooccurrence=CooccurrenceIndex.from_orders(orders),
+            demand=demand,
+        )
+
+    def ranking_demand(self, inputs: BundleInputs) -> Mapping[str, float]:
+        """Fișierul nu are date ale comenzilor: cererea rămâne numărul de unități comandate."""
+        return inputs.demand
+
+
+class DatabaseBundleSource:
+    """
+    Citește catalogul și liniile de comandă ale unui cont direct din DB.
+
+    Folosim values_list + iterator(chunk_size) (cursor pe server în PostgreSQL),
+    deci nu instanțiem modele Django. Liniile de comandă nu devin nici ele obiecte
+    Order: fiecare bucată de rânduri intră coloană cu coloană în CooccurrenceIndex.
+    O bucată se închide la granița dintre comenzi, deci după ea coșurile sunt complete
+    și indexul renunță la linii (forget_lines): memoria rămâne proporțională cu
+    perechile de SKU-uri și cu o bucată, nu cu istoricul de comenzi.
+    """
+
+    PRODUCT_FIELDS = (
+        "sku",
+        "product__title",
+        "product__brand",
+        "product__description",
+        "price",
+        "stock",
+        "type",
+        "images",
+        "attributes",
+    )
+    ORDER_LINE_FIELDS = ("order_id", "variant__sku", "sku", "quantity")
+
+    def __init__(self, user, chunk_size: int = DEFAULT_CHUNK_SIZE, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.user = user
+        # chunk_size: rânduri aduse per drum la DB; batch_size: linii per actualizare a indexului
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+
+    def has_catalog(self) -> bool:
+        return ProductVariant.objects.filter(product__account=self.user).exists()
+
+    def catalog_version(self) -> str:
+        """Nr. de variante + ultima modificare (variantă sau produs părinte)."""
+        catalog = ProductVariant.objects.filter(product__account=self.user).aggregate(
+            rows=Count("id"), updated=Max("updated_at"), product_updated=Max("product__updated_at")
+        )
+        stamps = [value.isoformat() if value else "-" for value in (catalog["updated"], catalog["product_updated"])]
+        return f"{catalog['rows']}:{stamps[0]}:{stamps[1]}"
+
+    def order_watermark(self) -> Tuple[int, int]:
+        """
+        (nr. de linii de comandă, cel mai mare ID). Liniile existente nu se rescriu la
+        sincronizare (se schimbă doar statusul), deci ID-ul maxim ajunge ca reper.
+        """
+        lines = OrderLineItem.objects.filter(order__account=self.user).aggregate(
+            rows=Count("id"), last=Max("id")
+        )
+        return lines["rows"], lines["last"] or 0
+
+    def fingerprint(self) -> str:
+        """Versiunea datelor contului, din trei agregări, fără a citi rândurile."""
+        rows, last = self.order_watermark()
+        return f"db:{self.user.pk}:{self.catalog_version()}:{rows}:{last}"
+
+    def load(self, previous: Optional[BundleInputs] = None) -> BundleInputs:
+        """
+        Cu `previous` (rezultatul unui load anterior, ex: de pe disc) citim doar liniile
+        de comandă apărute după reperul lui și le adăugăm în indexul existent.
+        Dacă între timp au dispărut linii, reconstruim indexul de la zero.
+        """
+        products = list(self.iter_products())
+        watermark = self.order_watermark()
+        rows, last = watermark
+
+        inputs = None
+        if previous is not None and len(previous.order_watermark) == 2:
+            prev_rows, prev_last = previous.order_watermark
+            if (prev_rows, prev_last) == watermark:
+                inputs = previous
+            elif rows >= prev_rows and last >= prev_last:
+                added = self._fold_order_lines(previous, after_id=prev_last, up_to_id=last)
+                if prev_rows + added == rows:
+                    inputs = previous
+                    logger.info(f"Index comenzi actualizat incremental pentru {self.user}: +{added} linii")
+
+        if inputs is None:
+            inputs = BundleInputs(products=[], cooccurrence=CooccurrenceIndex())
+            self._fold_order_lines(inputs, after_id=None, up_to_id=last)
+
+        inputs.products = products
+        inputs.order_watermark = watermark
+        logger.info(
+            f"Date bundle din DB pentru {self.user}: {len(products)} variante, "
+            f"{rows} linii în {inputs.cooccurrence.order_count} comenzi"
+        )
+        return inputs
+
+    def ranking_demand(self, inputs: BundleInputs) -> Mapping[str, float]:
+        """Cererea descrescută în timp din DemandFeature, nu totalul istoric din `inputs`."""
+        return account_demand(self.user)
+
+    def _fold_order_lines(self, inputs: BundleInputs, after_id: Optional[int], up_to_id: int) -> int:
+        lines = 0
+        for order_ids, skus, quantities in self.iter_order_line_chunks(after_id=after_id, up_to_id=up_to_id):
+            inputs.cooccurrence.update_arrays(order_ids, skus, quantities)
+            # Liniile unei comenzi se salvează împreună (process_orders_page), deci o comandă
+            # nu mai primește linii după ce a fost citită; păstrăm doar perechile
+            inputs.cooccurrence.forget_lines()
+            for sku, qty in zip(skus, quantities):
+                inputs.demand[sku] += qty
+            lines += len(skus)
+        return lines
+
+    def iter_products(self) -> Iterator[BundleProduct]:
+        rows = (
+            ProductVariant.objects.filter(product__account=self.user)
+            .order_by()
+            .values_list(*self.PRODUCT_FIELDS)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        for sku, title, brand, description, price, stock, variant_type, images, attributes in rows:
+            attributes = attributes if isinstance(attributes, dict) else {}
+            category = attributes.get("categorie") or attributes.get("category") or "Uncategorized"
+            yield BundleProduct(
+                sku=sku,
+                name=(title or "").strip(),
+                brand=(brand or "").strip(),
+                category=str(category).strip() or "Uncategorized",
+                price_with_vat=float(price or 0),
+                vat_rate=DEFAULT_VAT_RATE,
+                available_stock=int(stock or 0),
+                # Un bundle existent nu intră la rândul lui într-un alt bundle.
+                bundle_enabled=variant_type == ProductVariant.Type.SIMPLE,
+                image_url=images[0] if isinstance(images, list) and images else None,
+                description=description or None,
+            )
+
+    def iter_order_line_chunks(
+        self,
+        after_id: Optional[int] = None,
+        up_to_id: Optional[int] = None,
+    ) -> Iterator[Tuple[List[str], List[str], List[int]]]:
+        """
+        Întoarce liniile de comandă în loturi coloană: (order_ids, skus, quantities).
+        Un lot se închide doar la granița dintre comenzi, ca un coș să nu fie împărțit
+        (indexul nu mai trebuie să renumere coșuri deja văzute).
+        SKU-ul variantei locale are prioritate față de merchantSku-ul primit de la platformă.
+        after_id / up_to_id limitează liniile la intervalul de ID-uri (after_id, up_to_id].
+        """
+        lines = OrderLineItem.objects.filter(order__account=self.user)
+        if after_id is not None:
+            lines = lines.filter(id__gt=after_id)
+        if up_to_id is not None:
+            lines = lines.filter(id__lte=up_to_id)
+        rows = (
+            lines
+            .order_by("order_id", "id")
+            .values_list(*self.ORDER_LINE_FIELDS)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        order_ids: List[str] = []
+        skus: List[str] = []
+        quantities: List[int] = []
+        for order_id, variant_sku, line_sku, quantity in rows:
+            order_id = str(order_id)
+            if len(order_ids) >= self.batch_size and order_id != order_ids[-1]:
+                yield order_ids, skus, quantities
+                order_ids, skus, quantities = [], [], []
+            order_ids.append(order_id)
+            skus.append(variant_sku or line_sku)
+            quantities.append(int(quantity))
+        if order_ids:
+            yield order_ids, skus, quantities
+
+
+def select_bundle_source(user=None):
+    """
+    Catalogul din DB al contului, dacă există; altfel data.xlsx din rădăcina proiectului.
+    Întoarce None când nu avem nicio sursă.
+    """
+    if user is not None:
+        db_source = DatabaseBundleSource(user)
+        if db_source.has_catalog():
+            return db_source
+
+    excel_path = os.path.join(settings.BASE_DIR, 'data.xlsx')
+    if not os.path.exists(excel_path):
+        logger.error(f"Nu am găsit data.xlsx la: {excel_path}")
+        return None
+    return ExcelBundleSource(excel_path)
@@ -0,0 +1,178 @@
+"""
+Recalcularea stocului bundle-urilor (ProductVariant de tip BUNDLE) și rezervarea
+stocului la comenzi noi.
+
+Stocul unui bundle = MIN(stoc componentă // cantitate) peste componentele lui.
+Îl calculăm pentru toate bundle-urile afectate dintr-o singură interogare agregată
+și scriem doar ce s-a schimbat, cu bulk_update.
+
+Schimbările se adună și se procesează o singură dată:
+- la commit-ul tranzacției curente (transaction.on_commit; imediat în autocommit);
+- la ieșirea din `coalesce_bundle_stock()`, pentru importuri lungi care nu stau
+  într-o singură tranzacție (ex: o comandă cu 500 de linii, o factură).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, IntegerField, Min
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .marketplace_sync import trigger_marketplace_updates
+from .models import BundleComponent, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+BULK_UPDATE_BATCH_SIZE = 500
+
+_pending = threading.local()
+
+
+def _state():
+    if not hasattr(_pending, "components"):
+        _pending.components = set()
+        _pending.bundles = set()
+        _pending.depth = 0
+    return _pending
+
+
+def compute_bundle_stocks(bundle_ids: Iterable[int]) -> Dict[int, int]:
+    """{bundle_id: stoc} dintr-o interogare; bundle-urile fără componente lipsesc (stoc 0)."""
+    rows = (
+        BundleComponent.objects.filter(bundle_variant_id__in=list(bundle_ids), quantity__gt=0)
+        .order_by()
+        .values("bundle_variant_id")
+        .annotate(
+            stock=Min(ExpressionWrapper(F("component_variant__stock") / F("quantity"), output_field=IntegerField()))
+        )
+        .values_list("bundle_variant_id", "stock")
+    )
+    return {bundle_id: max(0, int(stock or 0)) for bundle_id, stock in rows}
+
+
+def bundles_containing(variant_ids: Iterable[int]) -> List[int]:
+    return list(
+        BundleComponent.objects.filter(component_variant_id__in=list(variant_ids))
+        .order_by()
+        .values_list("bundle_variant_id", flat=True)
+        .distinct()
+    )
+
+
+def recompute_bundle_stock(bundle_ids: Iterable[int]) -> List[ProductVariant]:
+    """
+    Recalculează și salvează stocul bundle-urilor date. bulk_update nu declanșează
+    semnalele, așa că notificarea către marketplace o facem aici, doar pentru
+    bundle-urile al căror stoc s-a schimbat. Întoarce aceste bundle-uri.
+    """
+    bundle_ids = list(bundle_ids)
+    stocks = compute_bundle_stocks(bundle_ids)
+    now = timezone.now()
+    changed = []
+    bundles = ProductVariant.objects.filter(id__in=bundle_ids, type=ProductVariant.Type.BUNDLE).only("id", "stock")
+    for bundle in bundles:
+        new_stock = stocks.get(bundle.id, 0)
+        if bundle.stock != new_stock:
+            bundle.stock = new_stock
+            bundle.updated_at = now
+            changed.append(bundle)
+
+    if changed:
+        ProductVariant.objects.bulk_update(changed, ["stock", "updated_at"], batch_size=BULK_UPDATE_BATCH_SIZE)
+        logger.info(f"Stoc recalculat pentru {len(bundle_ids)} bundle-uri, {len(changed)} modificate")
+    trigger_marketplace_updates(bundle.id for bundle in changed)
+    return changed
+
+
+def reserve_stock(ordered: Dict[ProductVariant, int]) -> Dict[int, int]:
+    """
+    Scade stocul pentru cantitățile comandate ({variantă: cantitate}). Un bundle se
+    descompune în componentele lui. Fiecare variantă afectată primește un singur
+    UPDATE stock = GREATEST(stock - x, 0) (variantele cu aceeași cantitate, același
+    UPDATE), fără citire prealabilă, deci fără curse între procese.
+    .update() nu trimite semnale: bundle-urile afectate și outbox-ul marketplace
+    se programează explicit, la commit. Întoarce {variant_id: cantitate scăzută}.
+    """
+    needed: Dict[int, int] = defaultdict(int)
+    ordered_bundles: Dict[int, int] = defaultdict(int)
+    for variant, quantity in ordered.items():
+        if quantity <= 0:
+            continue
+        if variant.type == ProductVariant.Type.BUNDLE:
+            ordered_bundles[variant.id] += quantity
+        else:
+            needed[variant.id] += quantity
+
+    if ordered_bundles:
+        components = BundleComponent.objects.filter(bundle_variant_id__in=list(ordered_bundles)).values_list(
+            "bundle_variant_id", "component_variant_id", "quantity"
+        )
+        for bundle_id, component_id, quantity in components:
+            needed[component_id] += quantity * ordered_bundles[bundle_id]
+
+    by_quantity: Dict[int, List[int]] = defaultdict(list)
+    for variant_id, quantity in needed.items():
+        if quantity > 0:
+            by_quantity[quantity].append(variant_id)
+    now = timezone.now()
+    for quantity, variant_ids in by_quantity.items():
+        ProductVariant.objects.filter(id__in=variant_ids).update(
+            stock=Greatest(F("stock") - quantity, 0), updated_at=now
+        )
+
+    mark_components_changed(needed)
+    trigger_marketplace_updates(needed)
+    return dict(needed)
+
+
+def mark_components_changed(variant_ids: Iterable[int]) -> None:
+    """Stocul acestor variante simple s-a schimbat: bundle-urile care le conțin trebuie recalculate."""
+    state = _state()
+    state.components.update(variant_ids)
+    _schedule()
+
+
+def mark_bundles_changed(bundle_ids: Iterable[int]) -> None:
+    """Structura acestor bundle-uri s-a schimbat (componente adăugate/șterse/cantități)."""
+    state = _state()
+    state.bundles.update(bundle_ids)
+    _schedule()
+
+
+def _schedule() -> None:
+    # Un callback per schimbare, dar doar primul găsește ceva de făcut: restul văd
+    # mulțimile goale. Dacă tranzacția e anulată, callback-urile dispar odată cu ea,
+    # iar ID-urile rămase se recalculează (inofensiv) la următorul flush.
+    if _state().depth == 0:
+        transaction.on_commit(flush_bundle_stock)
+
+
+def flush_bundle_stock() -> List[ProductVariant]:
+    state = _state()
+    components, bundles = state.components, state.bundles
+    state.components, state.bundles = set(), set()
+    if components:
+        bundles.update(bundles_containing(components))
+    if not bundles:
+        return []
+    return recompute_bundle_stock(bundles)
+
+
+@contextmanager
+def coalesce_bundle_stock():
+    """
+    Amână recalcularea până la ieșirea din bloc (blocurile se pot imbrica; contează cel exterior).
+    Util pentru importuri cu multe salvări de variante, fiecare în tranzacția ei.
+    """
+    state = _state()
+    state.depth += 1
+    try:
+        yield
+    finally:
+        state.depth -= 1
+        if state.depth == 0 and (state.components or state.bundles):
+            transaction.on_commit(flush_bundle_stock)
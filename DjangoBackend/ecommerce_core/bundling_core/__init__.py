@@ -3,6 +3,7 @@ from .ai import (
     enrich_bundle_with_marketing_text,
     rank_bundles,
 )
+from .cooccurrence import CooccurrenceIndex
 from .images import generate_collage, upload_to_cloudinary
 from .io import load_environment, read_orders, read_products, write_catalog
 from .logic import compute_max_bundle_stock, generate_bundles
@@ -13,6 +14,7 @@ from .models import (
     CloudinaryConfig,
     PricingConfig,
     Product,
+    RankingWeights,
 )
 
 __all__ = [
@@ -22,6 +24,8 @@ __all__ = [
     "CloudinaryConfig",
     "PricingConfig",
     "Product",
+    "RankingWeights",
+    "CooccurrenceIndex",
     "compute_max_bundle_stock",
     "generate_bundles",
     "generate_collage",
@@ -1,47 +1,51 @@
 from __future__ import annotations
 
 from collections import Counter
-from typing import List, Optional, Sequence, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
 import json
 import os
 
-from .models import Bundle, Order, Product
-from .llm_client import call_llm_json, load_llm_config
+from .models import Bundle, Order, Product, RankingWeights
+from .ranking import bundle_arrays, demand_vector, score_bundle_arrays, top_k
+from .llm_client import ResponseCache, call_llm_json, load_llm_config
+
+DEFAULT_ENRICH_CONCURRENCY = 4
+DEFAULT_BATCH_TOKEN_BUDGET = 3000
+DEFAULT_BATCH_SIZE = 10
 
 
 def rank_bundles(
     bundles: Sequence[Bundle],
     orders: Optional[Sequence[Order]] = None,
     top_n: Optional[int] = None,
+    demand: Optional[Mapping[str, float]] = None,
+    weights: Optional[RankingWeights] = None,
 ) -> List[Tuple[Bundle, float]]:
     """
     Score bundles using a lightweight heuristic:
-    - demand boost if items appeared in recent orders
+    - demand boost if items appeared in recent orders (or in a precomputed `demand` map)
     - preference for healthier margin
     - slight penalty for very expensive bundles to keep prices accessible
+    Scores are computed over NumPy arrays and only the top_n winners are sorted;
+    `weights` tunes the individual terms.
     """
-    order_counts: Counter[str] = Counter()
-    if orders:
-        for order in orders:
+    if demand is None:
+        order_counts: Counter[str] = Counter()
+        for order in orders or []:
             order_counts[order.product_sku] += order.quantity
+        demand = order_counts
 
-    scored: List[Tuple[Bundle, float]] = []
-    for bundle in bundles:
-        if getattr(bundle, "max_bundle_stock", 0) <= 0:
-            continue
-
-        demand_score = sum(order_counts[item.product.sku] * item.quantity for item in bundle.items)
-        margin = max(0.0, bundle.final_price - bundle.base_price)
-        price_penalty = bundle.final_price * 0.01
-        stock_factor = 1.0 + min(bundle.max_bundle_stock, 50) / 100.0
-
-        score = (demand_score * 2.0 + margin - price_penalty) * stock_factor
-        scored.append((bundle, score))
+    in_stock = [bundle for bundle in bundles if getattr(bundle, "max_bundle_stock", 0) > 0]
+    if not in_stock:
+        return []
 
-    scored.sort(key=lambda pair: pair[1], reverse=True)
-    if top_n:
-        return scored[:top_n]
-    return scored
+    skus, codes, quantities, final_price, base_price, stock = bundle_arrays(in_stock)
+    scores = score_bundle_arrays(
+        demand_vector(skus, demand), codes, quantities, final_price, base_price, stock, weights
+    )
+    winners = top_k(scores, top_n)
+    return [(in_stock[pos], score) for pos, score in zip(winners.tolist(), scores[winners].tolist())]
 
 
 def select_and_enrich_top_bundles_with_llm(
@@ -197,22 +201,29 @@ def choose_best_bundles_with_llm(
     return enhanced[:top_n] if top_n else enhanced
 
 
+def _item_lines(bundle: Bundle) -> List[str]:
+    return [
+        f"- {it.quantity} x {it.product.name} ({it.product.brand}, {it.product.category})"
+        for it in bundle.items
+    ]
+
+
 def enrich_bundle_with_marketing_text(
     bundle: Bundle,
     products: Sequence[Product],
     client: Optional[object] = None,
+    cache: Optional[ResponseCache] = None,
 ) -> Bundle:
     """
     Simple enrichment: ask LLM for title/description JSON.
     If LLM not configured or fails, returns the bundle unchanged.
+    Identical prompts are answered from `cache` when one is given.
     """
     cfg = load_llm_config()
     if cfg.provider == "none":
         return bundle
 
-    item_lines = []
-    for it in bundle.items:
-        item_lines.append(f"- {it.quantity} x {it.product.name} ({it.product.brand}, {it.product.category})")
+    item_lines = _item_lines(bundle)
 
     prompt_obj = {
         "goal": "Create a short marketing title and 2-sentence description for this bundle.",
@@ -226,7 +237,13 @@ def enrich_bundle_with_marketing_text(
     }
 
     system_prompt = "You are a concise e-commerce copywriter. Respond with JSON: {\"title\": \"...\", \"description\": \"...\"}."
-    result = call_llm_json(prompt=json.dumps(prompt_obj, ensure_ascii=False), cfg=cfg, system_prompt=system_prompt)
+    result = call_llm_json(
+        prompt=json.dumps(prompt_obj, ensure_ascii=False),
+        cfg=cfg,
+        system_prompt=system_prompt,
+        cache=cache,
+        cache_if=_valid_marketing_entry,
+    )
     if not isinstance(result, dict):
         return bundle
 
@@ -236,3 +253,162 @@ def enrich_bundle_with_marketing_text(
     except Exception:
         pass
     return bundle
+
+
+def enrich_bundles_with_marketing_text(
+    bundles: Sequence[Bundle],
+    products: Sequence[Product],
+    max_workers: int = DEFAULT_ENRICH_CONCURRENCY,
+    cache: Optional[ResponseCache] = None,
+) -> List[Optional[Bundle]]:
+    """
+    Run enrich_bundle_with_marketing_text for many bundles with at most
+    `max_workers` LLM calls in flight. Results keep the input order; an entry
+    is None when enriching that bundle raised.
+    """
+    if not bundles:
+        return []
+
+    def _enrich(bundle: Bundle) -> Optional[Bundle]:
+        try:
+            return enrich_bundle_with_marketing_text(bundle, products, cache=cache)
+        except Exception as exc:
+            print(f"[llm] enrichment failed for {bundle.sku}: {exc}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(bundles)))) as pool:
+        return list(pool.map(_enrich, bundles))
+
+
+def _estimate_tokens(obj: object) -> int:
+    # ~4 characters per token is close enough for budgeting prompt size.
+    return len(json.dumps(obj, ensure_ascii=False)) // 4 + 1
+
+
+def _pack_batches(entries: Sequence[Dict[str, object]], token_budget: int, max_per_batch: int) -> List[List[int]]:
+    """Greedily group entry positions so each batch stays under the token budget."""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for pos, entry in enumerate(entries):
+        cost = _estimate_tokens(entry)
+        if current and (used + cost > token_budget or len(current) >= max_per_batch):
+            batches.append(current)
+            current, used = [], 0
+        current.append(pos)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _valid_marketing_entry(entry: object) -> bool:
+    if not isinstance(entry, dict):
+        return False
+    title, description = entry.get("title"), entry.get("description")
+    return (
+        isinstance(title, str)
+        and bool(title.strip())
+        and isinstance(description, str)
+        and bool(description.strip())
+    )
+
+
+def enrich_bundles_in_batches(
+    bundles: Sequence[Bundle],
+    products: Sequence[Product],
+    token_budget: int = DEFAULT_BATCH_TOKEN_BUDGET,
+    max_per_batch: int = DEFAULT_BATCH_SIZE,
+    max_retries: int = 2,
+    max_workers: int = DEFAULT_ENRICH_CONCURRENCY,
+    cache: Optional[ResponseCache] = None,
+) -> List[Optional[Bundle]]:
+    """
+    Enrich many bundles with marketing title/description using one LLM call per
+    batch instead of one per bundle. Bundles are packed up to `token_budget`
+    (estimated) and `max_per_batch`; each reply entry is validated on its own
+    and only bundles with a missing or invalid entry are re-sent, for at most
+    `max_retries` extra rounds. Batches of the same round run concurrently.
+
+    Results keep the input order; an entry is None when no valid copy was
+    obtained for that bundle. Without a configured LLM the bundles are
+    returned unchanged, like enrich_bundle_with_marketing_text.
+    """
+    if not bundles:
+        return []
+    cfg = load_llm_config()
+    if cfg.provider == "none":
+        return list(bundles)
+
+    system_prompt = (
+        "You are a concise e-commerce copywriter. Respond with JSON: "
+        '{"bundles": [{"id": "...", "title": "...", "description": "..."}]}, '
+        "one entry for every bundle you receive, keeping its id."
+    )
+
+    def _valid_entries(result: object, batch: List[int]) -> Dict[int, Dict[str, str]]:
+        replies = result.get("bundles") if isinstance(result, dict) else None
+        valid: Dict[int, Dict[str, str]] = {}
+        for entry in replies if isinstance(replies, list) else []:
+            if not _valid_marketing_entry(entry):
+                continue
+            try:
+                pos = int(str(entry.get("id")))
+            except ValueError:
+                continue
+            if pos in batch:
+                valid[pos] = entry
+        return valid
+
+    def _call(batch: List[int]) -> Dict[int, Dict[str, str]]:
+        prompt_obj = {
+            "goal": "Create a short marketing title and 2-sentence description for each bundle.",
+            "bundles": [entries[pos] for pos in batch],
+            "response_format": {"bundles": [{"id": "string", "title": "string", "description": "string"}]},
+        }
+        result = call_llm_json(
+            prompt=json.dumps(prompt_obj, ensure_ascii=False),
+            cfg=cfg,
+            system_prompt=system_prompt,
+            cache=cache,
+            # Only complete replies are cached; a partial one would be replayed on retry
+            cache_if=lambda reply: len(_valid_entries(reply, batch)) == len(batch),
+        )
+        return _valid_entries(result, batch)
+
+    entries = [
+        {
+            "id": str(pos),
+            "sku": bundle.sku,
+            "price": bundle.final_price,
+            "stock": bundle.max_bundle_stock,
+            "items": _item_lines(bundle),
+        }
+        for pos, bundle in enumerate(bundles)
+    ]
+    results: List[Optional[Bundle]] = [None] * len(bundles)
+    remaining = list(range(len(bundles)))
+
+    for attempt in range(max_retries + 1):
+        if not remaining:
+            break
+        batches = [
+            [remaining[i] for i in batch]
+            for batch in _pack_batches([entries[pos] for pos in remaining], token_budget, max_per_batch)
+        ]
+        if attempt:
+            print(f"[llm] retrying {len(remaining)} bundle(s) in {len(batches)} batch(es)")
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+            replies = list(pool.map(_call, batches))
+
+        for valid in replies:
+            for pos, entry in valid.items():
+                bundle = bundles[pos]
+                bundle.title = entry["title"]
+                bundle.description = entry["description"]
+                results[pos] = bundle
+        remaining = [pos for pos in remaining if results[pos] is None]
+
+    if remaining:
+        print(f"[llm] no valid copy for {len(remaining)} bundle(s) after {max_retries} retries")
+    return results
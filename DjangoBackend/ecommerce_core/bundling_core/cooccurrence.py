@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+from typing import Collection, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .models import Order
+
+Pattern = Tuple[int, int, str]
+
+DEFAULT_PATTERNS: Tuple[Pattern, ...] = (
+    (1, 1, "1+1"),
+    (2, 1, "2+1"),
+    (3, 2, "3+2"),
+)
+
+_SKU_BITS = 32
+_SKU_MASK = (1 << _SKU_BITS) - 1
+_NO_SEQ = np.iinfo(np.int64).max
+
+
+def _encode(codes: Dict[str, int], vocabulary: List[str], values: Sequence[str]) -> np.ndarray:
+    """Map strings to stable integer codes, assigned in order of first appearance."""
+    local_codes, uniques = pd.factorize(np.asarray(values, dtype=object), sort=False)
+    mapping = np.empty(len(uniques), dtype=np.int64)
+    for idx, value in enumerate(uniques):
+        code = codes.get(value)
+        if code is None:
+            code = len(vocabulary)
+            codes[value] = code
+            vocabulary.append(value)
+        mapping[idx] = code
+    return mapping[local_codes]
+
+
+def _basket_pairs(basket_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return (left, right) line indices for every i < j pair inside the same basket.
+    Lines must be grouped contiguously by basket; pairs come out in nested-loop order.
+    """
+    n = len(basket_ids)
+    if n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(basket_ids)) + 1))
+    sizes = np.diff(np.append(starts, n))
+    position = np.arange(n) - np.repeat(starts, sizes)
+    later = np.repeat(sizes, sizes) - position - 1
+
+    left = np.repeat(np.arange(n), later)
+    offsets = np.repeat(np.cumsum(later) - later, later)
+    right = left + 1 + (np.arange(len(left)) - offsets)
+    return left, right
+
+
+class CooccurrenceIndex:
+    """
+    Sparse SKU x SKU co-occurrence counts per quantity pattern.
+
+    SKUs are integer-coded and every ordered pair (a, b) is stored as a single
+    int64 key, so the matrix for each pattern is a sorted array of keys with
+    matching counts. Baskets are kept in columnar form, which allows new order
+    lines (including lines for orders seen before) to be folded in incrementally,
+    until forget_lines() drops them.
+    """
+
+    def __init__(self, patterns: Sequence[Pattern] = DEFAULT_PATTERNS):
+        self.patterns: Tuple[Pattern, ...] = tuple(patterns)
+        self._sku_codes: Dict[str, int] = {}
+        self._skus: List[str] = []
+        self._order_codes: Dict[str, int] = {}
+        self._order_ids: List[str] = []
+
+        self._line_order = np.empty(0, dtype=np.int64)
+        self._line_sku = np.empty(0, dtype=np.int64)
+        self._line_qty = np.empty(0, dtype=np.int64)
+
+        self._keys = [np.empty(0, dtype=np.int64) for _ in self.patterns]
+        self._counts = [np.empty(0, dtype=np.int64) for _ in self.patterns]
+        self._first_seen = [np.empty(0, dtype=np.int64) for _ in self.patterns]
+        self._next_seq = 0
+        # Orders whose lines were dropped by forget_lines(); only their pair counts remain
+        self._forgotten_orders = 0
+
+    @classmethod
+    def from_orders(
+        cls,
+        orders: Iterable[Order],
+        patterns: Sequence[Pattern] = DEFAULT_PATTERNS,
+    ) -> "CooccurrenceIndex":
+        index = cls(patterns)
+        index.update(orders)
+        return index
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Plain numpy arrays (no pickled objects) that from_arrays() turns back into an
+        equal index, e.g. for np.savez.
+        """
+        arrays = {
+            "patterns": np.asarray([[a, b] for a, b, _ in self.patterns], dtype=np.int64).reshape(-1, 2),
+            "pattern_labels": np.asarray([label for _, _, label in self.patterns], dtype=str),
+            "skus": np.asarray(self._skus, dtype=str),
+            "order_ids": np.asarray(self._order_ids, dtype=str),
+            "line_order": self._line_order,
+            "line_sku": self._line_sku,
+            "line_qty": self._line_qty,
+            "next_seq": np.asarray(self._next_seq, dtype=np.int64),
+            "forgotten_orders": np.asarray(self._forgotten_orders, dtype=np.int64),
+        }
+        for idx in range(len(self.patterns)):
+            arrays[f"keys_{idx}"] = self._keys[idx]
+            arrays[f"counts_{idx}"] = self._counts[idx]
+            arrays[f"first_seen_{idx}"] = self._first_seen[idx]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, np.ndarray]) -> "CooccurrenceIndex":
+        patterns = [
+            (int(a), int(b), str(label))
+            for (a, b), label in zip(arrays["patterns"].tolist(), arrays["pattern_labels"].tolist())
+        ]
+        index = cls(patterns)
+        index._skus = [str(sku) for sku in arrays["skus"].tolist()]
+        index._sku_codes = {sku: code for code, sku in enumerate(index._skus)}
+        index._order_ids = [str(order_id) for order_id in arrays["order_ids"].tolist()]
+        index._order_codes = {order_id: code for code, order_id in enumerate(index._order_ids)}
+        index._line_order = np.asarray(arrays["line_order"], dtype=np.int64)
+        index._line_sku = np.asarray(arrays["line_sku"], dtype=np.int64)
+        index._line_qty = np.asarray(arrays["line_qty"], dtype=np.int64)
+        index._keys = [np.asarray(arrays[f"keys_{idx}"], dtype=np.int64) for idx in range(len(patterns))]
+        index._counts = [np.asarray(arrays[f"counts_{idx}"], dtype=np.int64) for idx in range(len(patterns))]
+        index._first_seen = [np.asarray(arrays[f"first_seen_{idx}"], dtype=np.int64) for idx in range(len(patterns))]
+        index._next_seq = int(arrays["next_seq"])
+        if "forgotten_orders" in arrays:
+            index._forgotten_orders = int(arrays["forgotten_orders"])
+        return index
+
+    @property
+    def order_count(self) -> int:
+        return self._forgotten_orders + len(self._order_ids)
+
+    def forget_lines(self) -> None:
+        """
+        Drop the per-line arrays and the order id vocabulary, keeping only the pair
+        counts, so memory grows with the number of SKU pairs rather than with the
+        order history. Call it once the folded baskets are complete: lines that arrive
+        later for an order seen before are counted as a separate basket.
+        """
+        self._forgotten_orders += len(self._order_ids)
+        self._order_codes = {}
+        self._order_ids = []
+        self._line_order = np.empty(0, dtype=np.int64)
+        self._line_sku = np.empty(0, dtype=np.int64)
+        self._line_qty = np.empty(0, dtype=np.int64)
+
+    def update(self, orders: Iterable[Order]) -> None:
+        """Fold new order lines into the index."""
+        orders = list(orders)
+        if not orders:
+            return
+        self.update_arrays(
+            [str(o.order_id) for o in orders],
+            [str(o.product_sku) for o in orders],
+            [int(o.quantity) for o in orders],
+        )
+
+    def update_arrays(
+        self,
+        order_ids: Sequence[str],
+        skus: Sequence[str],
+        quantities: Sequence[int],
+    ) -> None:
+        """Columnar variant of update(): parallel sequences of order id, SKU and quantity."""
+        if len(order_ids) == 0:
+            return
+
+        known_orders = len(self._order_ids)
+        new_lines = pd.DataFrame(
+            {
+                "order": _encode(self._order_codes, self._order_ids, order_ids),
+                "sku": _encode(self._sku_codes, self._skus, skus),
+                "qty": np.asarray(quantities, dtype=np.int64),
+            }
+        )
+
+        # Baskets that already exist must be re-counted as a whole: retract their
+        # old pairs, merge the new lines in and count the merged basket again.
+        new_orders = new_lines["order"].to_numpy()
+        if new_orders.min() >= known_orders:
+            touched = np.zeros(len(self._line_order), dtype=bool)
+        else:
+            touched = np.isin(self._line_order, new_orders)
+        if touched.any():
+            old_lines = pd.DataFrame(
+                {
+                    "order": self._line_order[touched],
+                    "sku": self._line_sku[touched],
+                    "qty": self._line_qty[touched],
+                }
+            )
+            self._count_baskets(*self._grouped(old_lines), sign=-1)
+            new_lines = pd.concat([old_lines, new_lines], ignore_index=True)
+
+        order, sku, qty = self._grouped(new_lines)
+        self._count_baskets(order, sku, qty, sign=1)
+
+        keep = ~touched
+        self._line_order = np.concatenate((self._line_order[keep], order))
+        self._line_sku = np.concatenate((self._line_sku[keep], sku))
+        self._line_qty = np.concatenate((self._line_qty[keep], qty))
+
+    def pair_counts(
+        self,
+        min_occurrences: int = 1,
+        allowed_skus: Optional[Collection[str]] = None,
+    ) -> Iterator[Tuple[str, str, Pattern, int]]:
+        """
+        Yield (sku_a, sku_b, pattern, count) for every ordered pair that matched a
+        pattern at least `min_occurrences` times, in order of first occurrence.
+        When `allowed_skus` is given, pairs touching any other SKU are dropped
+        before they are materialized.
+        """
+        allowed: Optional[np.ndarray] = None
+        if allowed_skus is not None:
+            allowed = np.zeros(len(self._skus), dtype=bool)
+            codes = [self._sku_codes[sku] for sku in allowed_skus if sku in self._sku_codes]
+            allowed[np.asarray(codes, dtype=np.int64)] = True
+
+        pattern_idx, sku_a, sku_b, counts, first_seen = [], [], [], [], []
+        for idx in range(len(self.patterns)):
+            keys = self._keys[idx]
+            a_codes, b_codes = keys >> _SKU_BITS, keys & _SKU_MASK
+            mask = self._counts[idx] >= max(1, min_occurrences)
+            if allowed is not None:
+                mask &= allowed[a_codes] & allowed[b_codes]
+            sku_a.append(a_codes[mask])
+            sku_b.append(b_codes[mask])
+            counts.append(self._counts[idx][mask])
+            first_seen.append(self._first_seen[idx][mask])
+            pattern_idx.append(np.full(int(mask.sum()), idx, dtype=np.int64))
+
+        order = np.argsort(np.concatenate(first_seen), kind="stable")
+        if not len(order):
+            return
+
+        skus, patterns = self._skus, self.patterns
+        for a, b, idx, count in zip(
+            np.concatenate(sku_a)[order].tolist(),
+            np.concatenate(sku_b)[order].tolist(),
+            np.concatenate(pattern_idx)[order].tolist(),
+            np.concatenate(counts)[order].tolist(),
+        ):
+            yield skus[a], skus[b], patterns[idx], count
+
+    @staticmethod
+    def _grouped(lines: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sum quantities per (order, sku) and lay baskets out contiguously in first-seen order."""
+        agg = lines.groupby(["order", "sku"], sort=False)["qty"].sum().reset_index()
+        order = agg["order"].to_numpy(dtype=np.int64)
+        positions = np.argsort(order, kind="stable")
+        return (
+            order[positions],
+            agg["sku"].to_numpy(dtype=np.int64)[positions],
+            agg["qty"].to_numpy(dtype=np.int64)[positions],
+        )
+
+    def _count_baskets(self, order: np.ndarray, sku: np.ndarray, qty: np.ndarray, sign: int) -> None:
+        left, right = _basket_pairs(order)
+        if not len(left):
+            return
+
+        stride = 2 * len(self.patterns)
+        base = np.arange(len(left), dtype=np.int64) * stride + self._next_seq
+        if sign > 0:
+            self._next_seq += len(left) * stride
+
+        q_left, q_right = qty[left], qty[right]
+        forward = (sku[left] << _SKU_BITS) | sku[right]
+        reverse = (sku[right] << _SKU_BITS) | sku[left]
+
+        for idx, (a_qty, b_qty, _) in enumerate(self.patterns):
+            fwd_mask = (q_left >= a_qty) & (q_right >= b_qty)
+            rev_mask = (q_right >= a_qty) & (q_left >= b_qty)
+            keys = np.concatenate((forward[fwd_mask], reverse[rev_mask]))
+            if sign > 0:
+                seq = np.concatenate((base[fwd_mask] + 2 * idx, base[rev_mask] + 2 * idx + 1))
+            else:
+                seq = np.full(len(keys), _NO_SEQ, dtype=np.int64)
+            self._accumulate(idx, keys, seq, sign)
+
+    def _accumulate(self, idx: int, keys: np.ndarray, seq: np.ndarray, sign: int) -> None:
+        if not len(keys):
+            return
+        all_keys = np.concatenate((self._keys[idx], keys))
+        all_counts = np.concatenate((self._counts[idx], np.full(len(keys), sign, dtype=np.int64)))
+        all_seq = np.concatenate((self._first_seen[idx], seq))
+
+        uniq, inverse = np.unique(all_keys, return_inverse=True)
+        counts = np.zeros(len(uniq), dtype=np.int64)
+        np.add.at(counts, inverse, all_counts)
+        first_seen = np.full(len(uniq), _NO_SEQ, dtype=np.int64)
+        np.minimum.at(first_seen, inverse, all_seq)
+
+        # Retractions keep zero-count keys until the merged basket is re-counted,
+        # so pairs that survive the merge retain their original first occurrence.
+        keep = counts > 0 if sign > 0 else counts >= 0
+        self._keys[idx] = uniq[keep]
+        self._counts[idx] = counts[keep]
+        self._first_seen[idx] = first_seen[keep]
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+from itertools import combinations
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple
+
+DEFAULT_HALF_LIFE_DAYS = 30.0
+# Reference instant for stored weights (2025-01-01T00:00:00Z).
+DEMAND_EPOCH = 1735689600.0
+# Channel under which every order is also counted, for channel-agnostic reads.
+ALL_CHANNELS = "*"
+
+FeatureKey = Tuple[str, str, str]  # (channel, sku, other sku or "" for single-SKU demand)
+
+
+def pair_key(sku_a: str, sku_b: str) -> Tuple[str, str]:
+    return (sku_a, sku_b) if sku_a <= sku_b else (sku_b, sku_a)
+
+
+class DecayedDemand:
+    """
+    Exponentially decayed demand per channel, for single SKUs and SKU pairs.
+
+    A unit ordered at time t contributes 2 ** (-(now - t) / half_life) at `now`.
+    Weights are stored relative to DEMAND_EPOCH instead of `now`
+    (qty * 2 ** ((t - epoch) / half_life)), so adding an order is a plain
+    addition and never touches older entries; reading multiplies by a single
+    factor for `now`. With a 30 day half-life the stored weights grow ~4600x
+    per year, far from float overflow.
+
+    Every order is counted under its own channel and under ALL_CHANNELS, so
+    any read is a single dict lookup.
+
+    `weights` is the raw {(channel, sku, other): weight} map, suitable for
+    persisting as is.
+    """
+
+    def __init__(self, half_life_days: float = DEFAULT_HALF_LIFE_DAYS, weights: Optional[Dict[FeatureKey, float]] = None):
+        self.half_life = half_life_days * 86400.0
+        self.weights: Dict[FeatureKey, float] = defaultdict(float, weights or {})
+
+    def weight_at(self, quantity: float, at: float) -> float:
+        return quantity * math.pow(2.0, (at - DEMAND_EPOCH) / self.half_life)
+
+    def scale_at(self, now: float) -> float:
+        return math.pow(2.0, -(now - DEMAND_EPOCH) / self.half_life)
+
+    def add_basket(self, channel: str, items: Sequence[Tuple[str, float]], at: float) -> None:
+        """One order: units per SKU, plus one co-occurrence for every distinct SKU pair."""
+        for key, weight in self.basket_features(channel, items, at):
+            self.weights[key] += weight
+
+    def basket_features(
+        self, channel: str, items: Sequence[Tuple[str, float]], at: float
+    ) -> Iterator[Tuple[FeatureKey, float]]:
+        """The (key, weight) increments contributed by one order."""
+        units: Dict[str, float] = defaultdict(float)
+        for sku, quantity in items:
+            if sku:
+                units[sku] += quantity
+        one = self.weight_at(1.0, at)
+        for ch in {channel, ALL_CHANNELS}:
+            for sku, quantity in units.items():
+                yield (ch, sku, ""), quantity * one
+            for sku_a, sku_b in combinations(sorted(units), 2):
+                yield (ch, sku_a, sku_b), one
+
+    def line_features(
+        self, channel: str, sku: str, quantity: float, basket_skus: Iterable[str], at: float
+    ) -> Iterator[Tuple[FeatureKey, float]]:
+        """
+        Increments for one line added to an order that already holds `basket_skus`:
+        its units, plus the pairs it forms with SKUs not yet paired with it.
+        Adding an order line by line yields the same totals as add_basket.
+        """
+        if not sku:
+            return
+        others = set(basket_skus)
+        one = self.weight_at(1.0, at)
+        for ch in {channel, ALL_CHANNELS}:
+            yield (ch, sku, ""), quantity * one
+            if sku in others:
+                continue
+            for other in sorted(others):
+                if other:
+                    yield (ch, *pair_key(sku, other)), one
+
+    def sku(self, sku: str, now: float, channel: str = ALL_CHANNELS) -> float:
+        return self.weights.get((channel, sku, ""), 0.0) * self.scale_at(now)
+
+    def pair(self, sku_a: str, sku_b: str, now: float, channel: str = ALL_CHANNELS) -> float:
+        return self.weights.get((channel, *pair_key(sku_a, sku_b)), 0.0) * self.scale_at(now)
+
+    def sku_demand(self, now: float, channel: str = ALL_CHANNELS) -> "DemandView":
+        """Per-SKU decayed demand as a read-only mapping (O(1) lookups), e.g. for rank_bundles."""
+        weights = {sku: w for (ch, sku, other), w in self.weights.items() if ch == channel and not other}
+        return DemandView(weights, self.scale_at(now))
+
+
+class DemandView(Mapping[str, float]):
+    """Stored weights plus the decay factor for one instant; values are computed on lookup."""
+
+    def __init__(self, weights: Mapping[str, float], scale: float):
+        self._weights = weights
+        self._scale = scale
+
+    def __getitem__(self, sku: str) -> float:
+        return self._weights[sku] * self._scale
+
+    def get(self, sku: str, default: float = 0.0) -> float:
+        weight = self._weights.get(sku)
+        return default if weight is None else weight * self._scale
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._weights)
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
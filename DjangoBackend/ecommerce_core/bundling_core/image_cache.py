@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_SIDE = 1024
+DEFAULT_MAX_AGE = 24 * 3600
+
+
+@dataclass
+class CachedImageMeta:
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+
+
+class ImageCache:
+    """
+    Content-addressed on-disk cache for product photos.
+
+    Entries are keyed by sha256(url) and hold the decoded image, already
+    downscaled to `max_side`, as PNG plus a small JSON sidecar with the
+    validators (ETag / Last-Modified) needed for conditional requests.
+    Entries younger than `max_age` seconds are served without touching the
+    network; older ones are revalidated by the caller. Total size is capped at
+    `max_bytes`, evicting least recently used entries first (file mtime is
+    refreshed on every hit).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_side: int = DEFAULT_MAX_SIDE,
+        max_age: float = DEFAULT_MAX_AGE,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return f"{base}.png", f"{base}.json"
+
+    def lookup(self, url: str) -> Tuple[Optional[Image.Image], Optional[CachedImageMeta]]:
+        """Return the cached image and its metadata, or (None, None) on a miss."""
+        image_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as fh:
+                meta = CachedImageMeta(**json.load(fh))
+            with Image.open(image_path) as img:
+                image = img.convert("RGBA")
+        except (OSError, ValueError, TypeError):
+            return None, None
+        if meta.url != url:
+            return None, None
+        self._touch(image_path)
+        return image, meta
+
+    def is_fresh(self, meta: CachedImageMeta) -> bool:
+        return time.time() - meta.fetched_at < self.max_age
+
+    def store(self, url: str, image: Image.Image, etag: Optional[str], last_modified: Optional[str]) -> Image.Image:
+        """Downscale, persist and return the image that callers should use."""
+        image = image.convert("RGBA")
+        if max(image.size) > self.max_side:
+            image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+
+        image_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(image_path), exist_ok=True)
+        meta = CachedImageMeta(url=url, etag=etag, last_modified=last_modified, fetched_at=time.time())
+        try:
+            self._atomic_write(image_path, lambda fh: image.save(fh, "PNG", compress_level=1))
+            self._atomic_write(meta_path, lambda fh: fh.write(json.dumps(asdict(meta)).encode("utf-8")))
+        except OSError as exc:
+            print(f"[images] could not cache {url}: {exc}")
+        return image
+
+    def refresh(self, url: str, meta: CachedImageMeta) -> None:
+        """Mark an entry as revalidated (the server answered 304 Not Modified)."""
+        _, meta_path = self._paths(url)
+        meta.fetched_at = time.time()
+        try:
+            self._atomic_write(meta_path, lambda fh: fh.write(json.dumps(asdict(meta)).encode("utf-8")))
+        except OSError:
+            pass
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits in max_bytes. Returns bytes freed."""
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".png"):
+                        continue
+                    path = os.path.join(root, name)
+                    meta_path = path[: -len(".png")] + ".json"
+                    try:
+                        size = os.path.getsize(path)
+                        if os.path.exists(meta_path):
+                            size += os.path.getsize(meta_path)
+                        mtime = os.path.getmtime(path)
+                    except OSError:
+                        continue
+                    entries.append((mtime, size, path, meta_path))
+                    total += size
+
+            freed = 0
+            entries.sort()
+            for _, size, path, meta_path in entries:
+                if total - freed <= self.max_bytes:
+                    break
+                for stale in (path, meta_path):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                freed += size
+            return freed
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _atomic_write(path: str, write) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                write(fh)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
@@ -1,18 +1,27 @@
 from __future__ import annotations
 
+import hashlib
+import multiprocessing
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from io import BytesIO
-from typing import Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import cloudinary
 import cloudinary.uploader
 import requests
 from PIL import Image, ImageDraw, ImageFont
+from requests.adapters import HTTPAdapter
 
+from .image_cache import ImageCache
 from .models import Bundle, CloudinaryConfig, CollageConfig, Product
 
+DEFAULT_DOWNLOAD_WORKERS = 8
 
+
+@lru_cache(maxsize=32)
 def _font(path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
     try:
         if path and os.path.exists(path):
@@ -22,23 +31,109 @@ def _font(path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
     return ImageFont.load_default()
 
 
-def download_product_image(product: Product, timeout: int = 20) -> Optional[Image.Image]:
+def _http_session(pool_size: int = DEFAULT_DOWNLOAD_WORKERS) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _fetch_image(
+    url: str,
+    sku: str,
+    session: requests.Session,
+    timeout: int,
+    cache: Optional[ImageCache],
+) -> Optional[Image.Image]:
+    cached, meta = cache.lookup(url) if cache else (None, None)
+    if cached is not None and cache.is_fresh(meta):
+        return cached
+
+    headers = {}
+    if meta is not None:
+        if meta.etag:
+            headers["If-None-Match"] = meta.etag
+        if meta.last_modified:
+            headers["If-Modified-Since"] = meta.last_modified
+
+    try:
+        response = session.get(url, timeout=timeout, headers=headers)
+    except requests.RequestException:
+        if cached is None:
+            raise
+        print(f"[images] revalidation failed for SKU {sku}, using cached copy")
+        return cached
+    if response.status_code == 304 and cached is not None:
+        cache.refresh(url, meta)
+        return cached
+    response.raise_for_status()
+    content_type = response.headers.get("content-type", "").lower()
+    if "image" not in content_type:
+        print(f"[images] non-image content-type for SKU {sku}: {content_type}")
+        return None
+
+    image = Image.open(BytesIO(response.content)).convert("RGBA")
+    if cache is None:
+        return image
+    return cache.store(url, image, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+def download_product_image(
+    product: Product,
+    timeout: int = 20,
+    session: Optional[requests.Session] = None,
+    cache: Optional[ImageCache] = None,
+) -> Optional[Image.Image]:
     if not product.image_url:
         print(f"[images] no image_url for SKU {product.sku}")
         return None
     try:
-        response = requests.get(product.image_url, timeout=timeout)
-        response.raise_for_status()
-        content_type = response.headers.get("content-type", "").lower()
-        if "image" not in content_type:
-            print(f"[images] non-image content-type for SKU {product.sku}: {content_type}")
-            return None
-        return Image.open(BytesIO(response.content)).convert("RGBA")
+        return _fetch_image(product.image_url, product.sku, session or requests, timeout, cache)
     except Exception as exc:
         print(f"[images] failed to download SKU {product.sku}: {exc}")
         return None
 
 
+def download_product_images(
+    products: Iterable[Product],
+    cache: Optional[ImageCache] = None,
+    max_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+    timeout: int = 20,
+) -> Dict[str, Image.Image]:
+    """
+    Download images for many products on a bounded thread pool sharing one pooled
+    HTTP session. Each distinct URL is fetched once; SKUs whose download fails
+    are left out of the result, like download_product_image returning None.
+    """
+    by_url: Dict[str, List[Product]] = {}
+    for product in products:
+        if not product.image_url:
+            print(f"[images] no image_url for SKU {product.sku}")
+            continue
+        by_url.setdefault(product.image_url, []).append(product)
+    if not by_url:
+        return {}
+
+    images: Dict[str, Image.Image] = {}
+    workers = max(1, min(max_workers, len(by_url)))
+    with _http_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(download_product_image, group[0], timeout, session, cache): group
+            for group in by_url.values()
+        }
+        for future in as_completed(futures):
+            image = future.result()
+            if image is None:
+                continue
+            for product in futures[future]:
+                images[product.sku] = image
+
+    if cache is not None:
+        cache.evict()
+    return images
+
+
 def _placeholder(product: Product, size: tuple[int, int] = (600, 600)) -> Image.Image:
     img = Image.new("RGB", size, (240, 240, 240))
     draw = ImageDraw.Draw(img)
@@ -57,37 +152,61 @@ def _resize_keep_ratio(img: Image.Image, max_w: int, max_h: int) -> Image.Image:
     return img.resize(new_size, Image.Resampling.LANCZOS)
 
 
+TileCache = Dict[Tuple[str, int, int], Image.Image]
+
+
+def _tile(
+    product: Product,
+    product_images: Dict[str, Image.Image],
+    max_w: int,
+    max_h: int,
+    tile_cache: TileCache,
+    bundle_sku: str,
+) -> Image.Image:
+    key = (product.sku, max_w, max_h)
+    tile = tile_cache.get(key)
+    if tile is None:
+        img = product_images.get(product.sku)
+        if img is None:
+            print(f"[images] using placeholder for SKU {product.sku} in bundle {bundle_sku}")
+            img = _placeholder(product)
+        tile = _resize_keep_ratio(img, max_w, max_h)
+        tile_cache[key] = tile
+    return tile
+
+
 def generate_collage(
     bundle: Bundle,
     product_images: Dict[str, Image.Image],
     collage_cfg: CollageConfig,
     output_dir: str,
+    tile_cache: Optional[TileCache] = None,
 ) -> str:
+    """
+    Render the bundle collage as a JPEG in output_dir and return its path.
+    Resized tiles are memoized per (sku, cell size) in `tile_cache`; pass the
+    same dict across calls to reuse them between bundles.
+    """
     os.makedirs(output_dir, exist_ok=True)
+    if tile_cache is None:
+        tile_cache = {}
 
     canvas = Image.new("RGB", (collage_cfg.width, collage_cfg.height), collage_cfg.background_color)
     text_band_height = int(collage_cfg.height * collage_cfg.text_band_ratio)
     product_area_height = collage_cfg.height - text_band_height
     draw = ImageDraw.Draw(canvas)
 
-    # Prepare product tiles
-    tiles = []
-    for item in bundle.items:
-        for _ in range(item.quantity):
-            img = product_images.get(item.product.sku)
-            if img is None:
-                print(f"[images] using placeholder for SKU {item.product.sku} in bundle {bundle.sku}")
-                img = _placeholder(item.product)
-            tiles.append(img)
-
-    cols = max(1, int(len(tiles) ** 0.5))
-    rows = max(1, (len(tiles) + cols - 1) // cols)
+    # Prepare product tiles (one entry per unit of quantity)
+    tile_products = [item.product for item in bundle.items for _ in range(item.quantity)]
+
+    cols = max(1, int(len(tile_products) ** 0.5))
+    rows = max(1, (len(tile_products) + cols - 1) // cols)
     cell_w = collage_cfg.width // cols
     cell_h = product_area_height // rows
 
-    for idx, img in enumerate(tiles):
+    for idx, product in enumerate(tile_products):
         r, c = divmod(idx, cols)
-        resized = _resize_keep_ratio(img, cell_w - 12, cell_h - 12)
+        resized = _tile(product, product_images, cell_w - 12, cell_h - 12, tile_cache, bundle.sku)
         x = c * cell_w + (cell_w - resized.width) // 2
         y = r * cell_h + (cell_h - resized.height) // 2
         canvas.paste(resized, (x, y), mask=resized if resized.mode == "RGBA" else None)
@@ -111,22 +230,109 @@ def generate_collage(
     return output_path
 
 
+# Per-process tile cache used by render_collages workers.
+_worker_tiles: TileCache = {}
+
+
+def _render_in_worker(
+    bundle: Bundle,
+    product_images: Dict[str, Image.Image],
+    collage_cfg: CollageConfig,
+    output_dir: str,
+) -> str:
+    return generate_collage(bundle, product_images, collage_cfg, output_dir, tile_cache=_worker_tiles)
+
+
+def _can_fork_workers() -> bool:
+    # Celery prefork children are daemonic and may not start their own processes.
+    return not multiprocessing.current_process().daemon
+
+
+def render_collages(
+    bundles: Sequence[Bundle],
+    product_images: Dict[str, Image.Image],
+    collage_cfg: CollageConfig,
+    output_dir: str,
+    max_workers: Optional[int] = None,
+) -> Iterator[Tuple[int, Optional[str]]]:
+    """
+    Render collages for many bundles and yield (bundle index, jpeg path) as each
+    one finishes, so uploads can start before the whole batch is done. The path
+    is None when rendering failed. Work is spread over a process pool sized to
+    the available cores; with a single core (or inside a daemonic worker) the
+    bundles are rendered in-process with a shared tile cache.
+    """
+    # One sub-directory per bundle: two bundles sharing a SKU must not overwrite
+    # each other's file before it is uploaded.
+    targets = [os.path.join(output_dir, str(idx)) for idx in range(len(bundles))]
+    workers = min(max_workers or os.cpu_count() or 1, len(bundles))
+    if workers <= 1 or not _can_fork_workers():
+        tile_cache: TileCache = {}
+        for idx, bundle in enumerate(bundles):
+            try:
+                yield idx, generate_collage(bundle, product_images, collage_cfg, targets[idx], tile_cache)
+            except Exception as exc:
+                print(f"[images] collage failed for bundle {bundle.sku}: {exc}")
+                yield idx, None
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for idx, bundle in enumerate(bundles):
+            # Ship only the images this bundle needs to the worker.
+            needed = {
+                item.product.sku: product_images[item.product.sku]
+                for item in bundle.items
+                if item.product.sku in product_images
+            }
+            futures[pool.submit(_render_in_worker, bundle, needed, collage_cfg, targets[idx])] = idx
+        for future in as_completed(futures):
+            idx = futures[future]
+            try:
+                yield idx, future.result()
+            except Exception as exc:
+                print(f"[images] collage failed for bundle {bundles[idx].sku}: {exc}")
+                yield idx, None
+
+
+_configured_credentials: Optional[Tuple[str, str, str]] = None
+
+
 def configure_cloudinary(cfg: CloudinaryConfig) -> None:
-    if cfg.is_configured:
+    global _configured_credentials
+    if not cfg.is_configured:
+        return
+    credentials = (cfg.cloud_name, cfg.api_key, cfg.api_secret)
+    if credentials != _configured_credentials:
         cloudinary.config(cloud_name=cfg.cloud_name, api_key=cfg.api_key, api_secret=cfg.api_secret)
+        _configured_credentials = credentials
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def upload_to_cloudinary(image_path: str, cfg: CloudinaryConfig) -> Optional[str]:
+def upload_to_cloudinary(image_path: str, cfg: CloudinaryConfig, digest: Optional[str] = None) -> Optional[str]:
+    """
+    Upload under the sha256 of the file (`digest`, computed when not given) and never
+    overwrite: a URL always serves the bytes it was created for, so it can be reused
+    for identical content (see uploads.UploadIndex). Re-uploading the same content
+    returns the existing asset.
+    """
     if not cfg.is_configured:
         return None
     configure_cloudinary(cfg)
-    public_id = os.path.splitext(os.path.basename(image_path))[0]
+    public_id = digest or file_digest(image_path)
     try:
         response = cloudinary.uploader.upload(
             image_path,
             folder=cfg.folder,
             public_id=public_id,
-            overwrite=True,
+            overwrite=False,
         )
         return response.get("secure_url")
     except Exception as exc:
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import glob
+import hashlib
+import importlib.util
 import os
+import re
+from dataclasses import fields
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Callable, Iterable, List, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -16,6 +22,33 @@ def load_environment(dotenv_path: str = ".env") -> None:
         load_dotenv(dotenv_path)
 
 
+PRODUCT_COLUMNS = (
+    "sku",
+    "name",
+    "brand",
+    "category",
+    "price_with_vat",
+    "vat_rate",
+    "available_stock",
+    "bundle_enabled",
+    "fragrance",
+    "volume_qty",
+    "volume_unit",
+    "units_per_pack",
+    "image_url",
+    "image",
+    "description",
+    "site_description",
+)
+ORDER_COLUMNS = ("order_id", "product_sku", "quantity", "channel")
+
+_PRODUCT_FIELDS = [f.name for f in fields(Product)]
+_ORDER_FIELDS = [f.name for f in fields(Order)]
+
+_TRUE_VALUES = {"1", "true", "t", "yes", "y"}
+_CACHE_DIRNAME = ".bundling_cache"
+
+
 def _bool_value(value: object, default: bool = True) -> bool:
     if value is None or (isinstance(value, float) and pd.isna(value)):
         return default
@@ -24,81 +57,178 @@ def _bool_value(value: object, default: bool = True) -> bool:
     if isinstance(value, (int, float)):
         return bool(value)
     value_str = str(value).strip().lower()
-    return value_str in {"1", "true", "t", "yes", "y"}
+    return value_str in _TRUE_VALUES
 
 
-def _safe_float(value: object, default: Optional[float] = 0.0) -> Optional[float]:
-    try:
-        if pd.isna(value):  # type: ignore[attr-defined]
-            return default
-        return float(value)
-    except Exception:
-        return default
+def _read_sheet(excel_path: str, sheet_name: str, columns: Sequence[str]) -> pd.DataFrame:
+    """Read only the wanted columns (matched case/space-insensitively) of one sheet."""
+    wanted = set(columns)
+    df = pd.read_excel(
+        excel_path,
+        sheet_name=sheet_name,
+        engine="openpyxl",
+        usecols=lambda c: str(c).strip().lower() in wanted,
+    )
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+def _column(df: pd.DataFrame, name: str, default: object = None) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """str() semantics per cell, as the row-by-row loader had (empty cells become "nan")."""
+    return series.astype(object).where(series.notna(), "nan").astype(str)
+
+
+def _optional(series: pd.Series) -> pd.Series:
+    return series.astype(object).where(series.notna(), None)
+
+
+def _optional_text(series: pd.Series) -> pd.Series:
+    return _optional(series.astype(object).where(series.isna(), series.astype(str)))
+
+
+def _float(series: pd.Series, default: Optional[float] = 0.0) -> pd.Series:
+    values = pd.to_numeric(series, errors="coerce")
+    if default is None:
+        return _optional(values)
+    return values.fillna(default).astype(float)
+
+
+def _int(series: pd.Series, default: Optional[int] = 0) -> pd.Series:
+    values = np.trunc(pd.to_numeric(series, errors="coerce").astype(float))
+    if default is None:
+        # Nullable Int64, not object: Parquet would store ints mixed with None as float64
+        return values.astype("Int64")
+    return values.fillna(default).astype(np.int64)
+
 
+def _bool(series: pd.Series, default: bool = True) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return (series.fillna(0) != 0).where(series.notna(), default).astype(bool)
+    return series.map(lambda v: _bool_value(v, default=default)).astype(bool)
 
-def _safe_int(value: object, default: Optional[int] = 0) -> Optional[int]:
+
+def _first_present(primary: pd.Series, fallback: pd.Series) -> pd.Series:
+    primary = _optional_text(primary)
+    return _optional_text(primary.where(primary.notna() & (primary != ""), fallback))
+
+
+def _products_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert a raw products sheet to typed columns named after the Product fields."""
+    category = _text(_column(df, "category", "")).str.strip()
+    return pd.DataFrame(
+        {
+            "sku": _text(_column(df, "sku")),
+            "name": _text(_column(df, "name", "")).str.strip(),
+            "brand": _text(_column(df, "brand", "")).str.strip(),
+            "category": category.where(category != "", "Uncategorized"),
+            "price_with_vat": _float(_column(df, "price_with_vat")),
+            "vat_rate": _float(_column(df, "vat_rate"), default=21.0),
+            "available_stock": _int(_column(df, "available_stock")),
+            "bundle_enabled": _bool(_column(df, "bundle_enabled"), default=True),
+            "fragrance": _optional_text(_column(df, "fragrance")),
+            "volume_qty": _float(_column(df, "volume_qty"), default=None),
+            "volume_unit": _optional_text(_column(df, "volume_unit")),
+            "units_per_pack": _int(_column(df, "units_per_pack"), default=None),
+            "image_url": _first_present(_column(df, "image_url"), _column(df, "image")),
+            "description": _first_present(_column(df, "description"), _column(df, "site_description")),
+        }
+    )
+
+
+def _orders_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert a raw orders sheet to typed columns named after the Order fields."""
+    return pd.DataFrame(
+        {
+            "order_id": _text(_column(df, "order_id")),
+            "product_sku": _text(_column(df, "product_sku")),
+            "quantity": _int(_column(df, "quantity"), default=1),
+            "channel": _text(_column(df, "channel", "UNKNOWN")).str.strip(),
+        }
+    )
+
+
+def _cache_path(excel_path: str, sheet_name: str, cache_dir: Optional[str]) -> Path:
+    """Sidecar cache file name keyed on the workbook's mtime and content hash."""
+    source = Path(excel_path)
+    digest = hashlib.sha256()
+    with open(source, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    mtime_ns = source.stat().st_mtime_ns
+    directory = Path(cache_dir) if cache_dir else source.parent / _CACHE_DIRNAME
+    safe_sheet = re.sub(r"[^A-Za-z0-9._-]+", "_", sheet_name)
+    return directory / f"{source.stem}.{safe_sheet}.{mtime_ns}-{digest.hexdigest()[:16]}.parquet"
+
+
+def _load_frame(
+    excel_path: str,
+    sheet_name: str,
+    columns: Sequence[str],
+    convert: Callable[[pd.DataFrame], pd.DataFrame],
+    use_cache: bool,
+    cache_dir: Optional[str],
+) -> pd.DataFrame:
+    """
+    Read and convert a sheet, going through the Parquet sidecar cache when enabled.
+    The cache is skipped silently when no Parquet engine (pyarrow) is installed.
+    """
+    if not use_cache or importlib.util.find_spec("pyarrow") is None:
+        return convert(_read_sheet(excel_path, sheet_name, columns))
+
+    cache_file = _cache_path(excel_path, sheet_name, cache_dir)
+    if cache_file.exists():
+        try:
+            return pd.read_parquet(cache_file)
+        except Exception as exc:
+            print(f"[io] ignoring unreadable cache {cache_file}: {exc}")
+
+    frame = convert(_read_sheet(excel_path, sheet_name, columns))
     try:
-        if pd.isna(value):  # type: ignore[attr-defined]
-            return default
-        return int(value)
-    except Exception:
-        return default
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # Drop entries for older versions of the same workbook/sheet.
+        prefix = cache_file.name.rsplit(".", 2)[0]
+        for stale in cache_file.parent.glob(f"{glob.escape(prefix)}.*.parquet"):
+            stale.unlink(missing_ok=True)
+        frame.to_parquet(cache_file, index=False)
+    except Exception as exc:
+        print(f"[io] could not write cache {cache_file}: {exc}")
+    return frame
 
 
-def read_products(excel_path: str, sheet_name: str = "products") -> List[Product]:
-    """Read products from Excel into strongly typed objects."""
-    df = pd.read_excel(excel_path, sheet_name=sheet_name, engine="openpyxl")
-    df.columns = [c.strip().lower() for c in df.columns]
-
-    products: List[Product] = []
-    for _, row in df.iterrows():
-        desc = row.get("description")
-        if pd.isna(desc):
-            desc = None
-        site_desc = row.get("site_description")
-        if pd.isna(site_desc):
-            site_desc = None
-        final_desc = desc or site_desc
-
-        product = Product(
-            sku=str(row.get("sku")),
-            name=str(row.get("name", "")).strip(),
-            brand=str(row.get("brand", "")).strip(),
-            category=str(row.get("category", "")).strip() or "Uncategorized",
-            price_with_vat=_safe_float(row.get("price_with_vat")),
-            vat_rate=_safe_float(row.get("vat_rate"), default=21.0),
-            available_stock=_safe_int(row.get("available_stock")),
-            bundle_enabled=_bool_value(row.get("bundle_enabled"), default=True),
-            fragrance=row.get("fragrance"),
-            volume_qty=_safe_float(row.get("volume_qty"), default=None)  # type: ignore[arg-type]
-            if not pd.isna(row.get("volume_qty"))
-            else None,
-            volume_unit=row.get("volume_unit"),
-            units_per_pack=_safe_int(row.get("units_per_pack"), default=None)  # type: ignore[arg-type]
-            if not pd.isna(row.get("units_per_pack"))
-            else None,
-            image_url=row.get("image_url") or row.get("image"),
-            description=final_desc,
-        )
-        products.append(product)
-    return products
-
-
-def read_orders(excel_path: str, sheet_name: str = "orders") -> List[Order]:
-    df = pd.read_excel(excel_path, sheet_name=sheet_name, engine="openpyxl")
-    df.columns = [c.strip().lower() for c in df.columns]
-
-    orders: List[Order] = []
-    for _, row in df.iterrows():
-        orders.append(
-            Order(
-                order_id=str(row.get("order_id")),
-                product_sku=str(row.get("product_sku")),
-                quantity=_safe_int(row.get("quantity"), default=1),
-                channel=str(row.get("channel", "UNKNOWN")).strip(),
-            )
-        )
-    return orders
+def _records(frame: pd.DataFrame, columns: Sequence[str]) -> Iterable[tuple]:
+    """Row tuples zipped from whole columns, with missing values normalized to None."""
+    return zip(*(_optional(frame[c]).tolist() for c in columns))
+
+
+def read_products(
+    excel_path: str,
+    sheet_name: str = "products",
+    use_cache: bool = False,
+    cache_dir: Optional[str] = None,
+) -> List[Product]:
+    """
+    Read products from Excel into strongly typed objects.
+    Only the product columns are parsed; with `use_cache` the converted columns are
+    kept in a Parquet sidecar (default: `.bundling_cache` next to the workbook).
+    """
+    frame = _load_frame(excel_path, sheet_name, PRODUCT_COLUMNS, _products_frame, use_cache, cache_dir)
+    return [Product(*record) for record in _records(frame, _PRODUCT_FIELDS)]
+
+
+def read_orders(
+    excel_path: str,
+    sheet_name: str = "orders",
+    use_cache: bool = False,
+    cache_dir: Optional[str] = None,
+) -> List[Order]:
+    frame = _load_frame(excel_path, sheet_name, ORDER_COLUMNS, _orders_frame, use_cache, cache_dir)
+    return [Order(*record) for record in _records(frame, _ORDER_FIELDS)]
 
 
 def write_catalog(bundles: Iterable, output_path: str) -> None:
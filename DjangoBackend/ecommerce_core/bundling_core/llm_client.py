@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import threading
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Protocol
 
 import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+LLM_POOL_SIZE = 8
 
 
 @dataclass
@@ -15,6 +21,42 @@ class LLMConfig:
     temperature: float = 0.3
 
 
+class ResponseCache(Protocol):
+    """Prompt hash -> parsed JSON response, with a per-entry TTL in seconds."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]: ...
+
+    def set(self, key: str, value: Dict[str, Any], ttl: int) -> None: ...
+
+
+DEFAULT_RESPONSE_TTL = 7 * 24 * 3600
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _http_session() -> requests.Session:
+    """One keep-alive session per process, shared by all (possibly concurrent) LLM calls."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def prompt_cache_key(prompt: str, cfg: LLMConfig, system_prompt: Optional[str]) -> str:
+    payload = json.dumps(
+        [cfg.provider, cfg.model, cfg.temperature, system_prompt, prompt],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def _call_openrouter_json(
     prompt: str,
     cfg: LLMConfig,
@@ -41,8 +83,8 @@ def _call_openrouter_json(
         "temperature": cfg.temperature,
     }
 
-    resp = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
+    resp = _http_session().post(
+        os.getenv("OPENROUTER_URL", DEFAULT_OPENROUTER_URL),
         json=data,
         headers=headers,
         timeout=30,
@@ -64,11 +106,34 @@ def call_llm_json(
     prompt: str,
     cfg: Optional[LLMConfig] = None,
     system_prompt: Optional[str] = None,
+    cache: Optional[ResponseCache] = None,
+    cache_ttl: int = DEFAULT_RESPONSE_TTL,
+    cache_if: Optional[Callable[[Dict[str, Any]], bool]] = None,
 ) -> Dict[str, Any]:
+    """
+    Call the configured provider and return its JSON reply ({} on failure).
+    With a `cache`, replies are stored under a hash of model, temperature and
+    prompts for `cache_ttl` seconds; failures are never cached, and neither are
+    replies rejected by `cache_if`, so a retry of a malformed answer reaches the
+    provider again instead of replaying it.
+    """
     cfg = cfg or load_llm_config()
     if cfg.provider == "openrouter":
+        key = prompt_cache_key(prompt, cfg, system_prompt) if cache is not None else None
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
         try:
-            return _call_openrouter_json(prompt, cfg, system_prompt)
+            result = _call_openrouter_json(prompt, cfg, system_prompt)
+            if (
+                key is not None
+                and isinstance(result, dict)
+                and result
+                and (cache_if is None or cache_if(result))
+            ):
+                cache.set(key, result, cache_ttl)
+            return result
         except requests.HTTPError as exc:
             print(f"[llm] HTTP error: {exc}")
             return {}
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 from collections import Counter, defaultdict
-from itertools import combinations_with_replacement
-from typing import Dict, Iterable, List, Optional, Tuple
+from heapq import heappop, heappush
+from itertools import accumulate, count
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
+import numpy as np
+
+from .cooccurrence import CooccurrenceIndex
 from .models import (
     Bundle,
     BundleConfig,
@@ -12,6 +16,12 @@ from .models import (
     PricingConfig,
     Product,
 )
+from .product_index import ProductIndex
+
+# (brand, items, pattern label) awaiting the vectorized price/stock pass.
+Candidate = Tuple[str, List[BundleItem], Optional[str]]
+
+_EVAL_CHUNK_SIZE = 512
 
 
 def _bundle_key(items: List[BundleItem]) -> Tuple[Tuple[str, int], ...]:
@@ -51,30 +61,21 @@ def _is_compatible(items: List[BundleItem]) -> bool:
 def compute_max_bundle_stock(
     component_skus: List[str],
     component_quantities: List[int],
-    products: List[Product],
+    products: Union[Sequence[Product], ProductIndex],
 ) -> int:
     """
     Compute how many bundles can be produced given available stock per component.
     Returns 0 if any component is missing or insufficient.
+    Pass a prebuilt ProductIndex to avoid re-indexing the catalog on every call.
     """
     if len(component_skus) != len(component_quantities):
         return 0
 
-    product_by_sku: Dict[str, Product] = {p.sku: p for p in products}
-    max_bundles = float("inf")
-
-    for sku, qty in zip(component_skus, component_quantities):
-        if qty <= 0:
-            return 0
-        product = product_by_sku.get(sku)
-        if not product:
-            return 0
-        stock = product.available_stock if product.available_stock is not None else 0
-        if stock < qty:
-            return 0
-        max_bundles = min(max_bundles, stock // qty)
-
-    return 0 if max_bundles == float("inf") else int(max_bundles)
+    index = products if isinstance(products, ProductIndex) else ProductIndex(products)
+    rows = np.array([[index.row_by_sku.get(sku, -1) for sku in component_skus]], dtype=np.int64)
+    quantities = np.array([component_quantities], dtype=np.int64).reshape(1, len(component_skus))
+    widths = np.array([len(component_skus)], dtype=np.int64)
+    return int(index.max_bundle_stock(rows, quantities, widths)[0])
 
 
 def _can_support_quantities(product: Product, qty: int) -> bool:
@@ -83,52 +84,110 @@ def _can_support_quantities(product: Product, qty: int) -> bool:
     return product.available_stock >= qty
 
 
-def _create_bundle(
-    brand: str,
-    items: List[BundleItem],
+def _chunked(iterable: Iterable[Candidate], size: int) -> Iterator[List[Candidate]]:
+    chunk: List[Candidate] = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _create_bundles(
+    candidates: Sequence[Candidate],
     pricing: PricingConfig,
     bundle_config: BundleConfig,
-    all_products: List[Product],
-) -> Optional[Bundle]:
-    base_price = sum(item.product.price_with_vat * item.quantity for item in items)
-    final_price = pricing.final_price_for_base(base_price)
-    if final_price < pricing.min_price:
-        return None
-
-    title = _build_title(brand, items)
-    sku = _build_sku(items)
-    category = (
-        items[0].product.category
-        if len({i.product.sku for i in items}) == 1
-        else f"{items[0].product.category} Mix"
-    )
-    description = _build_description(items, brand)
-
-    total_units = sum(item.quantity * (item.product.units_per_pack or 1) for item in items)
-    if total_units > bundle_config.max_total_units:
-        return None
-    vat_rate = items[0].product.vat_rate if items else 0
-
-    component_skus = [item.product.sku for item in items]
-    component_quantities = [item.quantity for item in items]
-    max_bundle_stock = compute_max_bundle_stock(component_skus, component_quantities, all_products)
-    if max_bundle_stock <= 0:
-        return None
-
-    return Bundle(
-        sku=sku,
-        title=title,
-        brand=brand,
-        category=category,
-        items=items,
-        base_price=round(base_price, 2),
-        final_price=final_price,
-        vat_rate=vat_rate,
-        total_units=total_units,
-        max_bundle_stock=max_bundle_stock,
-        description=description,
+    index: ProductIndex,
+) -> List[Optional[Bundle]]:
+    """
+    Price and stock-check a batch of candidates in one vectorized pass.
+    Returns a list aligned with `candidates`, with None for rejected ones.
+    """
+    if not candidates:
+        return []
+
+    item_lists = [items for _, items, _ in candidates]
+    rows, quantities = index.component_matrix(item_lists)
+    widths = np.fromiter((len(items) for items in item_lists), dtype=np.int64, count=len(item_lists))
+    known = rows >= 0
+    safe_rows = np.where(known, rows, 0)
+
+    # Accumulate column by column to keep the same summation order as sum().
+    base_prices = np.zeros(len(candidates), dtype=np.float64)
+    total_units = np.zeros(len(candidates), dtype=np.int64)
+    for col in range(rows.shape[1]):
+        base_prices = base_prices + np.where(known[:, col], index.price[safe_rows[:, col]], 0.0) * quantities[:, col]
+        total_units += quantities[:, col] * np.where(known[:, col], index.units_per_pack[safe_rows[:, col]], 1)
+
+    final_prices = pricing.final_prices_for_base(base_prices)
+    max_stock = index.max_bundle_stock(rows, quantities, widths)
+    feasible = (
+        (final_prices >= pricing.min_price)
+        & (total_units <= bundle_config.max_total_units)
+        & (max_stock > 0)
     )
 
+    bundles: List[Optional[Bundle]] = []
+    for pos, (brand, items, label) in enumerate(candidates):
+        if not feasible[pos]:
+            bundles.append(None)
+            continue
+        title = _build_title(brand, items)
+        if label:
+            title = f"{title} ({label})"
+        category = (
+            items[0].product.category
+            if len({i.product.sku for i in items}) == 1
+            else f"{items[0].product.category} Mix"
+        )
+        bundles.append(
+            Bundle(
+                sku=_build_sku(items),
+                title=title,
+                brand=brand,
+                category=category,
+                items=items,
+                base_price=round(float(base_prices[pos]), 2),
+                final_price=float(final_prices[pos]),
+                vat_rate=items[0].product.vat_rate if items else 0,
+                total_units=int(total_units[pos]),
+                max_bundle_stock=int(max_stock[pos]),
+                description=_build_description(items, brand),
+            )
+        )
+    return bundles
+
+
+def _accept_candidates(
+    candidates: Iterable[Candidate],
+    pricing: PricingConfig,
+    bundle_config: BundleConfig,
+    index: ProductIndex,
+    seen_keys: set,
+    limit: Optional[int] = None,
+) -> List[Bundle]:
+    """
+    Evaluate candidates chunk by chunk and keep the feasible ones in order,
+    skipping bundle keys already in `seen_keys` and stopping at `limit`.
+    """
+    accepted: List[Bundle] = []
+    if limit is not None and limit <= 0:
+        return accepted
+    for chunk in _chunked(candidates, _EVAL_CHUNK_SIZE):
+        for (_, items, _), bundle in zip(chunk, _create_bundles(chunk, pricing, bundle_config, index)):
+            if bundle is None:
+                continue
+            key = _bundle_key(items)
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            accepted.append(bundle)
+            if limit is not None and len(accepted) >= limit:
+                return accepted
+    return accepted
+
 
 def _eligible_products(products: Iterable[Product]) -> List[Product]:
     eligible = []
@@ -158,68 +217,52 @@ def _pattern_candidates_from_orders(
     orders: List[Order],
     bundle_config: BundleConfig,
     pricing: PricingConfig,
+    cooccurrence: Optional[CooccurrenceIndex] = None,
+    index: Optional[ProductIndex] = None,
 ) -> List[Bundle]:
     """Generate candidates from co-occurrence patterns (1+1, 2+1, 3+2) grounded in orders."""
     product_by_sku: Dict[str, Product] = {p.sku: p for p in _eligible_products(products)}
-    tx = build_transactions_from_orders(orders)
-    patterns = [
-        (1, 1, "1+1"),
-        (2, 1, "2+1"),
-        (3, 2, "3+2"),
-    ]
+    if cooccurrence is None:
+        cooccurrence = CooccurrenceIndex.from_orders(orders)
+    if index is None:
+        index = ProductIndex(products)
     min_occurrences = 1
-    pattern_counts: Counter[Tuple[str, str, Tuple[int, int, str]]] = Counter()
-
-    for items in tx.values():
-        skus = list(items.keys())
-        for i in range(len(skus)):
-            for j in range(i + 1, len(skus)):
-                s1, s2 = skus[i], skus[j]
-                q1, q2 = items[s1], items[s2]
-                for a_qty, b_qty, label in patterns:
-                    if q1 >= a_qty and q2 >= b_qty:
-                        pattern_counts[(s1, s2, (a_qty, b_qty, label))] += 1
-                    if q2 >= a_qty and q1 >= b_qty:
-                        pattern_counts[(s2, s1, (a_qty, b_qty, label))] += 1
 
-    bundles: List[Bundle] = []
-    seen_keys: set = set()
-    for (sku_a, sku_b, (qa, qb, label)), count in pattern_counts.items():
-        if count < min_occurrences:
-            continue
-        prod_a = product_by_sku.get(sku_a)
-        prod_b = product_by_sku.get(sku_b)
-        if not prod_a or not prod_b:
-            continue
-        if not (prod_a.bundle_enabled and prod_b.bundle_enabled):
-            continue
-        items = [
-            BundleItem(product=prod_a, quantity=qa),
-            BundleItem(product=prod_b, quantity=qb),
-        ]
-        if not _is_compatible(items):
-            continue
-        key = _bundle_key(items)
-        if key in seen_keys:
-            continue
-        brand = prod_a.brand if prod_a.brand == prod_b.brand else "Mixed"
-        bundle = _create_bundle(brand, items, pricing, bundle_config, products)
-        if bundle:
-            bundle.title = f"{bundle.title} ({label})"
-            seen_keys.add(key)
-            bundles.append(bundle)
-
-    return bundles
+    def candidates() -> Iterator[Candidate]:
+        for sku_a, sku_b, (qa, qb, label), _ in cooccurrence.pair_counts(
+            min_occurrences, allowed_skus=product_by_sku.keys()
+        ):
+            prod_a = product_by_sku[sku_a]
+            prod_b = product_by_sku[sku_b]
+            if not (prod_a.bundle_enabled and prod_b.bundle_enabled):
+                continue
+            items = [
+                BundleItem(product=prod_a, quantity=qa),
+                BundleItem(product=prod_b, quantity=qb),
+            ]
+            if not _is_compatible(items):
+                continue
+            brand = prod_a.brand if prod_a.brand == prod_b.brand else "Mixed"
+            yield brand, items, label
+
+    return _accept_candidates(candidates(), pricing, bundle_config, index, seen_keys=set())
 
 
 def _fallback_brand_bundles(
     products: List[Product],
     pricing: PricingConfig,
     bundle_config: BundleConfig,
+    index: Optional[ProductIndex] = None,
+    demand: Optional[Mapping[str, float]] = None,
 ) -> List[Bundle]:
-    """Original brand-based generation as a fallback when no orders exist."""
+    """
+    Brand-based generation, used when no orders exist or no order pattern qualifies.
+    Mixed bundles are explored best-first by `demand` (units ordered per SKU)
+    when given, otherwise by price.
+    """
     bundles: List[Bundle] = []
-    seen_keys: Dict[str, set] = defaultdict(set)
+    if index is None:
+        index = ProductIndex(products)
 
     products_by_brand: Dict[str, List[Product]] = defaultdict(list)
     for product in _eligible_products(products):
@@ -227,71 +270,168 @@ def _fallback_brand_bundles(
 
     for brand, brand_products in products_by_brand.items():
         max_for_brand = bundle_config.max_bundles_for_brand(len(brand_products))
-        count_for_brand = 0
+        seen_keys: set = set()
 
         # Individual bundles
-        for product in brand_products:
-            for size in bundle_config.individual_sizes:
-                if count_for_brand >= max_for_brand:
-                    break
-                if not _can_support_quantities(product, size):
-                    continue
-                items = [BundleItem(product=product, quantity=size)]
-                key = _bundle_key(items)
-                if key in seen_keys[brand]:
-                    continue
-                bundle = _create_bundle(brand, items, pricing, bundle_config, products)
-                if bundle:
-                    bundles.append(bundle)
-                    seen_keys[brand].add(key)
-                    count_for_brand += 1
+        individual = _accept_candidates(
+            _individual_candidates(brand, brand_products, bundle_config),
+            pricing,
+            bundle_config,
+            index,
+            seen_keys,
+            limit=max_for_brand,
+        )
+        bundles.extend(individual)
 
         # Mixed bundles
-        for size in bundle_config.mixed_sizes:
-            combos = combinations_with_replacement(brand_products, size)
-            for combo in combos:
-                if count_for_brand >= max_for_brand:
-                    break
-                counts = Counter(p.sku for p in combo)
-                if len(counts) <= 1:
-                    continue
-                stock_ok = True
-                for sku, qty in counts.items():
-                    product = next(p for p in combo if p.sku == sku)
-                    if not _can_support_quantities(product, qty):
-                        stock_ok = False
-                        break
-                if not stock_ok:
-                    continue
-                items = [
-                    BundleItem(
-                        product=next(p for p in combo if p.sku == sku),
-                        quantity=qty,
-                    )
-                    for sku, qty in counts.items()
-                ]
-                key = _bundle_key(items)
-                if key in seen_keys[brand]:
-                    continue
-                bundle = _create_bundle(brand, items, pricing, bundle_config, products)
-                if bundle:
-                    bundles.append(bundle)
-                    seen_keys[brand].add(key)
-                    count_for_brand += 1
+        bundles.extend(
+            _accept_candidates(
+                _mixed_candidates(brand, brand_products, bundle_config, pricing, demand),
+                pricing,
+                bundle_config,
+                index,
+                seen_keys,
+                limit=max_for_brand - len(individual),
+            )
+        )
 
     return bundles
 
 
+def _individual_candidates(
+    brand: str,
+    brand_products: List[Product],
+    bundle_config: BundleConfig,
+) -> Iterator[Candidate]:
+    for product in brand_products:
+        for size in bundle_config.individual_sizes:
+            if not _can_support_quantities(product, size):
+                continue
+            yield brand, [BundleItem(product=product, quantity=size)], None
+
+
+def _mixed_candidates(
+    brand: str,
+    brand_products: List[Product],
+    bundle_config: BundleConfig,
+    pricing: PricingConfig,
+    demand: Optional[Mapping[str, float]] = None,
+) -> Iterator[Candidate]:
+    """
+    Best-first branch-and-bound over multisets of brand products.
+
+    Products are ordered by priority (demand when available, else price as a
+    margin proxy) and each size in `mixed_sizes` is explored as non-decreasing
+    index tuples, popped from one heap by priority per unit. Subtrees are cut
+    as soon as their fixed part exceeds a product's stock, cannot fit in
+    `max_total_units` or cannot reach `pricing.min_price`, so the per-brand
+    cap applied by the caller keeps the most valuable bundles.
+    Compatibility holds by construction: every product shares the brand.
+    """
+    pool: List[Product] = []
+    seen_skus: set = set()
+    for product in brand_products:
+        # Unknown stock is treated as 0 by compute_max_bundle_stock, so it can never qualify.
+        if product.sku in seen_skus or not product.available_stock or product.available_stock <= 0:
+            continue
+        seen_skus.add(product.sku)
+        pool.append(product)
+    if len(pool) < 2:
+        return
+
+    def priority(product: Product) -> float:
+        if demand is not None:
+            return float(demand.get(product.sku, 0.0))
+        return float(product.price_with_vat)
+
+    # Items are emitted in brand_products order, like the exhaustive enumeration did:
+    # the title and the "<category> Mix" come from the item order, not from the priority.
+    baseline = {product.sku: pos for pos, product in enumerate(pool)}
+    pool.sort(key=priority, reverse=True)
+    n = len(pool)
+    value = [priority(p) for p in pool]
+    price = [float(p.price_with_vat) for p in pool]
+    units = [p.units_per_pack or 1 for p in pool]
+    stock = [int(p.available_stock or 0) for p in pool]
+
+    # Best achievable price / fewest units among indices 0..i (free positions never exceed i).
+    max_price_upto = list(accumulate(price, max))
+    min_units_upto = list(accumulate(units, min))
+    max_units = bundle_config.max_total_units
+
+    def subtree_feasible(state: Tuple[int, ...], pivot: int) -> bool:
+        fixed = state[pivot + 1:]
+        counts = Counter(fixed)
+        if any(qty > stock[idx] for idx, qty in counts.items()):
+            return False
+        bound = fixed[0] if fixed else n - 1
+        free = pivot + 1
+        if sum(units[i] for i in fixed) + free * min_units_upto[bound] > max_units:
+            return False
+        best_base = sum(price[i] for i in fixed) + free * max_price_upto[bound]
+        return pricing.final_price_for_base(best_base) >= pricing.min_price
+
+    heap: List[Tuple[float, int, Tuple[int, ...], int]] = []
+    tie = count()
+    for size in bundle_config.mixed_sizes:
+        if size < 2:
+            continue
+        root = (0,) * size
+        if subtree_feasible(root, size - 1):
+            heappush(heap, (-value[0], next(tie), root, size - 1))
+
+    while heap:
+        _, _, state, pivot = heappop(heap)
+        size = len(state)
+
+        counts = Counter(state)
+        if (
+            len(counts) > 1
+            and all(qty <= stock[idx] for idx, qty in counts.items())
+            and sum(units[i] for i in state) <= max_units
+        ):
+            ordered = sorted(counts.items(), key=lambda entry: baseline[pool[entry[0]].sku])
+            yield brand, [BundleItem(product=pool[idx], quantity=qty) for idx, qty in ordered], None
+
+        # Children move one unit to a lower-priority product: either the pivot
+        # position itself or the position just before it.
+        for pos in (pivot, pivot - 1):
+            if pos < 0:
+                continue
+            upper = state[pos + 1] if pos + 1 < size else n - 1
+            if state[pos] + 1 > upper:
+                continue
+            child = state[:pos] + (state[pos] + 1,) + state[pos + 1:]
+            if not subtree_feasible(child, pos):
+                continue
+            score = sum(value[i] for i in child) / size
+            heappush(heap, (-score, next(tie), child, pos))
+
+
 def generate_bundles(
     products: List[Product],
     pricing: PricingConfig,
     bundle_config: BundleConfig,
     orders: Optional[List[Order]] = None,
+    cooccurrence: Optional[CooccurrenceIndex] = None,
+    demand: Optional[Mapping[str, float]] = None,
 ) -> List[Bundle]:
-    """Generate bundle proposals using order-driven patterns when available, else fallback."""
+    """
+    Generate bundle proposals using order-driven patterns when available, else fallback.
+    A prebuilt (incrementally updated) CooccurrenceIndex can be passed instead of orders,
+    together with per-SKU `demand` for the fallback (otherwise derived from orders).
+    The catalog is indexed once per run and shared by both generation paths.
+    """
     orders = orders or []
-    if orders:
-        bundles = _pattern_candidates_from_orders(products, orders, bundle_config, pricing)
+    index = ProductIndex(products)
+    if orders or (cooccurrence is not None and cooccurrence.order_count):
+        bundles = _pattern_candidates_from_orders(
+            products, orders, bundle_config, pricing, cooccurrence, index=index
+        )
         if bundles:
             return bundles
-    return _fallback_brand_bundles(products, pricing, bundle_config)
+    if demand is None and orders:
+        demand = Counter()
+        for order in orders:
+            demand[str(order.product_sku)] += int(order.quantity)
+    return _fallback_brand_bundles(products, pricing, bundle_config, index=index, demand=demand)
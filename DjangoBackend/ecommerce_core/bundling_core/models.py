@@ -4,6 +4,8 @@ import math
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 
+import numpy as np
+
 
 @dataclass
 class Product:
@@ -73,6 +75,11 @@ class PricingConfig:
         price = (base_price + self.fixed_cost) / max(1e-9, (1.0 - self.commission_rate))
         return math.ceil(price * 100.0) / 100.0
 
+    def final_prices_for_base(self, base_prices: np.ndarray) -> np.ndarray:
+        """Vectorized final_price_for_base over an array of base prices."""
+        prices = (base_prices + self.fixed_cost) / max(1e-9, (1.0 - self.commission_rate))
+        return np.ceil(prices * 100.0) / 100.0
+
 
 @dataclass
 class BundleConfig:
@@ -85,6 +92,19 @@ class BundleConfig:
         return product_count * self.max_multiplier_per_brand
 
 
+@dataclass
+class RankingWeights:
+    """
+    score = (demand * demand_score + margin * margin_gain - price_penalty * final_price)
+            * (1 + min(stock, stock_cap) / stock_scale)
+    """
+    demand: float = 2.0
+    margin: float = 1.0
+    price_penalty: float = 0.01
+    stock_cap: int = 50
+    stock_scale: float = 100.0
+
+
 @dataclass
 class CollageConfig:
     width: int = 600
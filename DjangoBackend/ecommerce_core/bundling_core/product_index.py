@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .models import BundleItem, Product
+
+
+class ProductIndex:
+    """
+    Columnar view of the catalog, built once per generation run.
+
+    Every product keeps its own row (price and units_per_pack are read from the
+    exact object referenced by a bundle item), while stock lookups go through
+    `stock_row`, which points at the product that wins a SKU lookup. That
+    mirrors the `{p.sku: p for p in products}` mapping used previously.
+    """
+
+    def __init__(self, products: Sequence[Product]):
+        self.products: List[Product] = list(products)
+        self.row_by_sku: Dict[str, int] = {p.sku: row for row, p in enumerate(self.products)}
+        self._row_by_id: Dict[int, int] = {id(p): row for row, p in enumerate(self.products)}
+
+        n = len(self.products)
+        self.price = np.fromiter((p.price_with_vat for p in self.products), dtype=np.float64, count=n)
+        self.stock = np.fromiter(
+            (p.available_stock if p.available_stock is not None else 0 for p in self.products),
+            dtype=np.int64,
+            count=n,
+        )
+        self.units_per_pack = np.fromiter(
+            (p.units_per_pack or 1 for p in self.products), dtype=np.int64, count=n
+        )
+        self.stock_row = np.fromiter(
+            (self.row_by_sku[p.sku] for p in self.products), dtype=np.int64, count=n
+        )
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def row_of(self, product: Product) -> int:
+        """Row of this exact product object, falling back to its SKU (-1 if unknown)."""
+        row = self._row_by_id.get(id(product))
+        if row is None:
+            row = self.row_by_sku.get(product.sku, -1)
+        return row
+
+    def component_matrix(self, candidates: Sequence[List[BundleItem]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pack candidate bundles into padded (n_candidates x max_components) arrays of
+        product rows and quantities. Padding slots have row -1 and quantity 0.
+        """
+        width = max((len(items) for items in candidates), default=0)
+        rows = np.full((len(candidates), width), -1, dtype=np.int64)
+        quantities = np.zeros((len(candidates), width), dtype=np.int64)
+        for i, items in enumerate(candidates):
+            for j, item in enumerate(items):
+                rows[i, j] = self.row_of(item.product)
+                quantities[i, j] = item.quantity
+        return rows, quantities
+
+    def max_bundle_stock(self, rows: np.ndarray, quantities: np.ndarray, widths: np.ndarray) -> np.ndarray:
+        """
+        Vectorized compute_max_bundle_stock: for each candidate, the number of
+        bundles the stock allows, or 0 if a component is missing or insufficient.
+        `widths` is the real number of components per candidate.
+        """
+        n, width = rows.shape
+        if width == 0:
+            return np.zeros(n, dtype=np.int64)
+
+        used = np.arange(width) < widths[:, None]
+        known = rows >= 0
+        stock = np.where(known, self.stock[self.stock_row[np.where(known, rows, 0)]], 0)
+        safe_qty = np.where(quantities > 0, quantities, 1)
+
+        failed = used & (~known | (quantities <= 0) | (stock < quantities))
+        per_component = np.where(used, stock // safe_qty, np.iinfo(np.int64).max)
+        result = per_component.min(axis=1)
+        result[failed.any(axis=1) | (widths == 0)] = 0
+        return result
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import Bundle, RankingWeights
+
+
+def bundle_arrays(bundles: Sequence[Bundle]) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Columnar view of candidate bundles: (skus, component codes, quantities,
+    final prices, base prices, stock). Component codes index into `skus` and
+    are padded with -1 (quantity 0) up to the widest bundle.
+    """
+    n = len(bundles)
+    width = max((len(b.items) for b in bundles), default=0)
+    codes = np.full((n, width), -1, dtype=np.int64)
+    quantities = np.zeros((n, width), dtype=np.int64)
+    vocabulary: Dict[str, int] = {}
+    for i, bundle in enumerate(bundles):
+        for j, item in enumerate(bundle.items):
+            codes[i, j] = vocabulary.setdefault(item.product.sku, len(vocabulary))
+            quantities[i, j] = item.quantity
+
+    final_price = np.fromiter((b.final_price for b in bundles), dtype=np.float64, count=n)
+    base_price = np.fromiter((b.base_price for b in bundles), dtype=np.float64, count=n)
+    stock = np.fromiter((getattr(b, "max_bundle_stock", 0) for b in bundles), dtype=np.int64, count=n)
+    return list(vocabulary), codes, quantities, final_price, base_price, stock
+
+
+def demand_vector(skus: Sequence[str], demand: Mapping[str, float]) -> np.ndarray:
+    return np.fromiter((demand.get(sku, 0) for sku in skus), dtype=np.float64, count=len(skus))
+
+
+def score_bundle_arrays(
+    sku_demand: np.ndarray,
+    codes: np.ndarray,
+    quantities: np.ndarray,
+    final_price: np.ndarray,
+    base_price: np.ndarray,
+    stock: np.ndarray,
+    weights: Optional[RankingWeights] = None,
+) -> np.ndarray:
+    """Vectorized ranking score for every candidate (see RankingWeights)."""
+    weights = weights or RankingWeights()
+    component = np.where(codes >= 0, sku_demand[np.where(codes >= 0, codes, 0)], 0.0) * quantities
+
+    # Column by column, so the sum follows the same order as a per-item loop.
+    demand_score = np.zeros(len(codes), dtype=np.float64)
+    for column in range(codes.shape[1]):
+        demand_score += component[:, column]
+
+    margin = np.maximum(0.0, final_price - base_price)
+    price_penalty = final_price * weights.price_penalty
+    stock_factor = 1.0 + np.minimum(stock, weights.stock_cap) / weights.stock_scale
+    return (demand_score * weights.demand + margin * weights.margin - price_penalty) * stock_factor
+
+
+def top_k(scores: np.ndarray, k: Optional[int]) -> np.ndarray:
+    """
+    Positions of the k best scores, best first; ties keep input order (like a
+    stable descending sort). Uses argpartition so only the winners get sorted.
+    """
+    n = len(scores)
+    if not k or k >= n:
+        return np.lexsort((np.arange(n), -scores))
+
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    contenders = np.flatnonzero(scores >= threshold)
+    order = np.lexsort((contenders, -scores[contenders]))
+    return contenders[order[:k]]
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Hashable, Iterable, Iterator, Optional, Protocol, Tuple
+
+from .images import file_digest, upload_to_cloudinary
+from .models import CloudinaryConfig
+
+DEFAULT_UPLOAD_CONCURRENCY = 4
+
+
+class CollageUploader(Protocol):
+    def upload(self, image_path: str, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Upload one rendered collage and return its public URL (None on failure).
+        `digest` is the file's sha256 when the caller already has it; the URL must be
+        content-addressed (never reused for other bytes), since the index maps digests to it.
+        """
+
+
+class UploadIndex(Protocol):
+    """Persistent content hash -> URL map, so identical collages are uploaded once."""
+
+    def get(self, digest: str) -> Optional[str]: ...
+
+    def set(self, digest: str, url: str) -> None: ...
+
+
+class InMemoryUploadIndex:
+    def __init__(self) -> None:
+        self._urls: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            return self._urls.get(digest)
+
+    def set(self, digest: str, url: str) -> None:
+        with self._lock:
+            self._urls[digest] = url
+
+
+class CloudinaryUploader:
+    def __init__(self, cfg: CloudinaryConfig):
+        self.cfg = cfg
+
+    def upload(self, image_path: str, digest: Optional[str] = None) -> Optional[str]:
+        return upload_to_cloudinary(image_path, self.cfg, digest)
+
+
+class LocalFilesystemUploader:
+    """
+    Stand-in for Cloudinary when testing locally: copies the JPEG into
+    `root_dir` under its content hash and returns `base_url` + file name
+    (a file:// URL when no base_url is given).
+    """
+
+    def __init__(self, root_dir: str, base_url: Optional[str] = None):
+        self.root_dir = root_dir
+        self.base_url = base_url
+        os.makedirs(root_dir, exist_ok=True)
+
+    def upload(self, image_path: str, digest: Optional[str] = None) -> Optional[str]:
+        name = f"{digest or file_digest(image_path)}{os.path.splitext(image_path)[1]}"
+        target = os.path.join(self.root_dir, name)
+        shutil.copyfile(image_path, target)
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{name}"
+        return f"file://{os.path.abspath(target)}"
+
+
+def iter_upload_collages(
+    collages: Iterable[Tuple[Hashable, Optional[str]]],
+    uploader: CollageUploader,
+    index: Optional[UploadIndex] = None,
+    max_workers: int = DEFAULT_UPLOAD_CONCURRENCY,
+) -> Iterator[Tuple[Hashable, Optional[str]]]:
+    """
+    Upload (key, jpeg path) pairs and yield (key, url) as soon as each URL is known.
+
+    `collages` may be a generator (e.g. render_collages); uploads start as soon
+    as each path arrives. Files are hashed first: hashes already present in
+    `index`, or already being uploaded in this batch, reuse that URL instead of
+    uploading again. At most `max_workers` uploads run at the same time.
+    Keys with a None path, or whose upload failed, yield None.
+    """
+    index = index if index is not None else InMemoryUploadIndex()
+    pending: Dict[str, Future] = {}
+    waiting: Dict[Hashable, str] = {}
+
+    def _upload(path: str, digest: str) -> Optional[str]:
+        url = uploader.upload(path, digest)
+        if url:
+            index.set(digest, url)
+        return url
+
+    def _finished(block: bool) -> Iterator[Tuple[Hashable, Optional[str]]]:
+        if block:
+            wait([pending[digest] for digest in set(waiting.values())], return_when=FIRST_COMPLETED)
+        for key, digest in list(waiting.items()):
+            future = pending[digest]
+            if not future.done():
+                continue
+            del waiting[key]
+            try:
+                yield key, future.result()
+            except Exception as exc:
+                print(f"[uploads] upload failed for {key}: {exc}")
+                yield key, None
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for key, path in collages:
+            if not path:
+                yield key, None
+                continue
+            digest = file_digest(path)
+            known = index.get(digest)
+            if known:
+                yield key, known
+                continue
+            if digest not in pending:
+                pending[digest] = pool.submit(_upload, path, digest)
+            waiting[key] = digest
+            yield from _finished(block=False)
+
+        while waiting:
+            yield from _finished(block=True)
+
+
+def upload_collages(
+    collages: Iterable[Tuple[Hashable, Optional[str]]],
+    uploader: CollageUploader,
+    index: Optional[UploadIndex] = None,
+    max_workers: int = DEFAULT_UPLOAD_CONCURRENCY,
+) -> Dict[Hashable, Optional[str]]:
+    """Like iter_upload_collages, but wait for everything and return {key: url}."""
+    return dict(iter_upload_collages(collages, uploader, index, max_workers))
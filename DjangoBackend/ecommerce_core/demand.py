@@ -0,0 +1,186 @@
+"""
+Cererea per SKU / pereche de SKU-uri, cu descreștere în timp și separată pe canale
+(platforma contului de marketplace), păstrată în tabela DemandFeature.
+
+Fiecare OrderLineItem nou adaugă ponderea lui (semnal post_save), deci generatorul
+de pachete citește cererea cu o singură interogare, fără să parcurgă istoricul de
+comenzi la fiecare rulare.
+"""
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bundling_core.demand import ALL_CHANNELS, DecayedDemand, DemandView
+from .models import DemandBuild, DemandFeature, OrderLineItem
+
+logger = logging.getLogger(__name__)
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def order_channel(order) -> str:
+    return order.platform_account.platform
+
+
+def line_sku(line) -> str:
+    # La fel ca în bundle_sources: SKU-ul variantei locale, altfel merchantSku-ul primit.
+    return line.variant.sku if line.variant_id else line.sku
+
+
+def record_order_line(line) -> None:
+    record_order_lines([line])
+
+
+def record_order_lines(lines) -> None:
+    """
+    Adaugă în DemandFeature liniile de comandă nou salvate: unitățile lor și perechile
+    pe care le formează cu celelalte linii ale aceleiași comenzi (cele existente deja,
+    apoi cele din lot, în ordinea ID-urilor). Câteva interogări pe lot, oricâte linii.
+    Primul apel pentru un cont (fără DemandBuild) construiește tabela din tot istoricul,
+    liniile incluse.
+    """
+    lines = [line for line in lines if line.pk]
+    if not lines:
+        return
+    by_order = defaultdict(list)
+    orders = {}
+    for line in lines:
+        by_order[line.order_id].append(line)
+        orders[line.order_id] = line.order
+
+    account_ids = {order.account_id for order in orders.values()}
+    rebuilt = set()
+    known_accounts = set(
+        DemandBuild.objects.filter(account_id__in=account_ids).values_list("account_id", flat=True)
+    )
+    for order in orders.values():
+        if order.account_id not in known_accounts:
+            rebuild_demand_features(order.account)
+            known_accounts.add(order.account_id)
+            rebuilt.add(order.account_id)
+    by_order = {oid: items for oid, items in by_order.items() if orders[oid].account_id not in rebuilt}
+    if not by_order:
+        return
+
+    baskets = defaultdict(list)
+    earlier = (
+        OrderLineItem.objects.filter(order_id__in=list(by_order))
+        .exclude(pk__in=[line.pk for line in lines])
+        .values_list("order_id", "variant__sku", "sku")
+    )
+    for order_id, variant_sku, sku in earlier:
+        baskets[order_id].append(variant_sku or sku)
+
+    demand = DecayedDemand()
+    increments: Dict[Tuple, float] = defaultdict(float)
+    for order_id, order_lines in by_order.items():
+        order = orders[order_id]
+        channel, at = order_channel(order), order.order_date.timestamp()
+        basket = baskets[order_id]
+        for line in sorted(order_lines, key=lambda item: item.pk):
+            sku = line_sku(line)
+            for key, weight in demand.line_features(channel, sku, line.quantity, basket, at):
+                increments[(order.account_id, *key)] += weight
+            basket.append(sku)
+    _add_weights(increments)
+
+
+def _add_weights(increments: Dict[Tuple, float]) -> None:
+    """
+    weight += increment pe fiecare cheie (account_id, channel, sku, other_sku).
+    Rândurile existente se blochează (select_for_update), se actualizează în memorie și
+    se scriu cu bulk_update; cele lipsă se creează cu bulk_create.
+    """
+    if not increments:
+        return
+    rows = DemandFeature.objects.select_for_update().filter(
+        account_id__in={key[0] for key in increments},
+        channel__in={key[1] for key in increments},
+        sku__in={key[2] for key in increments},
+        other_sku__in={key[3] for key in increments},
+    ).only("id", "account_id", "channel", "sku", "other_sku", "weight")
+
+    existing = []
+    missing = dict(increments)
+    for row in rows:
+        increment = missing.pop((row.account_id, row.channel, row.sku, row.other_sku), None)
+        if increment is not None:
+            row.weight += increment
+            existing.append(row)
+    DemandFeature.objects.bulk_update(existing, ["weight"], batch_size=REBUILD_CHUNK_SIZE)
+
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            DemandFeature.objects.bulk_create(
+                [
+                    DemandFeature(account_id=account_id, channel=channel, sku=sku, other_sku=other_sku, weight=increment)
+                    for (account_id, channel, sku, other_sku), increment in missing.items()
+                ],
+                batch_size=REBUILD_CHUNK_SIZE,
+            )
+    except IntegrityError:
+        # Alt proces a creat între timp o parte din rânduri: le adunăm pe rând, atomic
+        for (account_id, channel, sku, other_sku), increment in missing.items():
+            rows = DemandFeature.objects.filter(account_id=account_id, channel=channel, sku=sku, other_sku=other_sku)
+            if not rows.update(weight=F("weight") + increment):
+                DemandFeature.objects.create(
+                    account_id=account_id, channel=channel, sku=sku, other_sku=other_sku, weight=increment
+                )
+
+
+def rebuild_demand_features(user) -> int:
+    """
+    Recalculează tabela pentru un cont din tot istoricul de comenzi (ex: prima rulare,
+    sau după ștergeri de comenzi). Întoarce numărul de rânduri scrise.
+    """
+    demand = DecayedDemand()
+    rows = (
+        OrderLineItem.objects.filter(order__account=user)
+        .order_by("order_id", "id")
+        .values_list("order_id", "order__order_date", "order__platform_account__platform", "variant__sku", "sku", "quantity")
+        .iterator(chunk_size=REBUILD_CHUNK_SIZE)
+    )
+    current, basket = None, []
+    for order_id, order_date, channel, variant_sku, sku, quantity in rows:
+        if current is not None and order_id != current[0]:
+            demand.add_basket(current[2], basket, current[1].timestamp())
+            basket = []
+        current = (order_id, order_date, channel)
+        basket.append((variant_sku or sku, quantity))
+    if current is not None:
+        demand.add_basket(current[2], basket, current[1].timestamp())
+
+    features = [
+        DemandFeature(account=user, channel=channel, sku=sku, other_sku=other_sku, weight=weight)
+        for (channel, sku, other_sku), weight in demand.weights.items()
+    ]
+    with transaction.atomic():
+        DemandFeature.objects.filter(account=user).delete()
+        DemandFeature.objects.bulk_create(features, batch_size=REBUILD_CHUNK_SIZE)
+        DemandBuild.objects.update_or_create(account=user, defaults={"built_at": timezone.now()})
+    logger.info(f"Cerere recalculată pentru {user}: {len(features)} rânduri")
+    return len(features)
+
+
+def account_demand(user, channel: str = ALL_CHANNELS, now: Optional[float] = None) -> DemandView:
+    """
+    Cererea curentă per SKU (unități, descrescute în timp) pentru rank_bundles.
+    Dacă tabela n-a fost construită încă dar contul are comenzi, o construim întâi din istoric.
+    """
+    features = DemandFeature.objects.filter(account=user)
+    if (
+        not DemandBuild.objects.filter(account=user).exists()
+        and OrderLineItem.objects.filter(order__account=user).exists()
+    ):
+        rebuild_demand_features(user)
+    weights: Dict[str, float] = dict(
+        features.filter(channel=channel, other_sku="").values_list("sku", "weight")
+    )
+    return DemandView(weights, DecayedDemand().scale_at(time.time() if now is None else now))
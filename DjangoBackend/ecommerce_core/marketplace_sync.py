@@ -0,0 +1,54 @@
+"""
+Outbox pentru actualizările de stoc/preț către marketplace-uri.
+
+În loc de un task Celery (și un apel HTTP cu un singur produs) pentru fiecare salvare
+de variantă, marcăm listările active în PendingListingSync. Task-ul periodic al
+platformei (ex: ecommerce_trendyol.tasks.flush_trendyol_stock_price_updates) le
+trimite grupat, per cont, cu stocul/prețul din momentul trimiterii.
+"""
+import logging
+from typing import Iterable
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MarketplaceAccount, MarketplaceListing, PendingListingSync
+
+logger = logging.getLogger(__name__)
+
+# Platformele care au un task de trimitere a outbox-ului
+OUTBOX_PLATFORMS = (MarketplaceAccount.Platform.TRENDYOL,)
+
+
+def listing_stock_price(listing):
+    """(stoc, preț) de trimis: override-ul listării dacă există, altfel valorile variantei."""
+    stock = listing.stock_override if listing.stock_override is not None else listing.variant.stock
+    price = listing.price_override if listing.price_override is not None else listing.variant.price
+    return stock, price
+
+
+def trigger_marketplace_updates(variant_ids: Iterable[int]) -> None:
+    """Marchează pentru sincronizare toate listările active ale variantelor date (o interogare)."""
+    variant_ids = list(variant_ids)
+    if not variant_ids:
+        return
+    listing_ids = list(
+        MarketplaceListing.objects.filter(
+            variant_id__in=variant_ids,
+            status=MarketplaceListing.Status.ACTIVE,
+            platform_account__platform__in=OUTBOX_PLATFORMS,
+        ).values_list("id", flat=True)
+    )
+    if listing_ids:
+        # Marcăm după commit: la trimitere, stocul/prețul citit e cel puțin cel salvat acum
+        transaction.on_commit(lambda: mark_listings(listing_ids))
+
+
+def mark_listings(listing_ids: Iterable[int]) -> None:
+    now = timezone.now()
+    PendingListingSync.objects.bulk_create(
+        [PendingListingSync(listing_id=listing_id, marked_at=now) for listing_id in listing_ids],
+        update_conflicts=True,
+        update_fields=["marked_at"],
+        unique_fields=["listing"],
+    )
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_core', '0007_systemevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandFeature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(max_length=50)),
+                ('sku', models.CharField(max_length=100)),
+                ('other_sku', models.CharField(blank=True, default='', max_length=100)),
+                ('weight', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand_features', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cerere SKU',
+                'verbose_name_plural': 'Cerere SKU-uri',
+                'unique_together': {('account', 'channel', 'sku', 'other_sku')},
+            },
+        ),
+    ]
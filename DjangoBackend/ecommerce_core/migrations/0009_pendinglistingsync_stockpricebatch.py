@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-17 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_core', '0008_demandfeature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingListingSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marked_at', models.DateTimeField(db_index=True)),
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pending_sync', to='ecommerce_core.marketplacelisting')),
+            ],
+            options={
+                'verbose_name': 'Sincronizare în așteptare',
+                'verbose_name_plural': 'Sincronizări în așteptare',
+            },
+        ),
+        migrations.CreateModel(
+            name='StockPriceBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_request_id', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('barcodes', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('platform_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_price_batches', to='ecommerce_core.marketplaceaccount')),
+            ],
+            options={
+                'verbose_name': 'Lot Stoc/Preț',
+                'verbose_name_plural': 'Loturi Stoc/Preț',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_core', '0009_pendinglistingsync_stockpricebatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketplaceaccount',
+            name='orders_synced_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
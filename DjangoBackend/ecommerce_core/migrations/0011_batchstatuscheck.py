@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-17 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_core', '0010_marketplaceaccount_orders_synced_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchStatusCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_request_id', models.CharField(max_length=100)),
+                ('outcome', models.CharField(choices=[('pending', 'În așteptare'), ('completed', 'Finalizat'), ('failed', 'Eșuat'), ('expired', 'Expirat')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('submitted_at', models.DateTimeField()),
+                ('next_check_at', models.DateTimeField(db_index=True)),
+                ('completed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('platform_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='batch_checks', to='ecommerce_core.marketplaceaccount')),
+            ],
+            options={
+                'verbose_name': 'Verificare Batch',
+                'verbose_name_plural': 'Verificări Batch',
+                'unique_together': {('platform_account', 'batch_request_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_built_accounts(apps, schema_editor):
+    # Conturile care au deja cerere nu trebuie reconstruite după migrare
+    DemandBuild = apps.get_model('ecommerce_core', 'DemandBuild')
+    DemandFeature = apps.get_model('ecommerce_core', 'DemandFeature')
+    now = timezone.now()
+    DemandBuild.objects.bulk_create(
+        [
+            DemandBuild(account_id=account_id, built_at=now)
+            for account_id in DemandFeature.objects.values_list('account_id', flat=True).distinct()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ecommerce_core', '0011_batchstatuscheck'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('built_at', models.DateTimeField()),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='demand_build', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Construire cerere',
+                'verbose_name_plural': 'Construiri cerere',
+            },
+        ),
+        migrations.RunPython(mark_built_accounts, migrations.RunPython.noop),
+    ]
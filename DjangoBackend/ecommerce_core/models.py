@@ -27,6 +27,8 @@ class MarketplaceAccount(models.Model):
     api_secret = models.TextField(blank=True)
     # Stocăm și storeFrontCode-ul aici
     store_front_code = models.CharField(max_length=10, default="RO")
+    # Până unde au fost preluate comenzile modificate (PackageLastModifiedDate) la ultimul polling reușit
+    orders_synced_until = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         verbose_name = "Cont Marketplace"
@@ -103,21 +105,9 @@ class ProductVariant(models.Model):
         if self.type != self.Type.BUNDLE:
             return self.stock
 
-        components = self.bundle_components.all()
-        if not components.exists():
-            return 0
-
-        max_possible_stock = float('inf')
-        
-        for comp in components:
-            if comp.component_variant.stock == 0:
-                return 0
-            # Câte seturi putem face cu stocul acestei componente?
-            possible = comp.component_variant.stock // comp.quantity
-            if possible < max_possible_stock:
-                max_possible_stock = possible
-        
-        return int(max_possible_stock) if max_possible_stock != float('inf') else 0
+        # MIN(stoc // cantitate) peste componente, într-o singură interogare
+        from .bundle_stock import compute_bundle_stocks
+        return compute_bundle_stocks([self.id]).get(self.id, 0)
     
 class BundleComponent(models.Model):
     """
@@ -189,6 +179,72 @@ class MarketplaceListing(models.Model):
         return f"{self.variant.sku} pe {self.platform_account.get_platform_display()} ({self.get_status_display()})"
 
 
+class PendingListingSync(models.Model):
+    """
+    Outbox pentru actualizările de stoc/preț: listările marcate aici sunt trimise
+    grupat, per cont, de task-ul periodic (ex: flush_trendyol_stock_price_updates).
+    O listare apare o singură dată, oricâte modificări ar avea între două trimiteri.
+    """
+    listing = models.OneToOneField(MarketplaceListing, on_delete=models.CASCADE, related_name="pending_sync")
+    marked_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Sincronizare în așteptare"
+        verbose_name_plural = "Sincronizări în așteptare"
+
+    def __str__(self):
+        return f"Listing {self.listing_id} (marcat {self.marked_at:%Y-%m-%d %H:%M:%S})"
+
+
+class StockPriceBatch(models.Model):
+    """
+    Un lot trimis la endpoint-ul de stoc/preț al platformei, cu batchRequestId-ul primit.
+    """
+    platform_account = models.ForeignKey(MarketplaceAccount, on_delete=models.CASCADE, related_name="stock_price_batches")
+    batch_request_id = models.CharField(max_length=100, blank=True, db_index=True)
+    item_count = models.PositiveIntegerField(default=0)
+    barcodes = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Lot Stoc/Preț"
+        verbose_name_plural = "Loturi Stoc/Preț"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.batch_request_id or '-'} ({self.item_count} produse)"
+
+
+class BatchStatusCheck(models.Model):
+    """
+    Un batch trimis la platformă (ex: creare produse) al cărui rezultat îl așteptăm.
+    Task-ul periodic al platformei (ex: ecommerce_trendyol.tasks.poll_trendyol_batches)
+    verifică batch-urile scadente (next_check_at), la intervale crescătoare.
+    submitted_at / completed_at dau timpul până la finalizare (vezi batch_completion_histogram).
+    """
+    class Outcome(models.TextChoices):
+        PENDING = 'pending', 'În așteptare'
+        COMPLETED = 'completed', 'Finalizat'
+        FAILED = 'failed', 'Eșuat'
+        EXPIRED = 'expired', 'Expirat'
+
+    platform_account = models.ForeignKey(MarketplaceAccount, on_delete=models.CASCADE, related_name="batch_checks")
+    batch_request_id = models.CharField(max_length=100)
+    outcome = models.CharField(max_length=20, choices=Outcome.choices, default=Outcome.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    submitted_at = models.DateTimeField()
+    next_check_at = models.DateTimeField(db_index=True)
+    completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Verificare Batch"
+        verbose_name_plural = "Verificări Batch"
+        unique_together = ('platform_account', 'batch_request_id')
+
+    def __str__(self):
+        return f"{self.batch_request_id} ({self.get_outcome_display()}, {self.attempts} verificări)"
+
+
 class Order(models.Model):
     """
     Reprezintă o comandă venită dintr-un Marketplace (ex: Trendyol).
@@ -260,6 +316,46 @@ class OrderLineItem(models.Model):
         return f"{self.sku} x {self.quantity} (Order: {self.order.platform_order_number})"
 
 
+class DemandFeature(models.Model):
+    """
+    Cererea pe SKU (other_sku gol) sau pe pereche de SKU-uri, per cont și canal,
+    cu descreștere exponențială în timp (vezi bundling_core.demand.DecayedDemand).
+    `weight` e raportat la DEMAND_EPOCH: o linie nouă doar adună la el.
+    """
+    account = models.ForeignKey(User, on_delete=models.CASCADE, related_name="demand_features")
+    channel = models.CharField(max_length=50)
+    sku = models.CharField(max_length=100)
+    other_sku = models.CharField(max_length=100, blank=True, default='')
+    weight = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Cerere SKU"
+        verbose_name_plural = "Cerere SKU-uri"
+        unique_together = ('account', 'channel', 'sku', 'other_sku')
+
+    def __str__(self):
+        key = f"{self.sku}+{self.other_sku}" if self.other_sku else self.sku
+        return f"{key} @ {self.channel}: {self.weight:.3g}"
+
+
+class DemandBuild(models.Model):
+    """
+    Marchează că tabela DemandFeature a contului a fost construită din istoric.
+    Separat de rânduri: un cont ale cărui linii nu produc nicio cerere rămâne fără
+    rânduri, dar nu trebuie reconstruit la fiecare linie nouă.
+    """
+    account = models.OneToOneField(User, on_delete=models.CASCADE, related_name="demand_build")
+    built_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Construire cerere"
+        verbose_name_plural = "Construiri cerere"
+
+    def __str__(self):
+        return f"{self.account} @ {self.built_at:%Y-%m-%d %H:%M}"
+
+
 class ReturnRequest(models.Model):
     """
     Reprezintă o cerere de retur (Claim) de la Trendyol.
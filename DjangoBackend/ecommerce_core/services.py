@@ -27,15 +27,18 @@ from .bundling_core import (
     CloudinaryConfig,
     PricingConfig,
     generate_bundles,
-    read_orders,
-    read_products,
 )
 from .bundling_core.ai import (
-    enrich_bundle_with_marketing_text,
+    enrich_bundles_in_batches,
     rank_bundles,
 )
-from .bundling_core.images import download_product_image, generate_collage, upload_to_cloudinary
+from .bundling_core.image_cache import ImageCache
+from .bundling_core.images import download_product_images, render_collages
 from .bundling_core.llm_client import LLMClient
+from .bundling_core.uploads import CloudinaryUploader, LocalFilesystemUploader, iter_upload_collages
+from .bundle_cache import CacheLLMResponses, CacheUploadIndex, GenerationCache
+from .bundle_sources import select_bundle_source
+from .bundle_stock import coalesce_bundle_stock
 
 warnings.filterwarnings("ignore")
 logger = logging.getLogger(__name__)
@@ -181,74 +184,77 @@ class InvoiceProcessorService:
         
         print(f"\n🔍 [PROCESS] Încep procesarea a {len(items_to_process)} produse valide...\n")
 
-        for i, p in enumerate(items_to_process, 1):
-            sku_curat = p.cod.strip()
-            print(f"--- Produs {i}/{len(items_to_process)}: [{sku_curat}] {p.nume} ---")
+        # Fiecare produs are tranzacția lui (research-ul durează), dar stocul bundle-urilor
+        # se recalculează o singură dată, după tot importul
+        with coalesce_bundle_stock():
+            for i, p in enumerate(items_to_process, 1):
+                sku_curat = p.cod.strip()
+                print(f"--- Produs {i}/{len(items_to_process)}: [{sku_curat}] {p.nume} ---")
 
-            try:
-                # CAZ 1: Există
-                variant = ProductVariant.objects.get(sku__iexact=sku_curat)
-                print(f"   ✅ [DB Check] Produsul există deja (Stoc curent: {variant.stock}). Fac update...")
+                try:
+                    # CAZ 1: Există
+                    variant = ProductVariant.objects.get(sku__iexact=sku_curat)
+                    print(f"   ✅ [DB Check] Produsul există deja (Stoc curent: {variant.stock}). Fac update...")
                 
-                with transaction.atomic():
-                    variant.stock += p.bucati_totale
-                    variant.save()
+                    with transaction.atomic():
+                        variant.stock += p.bucati_totale
+                        variant.save()
                 
-                print(f"   ✅ [DB Update] Stoc actualizat la {variant.stock}.")
-                updated_products_log.append({
-                    "sku": variant.sku,
-                    "name": variant.product.title,
-                    "added": p.bucati_totale,
-                    "new_stock": variant.stock
-                })
-
-            except ProductVariant.DoesNotExist:
-                # CAZ 2: Nou -> Research
-                print(f"   🆕 [DB Check] Produsul NU există. Încep procedura de creare...")
+                    print(f"   ✅ [DB Update] Stoc actualizat la {variant.stock}.")
+                    updated_products_log.append({
+                        "sku": variant.sku,
+                        "name": variant.product.title,
+                        "added": p.bucati_totale,
+                        "new_stock": variant.stock
+                    })
+
+                except ProductVariant.DoesNotExist:
+                    # CAZ 2: Nou -> Research
+                    print(f"   🆕 [DB Check] Produsul NU există. Încep procedura de creare...")
                 
-                pret_net = p.valoare_totala_fara_tva / p.bucati_totale
-                pret_final = pret_net * 1.21 
+                    pret_net = p.valoare_totala_fara_tva / p.bucati_totale
+                    pret_final = pret_net * 1.21 
                 
-                # Research
-                marketing = self._research_product_text(p.nume)
-                image_url = self._search_product_image(p.nume)
+                    # Research
+                    marketing = self._research_product_text(p.nume)
+                    image_url = self._search_product_image(p.nume)
                 
-                nume_split = p.nume.split(" ")
-                brand_detectat = nume_split[0] if len(nume_split) > 0 else "Generic"
-
-                print(f"   💾 [DB Save] Salvez produsul nou în baza de date...")
-                with transaction.atomic():
-                    product_parent, _ = Product.objects.get_or_create(
-                        sku=sku_curat, 
-                        account=self.user,
-                        defaults={
-                            "title": marketing.nume_comercial or p.nume,
-                            "brand": brand_detectat,
-                            "description": marketing.descriere or ""
-                        }
-                    )
-
-                    new_variant = ProductVariant.objects.create(
-                        product=product_parent,
-                        sku=sku_curat,
-                        barcode=sku_curat,
-                        stock=p.bucati_totale,
-                        price=round(pret_final, 2),
-                        images=[image_url] if image_url else [],
-                        attributes={"sursa": "import_pdf_auto"}
-                    )
+                    nume_split = p.nume.split(" ")
+                    brand_detectat = nume_split[0] if len(nume_split) > 0 else "Generic"
+
+                    print(f"   💾 [DB Save] Salvez produsul nou în baza de date...")
+                    with transaction.atomic():
+                        product_parent, _ = Product.objects.get_or_create(
+                            sku=sku_curat, 
+                            account=self.user,
+                            defaults={
+                                "title": marketing.nume_comercial or p.nume,
+                                "brand": brand_detectat,
+                                "description": marketing.descriere or ""
+                            }
+                        )
+
+                        new_variant = ProductVariant.objects.create(
+                            product=product_parent,
+                            sku=sku_curat,
+                            barcode=sku_curat,
+                            stock=p.bucati_totale,
+                            price=round(pret_final, 2),
+                            images=[image_url] if image_url else [],
+                            attributes={"sursa": "import_pdf_auto"}
+                        )
                 
-                print(f"   ✨ [Success] Produs creat cu ID: {new_variant.id}")
-                created_products_log.append({
-                    "sku": new_variant.sku,
-                    "name": product_parent.title,
-                    "price": new_variant.price,
-                    "stock": new_variant.stock,
-                    "image": image_url
-                })
+                    print(f"   ✨ [Success] Produs creat cu ID: {new_variant.id}")
+                    created_products_log.append({
+                        "sku": new_variant.sku,
+                        "name": product_parent.title,
+                        "price": new_variant.price,
+                        "stock": new_variant.stock,
+                        "image": image_url
+                    })
                 
-                # Cu Tavily nu e nevoie de pauze lungi, e un API comercial
-                time.sleep(0.5)
+                    # Cu Tavily nu e nevoie de pauze lungi, e un API comercial
+                    time.sleep(0.5)
 
         print("\n✅ [DONE] Procesare finalizată.")
         return {
@@ -261,21 +267,23 @@ class InvoiceProcessorService:
             "updated_products": updated_products_log
         }
 
-def run_bundle_generation_service(limit=5):
+def run_bundle_generation_service(limit=5, user=None, progress=None):
     """
     Generează sugestii de pachete folosind logica AI și Image Processing.
     Returnează un JSON gata de trimis la frontend.
     
     Args:
         limit (int): Numărul maxim de sugestii de returnat (pentru a evita timeout-ul).
+        user: Contul pentru care citim catalogul și comenzile din DB. Dacă lipsește
+            (sau contul nu are încă produse), folosim data.xlsx.
+        progress: Opțional (ex: BundleJobProgress). Primește etapele prin
+            progress.stage(cod, mesaj) și fiecare sugestie prin progress.suggestion(dict)
+            imediat ce e gata, înaintea rezultatului final.
     """
     
-    # 1. Configurare Căi și Mediu
-    # Presupunem că data.xlsx este în rădăcina proiectului
-    excel_path = os.path.join(settings.BASE_DIR, 'data.xlsx')
-    
-    if not os.path.exists(excel_path):
-        logger.error(f"Nu am găsit data.xlsx la: {excel_path}")
+    # 1. Alegerea sursei de date
+    source = select_bundle_source(user)
+    if source is None:
         return []
 
     # 2. Configurare Parametri (Preluati din env sau hardcodati temporar)
@@ -290,138 +298,199 @@ def run_bundle_generation_service(limit=5):
         api_secret=settings.CLOUDINARY_API_SECRET,
     )
 
-    # 3. Citirea Datelor
-    try:
-        # TODO Pe viitor: În loc de read_products, poți interoga DB-ul Django: ProductVariant.objects.all()
-        # și să le mapezi la obiectele așteptate de bundling_core.
-        products = read_products(excel_path)
-        orders = read_orders(excel_path)
+    # 3-5. Generare + Ranking, refolosite din Redis cât timp amprenta datelor nu se schimbă
+    top_n = 20 # Luăm top 20 pentru analiză
+    generation_cache = GenerationCache()
+    ranking_key = generation_cache.key(source.fingerprint(), pricing_cfg, bundle_cfg, top_n)
+    cached_ranking = generation_cache.get_ranking(ranking_key)
+
+    if cached_ranking is not None:
+        _report_stage(progress, "rank", "Bundle-uri refolosite din cache (catalogul și comenzile nu s-au schimbat).")
+        raw_bundles, ranked_data = cached_ranking
+    else:
+        # 3. Citirea Datelor (comenzile: doar cele noi, dacă avem indexul din rularea anterioară)
+        _report_stage(progress, "load", "Citire catalog și comenzi...")
+        try:
+            inputs = source.load(previous=generation_cache.get_order_state(user))
+            generation_cache.set_order_state(user, inputs)
+        except Exception as e:
+            logger.error(f"Eroare la citirea datelor: {e}")
+            raise e
+
+        # 4. Generare Pachete (Logica Core)
+        _report_stage(progress, "generate", f"Generare bundle-uri brute din {len(inputs.products)} produse...")
+        raw_bundles = generate_bundles(
+            inputs.products,
+            pricing_cfg,
+            bundle_cfg,
+            cooccurrence=inputs.cooccurrence,
+            demand=inputs.demand,
+        )
         
-        # Mapare pentru acces rapid la descrieri originale
-        products_by_sku = {p.sku: p for p in products}
-    except Exception as e:
-        logger.error(f"Eroare la citirea datelor: {e}")
-        raise e
-
-    # 4. Generare Pachete (Logica Core)
-    logger.info("Generare bundle-uri brute...")
-    raw_bundles = generate_bundles(products, pricing_cfg, bundle_cfg, orders=orders)
-    
-    # Păstrăm doar cele cu stoc pozitiv
-    valid_bundles = [b for b in raw_bundles if getattr(b, "max_bundle_stock", 0) > 0]
-    
-    # 5. Ranking & Sortare
-    logger.info("Ranking bundle-uri...")
-    ranked_data = rank_bundles(valid_bundles, orders=orders, top_n=20) # Luăm top 20 pentru analiză
+        # Păstrăm doar cele cu stoc pozitiv
+        valid_bundles = [b for b in raw_bundles if getattr(b, "max_bundle_stock", 0) > 0]
+        
+        # 5. Ranking & Sortare
+        _report_stage(progress, "rank", f"Ranking {len(valid_bundles)} bundle-uri...")
+        ranked_data = rank_bundles(valid_bundles, demand=source.ranking_demand(inputs), top_n=top_n)
+        generation_cache.set_ranking(ranking_key, raw_bundles, ranked_data)
+
     top_bundles = [b for b, score in ranked_data]
     
     # Limităm procesarea grea (AI + Imagini) la primele 'limit' rezultate
     top_bundles = top_bundles[:limit]
 
+    # Produsele din bundle-urile selectate (pentru imagini și descrieri de rezervă)
+    products = list({id(item.product): item.product for bundle in top_bundles for item in bundle.items}.values())
+    products_by_sku = {p.sku: p for p in products}
+
     # 6. Procesare Imagini & AI (Heavy Lifting)
     
     # Pregătim imaginile produselor (Download o singură dată)
-    product_images_cache = {}
     # Descărcăm doar imaginile necesare pentru bundle-urile selectate
     needed_skus = set()
     for bundle in top_bundles:
         for item in bundle.items:
             needed_skus.add(item.product.sku)
             
-    logger.info("Descărcare imagini produse...")
-    for product in products:
-        if product.sku in needed_skus:
-            try:
-                product_images_cache[product.sku] = download_product_image(product)
-            except Exception as e:
-                logger.warning(f"Nu am putut descărca imaginea pentru {product.sku}: {e}")
+    _report_stage(progress, "images", f"Descărcare imagini pentru {len(needed_skus)} produse...")
+    # Imaginile descărcate rămân pe disc (micșorate), deci rulările următoare nu le mai descarcă
+    image_cache = ImageCache(os.path.join(settings.BASE_DIR, ".bundling_cache", "images"))
+    product_images_cache = download_product_images(
+        [product for product in products if product.sku in needed_skus],
+        cache=image_cache,
+    )
 
     # Inițializare AI Client
     ai_client = LLMClient.from_env()
 
-    results = []
+    results = {}
     
-    # Folder temporar pentru colaje
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for idx, bundle in enumerate(top_bundles):
-            logger.info(f"Procesare bundle {idx+1}/{len(top_bundles)}: {bundle.sku}")
-            
-            # A. Generare Text Marketing (AI)
-            marketing_title = bundle.title
-            marketing_desc = ""
-            
+    # Rezolvăm variantele din DB pentru toate componentele o singură dată
+    # Atenție: Aici presupunem că SKU-ul din Excel este identic cu cel din DB
+    variants_by_sku = resolve_variants_by_sku(
+        (item.product.sku for bundle in top_bundles for item in bundle.items),
+        account=user,
+    )
+
+    # A. Generare Text Marketing (AI) - înaintea colajelor, care afișează titlul final
+    # Mai multe bundle-uri per apel LLM (loturile rulează în paralel); răspunsurile
+    # pentru prompturi identice vin din Redis.
+    enriched_bundles = [None] * len(top_bundles)
+    if ai_client:
+        _report_stage(progress, "marketing", f"Generare texte marketing pentru {len(top_bundles)} bundle-uri...")
+        enriched_bundles = enrich_bundles_in_batches(
+            top_bundles,
+            products,
+            max_workers=settings.BUNDLE_LLM_CONCURRENCY,
+            cache=CacheLLMResponses(),
+        )
+
+    marketing = []
+    for idx, bundle in enumerate(top_bundles):
+        enriched = enriched_bundles[idx]
+        if enriched is not None:
+            marketing.append((enriched.title, enriched.description))
+        else:
             if ai_client:
-                try:
-                    # Funcția enrich modifică bundle-ul in-place sau returnează unul nou
-                    enriched = enrich_bundle_with_marketing_text(bundle, products, client=ai_client)
-                    marketing_title = enriched.title
-                    marketing_desc = enriched.description
-                except Exception as e:
-                    logger.warning(f"AI enrichment failed: {e}")
-                    marketing_desc = _fallback_description(bundle, products_by_sku)
-            else:
-                marketing_desc = _fallback_description(bundle, products_by_sku)
+                logger.warning(f"AI enrichment failed for {bundle.sku}")
+            marketing.append((bundle.title, _fallback_description(bundle, products_by_sku)))
+
+    def _finish(idx, collage_url):
+        # C. Formatare pentru Frontend (trimisă imediat mai departe, dacă avem progress)
+        marketing_title, marketing_desc = marketing[idx]
+        suggestion = _suggestion_payload(
+            idx, top_bundles[idx], marketing_title, marketing_desc, collage_url, variants_by_sku
+        )
+        results[idx] = suggestion
+        if progress is not None:
+            progress.suggestion(suggestion)
 
-            # B. Generare Colaj & Upload
-            collage_url = None
-            if cloud_cfg.is_configured:
-                try:
-                    collage_path = generate_collage(bundle, product_images_cache, collage_cfg, temp_dir)
-                    collage_url = upload_to_cloudinary(collage_path, cloud_cfg)
-                except Exception as e:
-                    logger.error(f"Image generation failed for {bundle.sku}: {e}")
-            
-            # C. Formatare pentru Frontend
-            # Calculăm componentele pentru request-ul de creare
-            components_payload = [
-                {
-                    "variant_id": _find_variant_id_by_sku(item.product.sku), # Helper necesar
-                    "sku": item.product.sku,
-                    "quantity": item.quantity,
-                    "name": item.product.name
-                }
-                for item in bundle.items
-            ]
-            
-            # Calculăm economia
-            savings = bundle.base_price - bundle.final_price
+    # Folder temporar pentru colaje
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # B. Generare Colaje (în paralel) & Upload pe măsură ce sunt gata
+        uploader = _collage_uploader(cloud_cfg)
+        if uploader is not None:
+            _report_stage(progress, "collages", f"Generare și upload colaje pentru {len(top_bundles)} bundle-uri...")
+            for idx, collage_url in iter_upload_collages(
+                render_collages(top_bundles, product_images_cache, collage_cfg, temp_dir),
+                uploader,
+                index=CacheUploadIndex(),
+                max_workers=settings.BUNDLE_UPLOAD_CONCURRENCY,
+            ):
+                _finish(idx, collage_url)
+        else:
+            for idx in range(len(top_bundles)):
+                _finish(idx, None)
+
+    return [results[idx] for idx in sorted(results)]
+
+def _report_stage(progress, stage, message):
+    logger.info(message)
+    if progress is not None:
+        progress.stage(stage, message)
+
+def _suggestion_payload(idx, bundle, marketing_title, marketing_desc, collage_url, variants_by_sku):
+    # Calculăm componentele pentru request-ul de creare
+    components_payload = [
+        {
+            "variant_id": _variant_id(variants_by_sku, item.product.sku),
+            "sku": item.product.sku,
+            "quantity": item.quantity,
+            "name": item.product.name
+        }
+        for item in bundle.items
+    ]
+    
+    # Calculăm economia
+    savings = bundle.base_price - bundle.final_price
 
-            aux = bundle.base_price
-            bundle.base_price = bundle.final_price
-            bundle.final_price = aux
+    aux = bundle.base_price
+    bundle.base_price = bundle.final_price
+    bundle.final_price = aux
 
-            results.append({
-                "id": f"sugg-{idx}-{bundle.sku}",
-                "sku": bundle.sku, # SKU-ul sugerat
-                
-                # Date pentru UI
-                "title": marketing_title,
-                "description": marketing_desc,
-                "products": [item.product.name for item in bundle.items],
-                "imageUrl": collage_url,
-                
-                # Date Financiare
-                "price": float(bundle.final_price),
-                "base_price": float(bundle.base_price),
-                "savings": round(float(savings), 2),
-                "score": float(getattr(bundle, 'score', 0)),
-                
-                # Payload complet pentru butonul "Creează Bundle" din Frontend
-                "create_payload": {
-                    "sku": bundle.sku,
-                    "title": marketing_title,
-                    "description": marketing_desc,
-                    "price": float(bundle.final_price),
-                    "list_price": float(bundle.base_price),
-                    "images": [collage_url] if collage_url else [],
-                    # Frontend-ul va trebui să mapeze SKU-urile la ID-uri reale dacă helper-ul de mai jos nu le găsește
-                    "components": [
-                        {"sku": c['sku'], "quantity": c['quantity']} for c in components_payload
-                    ]
-                }
-            })
+    return {
+        "id": f"sugg-{idx}-{bundle.sku}",
+        "sku": bundle.sku, # SKU-ul sugerat
+        
+        # Date pentru UI
+        "title": marketing_title,
+        "description": marketing_desc,
+        "products": [item.product.name for item in bundle.items],
+        "imageUrl": collage_url,
+        
+        # Date Financiare
+        "price": float(bundle.final_price),
+        "base_price": float(bundle.base_price),
+        "savings": round(float(savings), 2),
+        "score": float(getattr(bundle, 'score', 0)),
+        
+        # Payload complet pentru butonul "Creează Bundle" din Frontend
+        "create_payload": {
+            "sku": bundle.sku,
+            "title": marketing_title,
+            "description": marketing_desc,
+            "price": float(bundle.final_price),
+            "list_price": float(bundle.base_price),
+            "images": [collage_url] if collage_url else [],
+            # Frontend-ul va trebui să mapeze SKU-urile la ID-uri reale dacă helper-ul de mai jos nu le găsește
+            "components": [
+                {"sku": c['sku'], "quantity": c['quantity']} for c in components_payload
+            ]
+        }
+    }
 
-    return results
+def _collage_uploader(cloud_cfg):
+    """
+    Cloudinary în producție; un folder local dacă BUNDLE_COLLAGE_LOCAL_DIR e setat (testare locală).
+    Fără niciuna din ele nu generăm colaje.
+    """
+    local_dir = settings.BUNDLE_COLLAGE_LOCAL_DIR
+    if local_dir:
+        return LocalFilesystemUploader(local_dir, base_url=settings.BUNDLE_COLLAGE_LOCAL_URL)
+    if cloud_cfg.is_configured:
+        return CloudinaryUploader(cloud_cfg)
+    return None
 
 def _fallback_description(bundle, products_by_sku):
     """Generare descriere simplă dacă AI-ul nu e disponibil."""
@@ -436,15 +505,21 @@ def _fallback_description(bundle, products_by_sku):
             descs.append(str(prod.description)[:100] + "...")
     return "\n".join(descs)
 
-def _find_variant_id_by_sku(sku):
+def _variant_id(variants_by_sku, sku):
+    variant = variants_by_sku.get(sku)
+    return variant.id if variant else None
+
+def resolve_variants_by_sku(skus, account=None):
     """
-    Încearcă să găsească ID-ul variantei din DB pe baza SKU-ului din Excel.
-    Returnează None dacă nu găsește (Frontend-ul va trebui să gestioneze asta).
+    Rezolvă toate SKU-urile cerute într-un singur query (sku__in) și întoarce {sku: ProductVariant}.
+    SKU-urile care nu există în DB lipsesc din dicționar (Frontend-ul va trebui să gestioneze asta).
+    Dacă primim `account`, căutăm doar în produsele acelui cont.
     """
-    from ecommerce_core.models import ProductVariant
-    try:
-        # Atenție: Aici presupunem că SKU-ul din Excel este identic cu cel din DB
-        variant = ProductVariant.objects.filter(sku=sku).first()
-        return variant.id if variant else None
-    except:
-        return None
\ No newline at end of file
+    wanted = {str(sku) for sku in skus if sku}
+    if not wanted:
+        return {}
+
+    queryset = ProductVariant.objects.filter(sku__in=wanted)
+    if account is not None:
+        queryset = queryset.filter(product__account=account)
+    return {variant.sku: variant for variant in queryset}
@@ -2,6 +2,9 @@ from django.db.models.signals import post_save, m2m_changed, post_delete
 from django.dispatch import receiver
 from django.db import transaction
 from .models import ProductVariant, BundleComponent, MarketplaceListing, MarketplaceAccount, OrderLineItem
+from .bundle_stock import mark_bundles_changed, mark_components_changed
+from .demand import record_order_line
+from .marketplace_sync import trigger_marketplace_updates
 # Importăm dinamic pentru a evita circular imports
 from django.apps import apps
 
@@ -14,20 +17,10 @@ def product_variant_changed(sender, instance, created, **kwargs):
     """
 
     print("Signal: product_variant_changed triggered")
-    # 1. Propagare schimbare stoc către Bundle-uri părinte
+    # 1. Propagare schimbare stoc către Bundle-uri părinte: doar marcăm varianta;
+    # bundle-urile afectate se recalculează o singură dată, la commit (vezi bundle_stock)
     if instance.type == ProductVariant.Type.SIMPLE:
-        # Găsim toate bundle-urile care conțin acest produs
-        parent_bundles = ProductVariant.objects.filter(
-            bundle_components__component_variant=instance
-        ).distinct()
-        
-        print(f"Found {parent_bundles.count()} parent bundles for variant {instance.id}")
-        for bundle in parent_bundles:
-            new_stock = bundle.calculate_bundle_stock()
-            if bundle.stock != new_stock:
-                bundle.stock = new_stock
-                # Salvăm (asta va declanșa recursiv acest semnal pentru bundle, trimițând update la Trendyol)
-                bundle.save(update_fields=['stock', 'updated_at'])
+        mark_components_changed([instance.id])
 
     # 2. Notificare Marketplace (pentru produsul curent - fie el simplu sau bundle)
     print(f"Triggering marketplace update for variant {instance.id}")
@@ -40,23 +33,23 @@ def bundle_structure_changed(sender, instance, **kwargs):
     Dacă se schimbă structura unui bundle (se adaugă/șterge o componentă sau se schimbă cantitatea),
     recalculăm stocul bundle-ului.
     """
-    bundle = instance.bundle_variant
-    new_stock = bundle.calculate_bundle_stock()
-    if bundle.stock != new_stock:
-        bundle.stock = new_stock
-        bundle.save(update_fields=['stock', 'updated_at'])
+    mark_bundles_changed([instance.bundle_variant_id])
+
+@receiver(post_save, sender=OrderLineItem)
+def order_line_created(sender, instance, created, **kwargs):
+    """
+    O linie de comandă nouă actualizează cererea per SKU / pereche (DemandFeature).
+    Liniile existente se re-salvează doar la schimbare de status, deci nu le mai numărăm.
+    """
+    if created:
+        record_order_line(instance)
 
 def trigger_marketplace_update(variant):
     """
-    Trimite update la Celery doar dacă produsul este listat Activ.
+    Marchează listările active ale variantei în outbox-ul de stoc/preț;
+    trimiterea se face grupat, periodic (vezi marketplace_sync).
     """
-    active_listings = variant.listings.filter(status=MarketplaceListing.Status.ACTIVE)
-    
-    for listing in active_listings:
-        if listing.platform_account.platform == MarketplaceAccount.Platform.TRENDYOL:
-            from ecommerce_trendyol.tasks import update_trendyol_stock_price
-            # Folosind transaction.on_commit ne asigurăm că DB e updatat înainte să plece task-ul
-            transaction.on_commit(lambda: update_trendyol_stock_price.delay(listing_id=listing.id))
+    trigger_marketplace_updates([variant.id])
 
 # @receiver(post_save, sender=ProductVariant)
 # def trigger_marketplace_updates(sender, instance, created, **kwargs):
@@ -0,0 +1,30 @@
+import logging
+
+from celery import shared_task
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from .bundle_jobs import INFLIGHT_CACHE_PREFIX, RESULT_TTL, BundleJobProgress
+from .services import run_bundle_generation_service
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_bundle_suggestions_task(job_id, user_id, limit, result_key):
+    """
+    Rulează generarea de pachete în afara request-ului HTTP.
+    Sugestiile apar în starea jobului pe măsură ce sunt gata; la final, setul complet
+    se salvează sub cheia datelor de intrare, ca un apel identic să nu recalculeze.
+    """
+    progress = BundleJobProgress(job_id)
+    try:
+        user = User.objects.filter(pk=user_id).first() if user_id else None
+        suggestions = run_bundle_generation_service(limit=limit, user=user, progress=progress)
+        state = progress.complete(suggestions)
+        cache.set(result_key, state, timeout=RESULT_TTL)
+    except Exception as e:
+        logger.exception(f"Generarea de pachete a eșuat (job {job_id})")
+        progress.fail(e)
+    finally:
+        cache.delete(f"{INFLIGHT_CACHE_PREFIX}:{result_key}")
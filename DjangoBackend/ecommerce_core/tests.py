@@ -1,3 +1,97 @@
-from django.test import TestCase
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.test import SimpleTestCase
+
+from .bundling_core.ai import enrich_bundles_in_batches
+from .bundling_core.io import read_orders, read_products
+from .bundling_core.models import Bundle, BundleItem, Product
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "cache-ul Parquet are nevoie de pyarrow")
+class ExcelSidecarCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.excel_path = os.path.join(self.tmp.name, "data.xlsx")
+        with pd.ExcelWriter(self.excel_path, engine="openpyxl") as writer:
+            pd.DataFrame(
+                {
+                    "sku": ["A1", "B2", "C3"],
+                    "name": ["Gel", "Șampon", "Cremă"],
+                    "brand": ["X", "X", "Y"],
+                    "category": ["Baie", "", "Față"],
+                    "price_with_vat": [10.5, 20, None],
+                    "available_stock": [3, None, 7],
+                    "volume_qty": [250, None, 50.5],
+                    "units_per_pack": [2, None, 6],
+                    "image": ["a.jpg", None, "c.jpg"],
+                }
+            ).to_excel(writer, sheet_name="products", index=False)
+            pd.DataFrame(
+                {"order_id": [1, 1, 2], "product_sku": ["A1", "B2", "C3"], "quantity": [1, None, 4], "channel": ["T", "T", None]}
+            ).to_excel(writer, sheet_name="orders", index=False)
+
+    def _load(self, reader):
+        return reader(self.excel_path, use_cache=True, cache_dir=os.path.join(self.tmp.name, "cache"))
+
+    def test_warm_cache_returns_the_same_products(self):
+        cold = self._load(read_products)
+        warm = self._load(read_products)
+
+        self.assertEqual(cold, warm)
+        self.assertEqual([p.units_per_pack for p in warm], [2, None, 6])
+        self.assertIsInstance(warm[0].units_per_pack, int)
+        self.assertEqual(cold, read_products(self.excel_path))
+
+    def test_warm_cache_returns_the_same_orders(self):
+        self.assertEqual(self._load(read_orders), self._load(read_orders))
+
+
+class DictResponseCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries[key] = value
+
+
+@mock.patch.dict(os.environ, {"AI_PROVIDER": "openrouter", "AI_MODEL": "test"})
+class BatchEnrichmentCacheTests(SimpleTestCase):
+    def setUp(self):
+        product = Product("A1", "Gel", "X", "Baie", 10.0, 0.19, 10)
+        self.bundles = [
+            Bundle(f"A1-{n}", "", "X", "Baie", [BundleItem(product, n)], 10.0 * n, 9.0 * n, 0.19, n, 5, "")
+            for n in (2, 3, 4)
+        ]
+
+    def _reply(self, *positions):
+        return {"bundles": [{"id": str(pos), "title": f"Titlu {pos}", "description": "Descriere."} for pos in positions]}
+
+    def test_malformed_reply_is_not_cached_and_retry_reaches_the_llm(self):
+        cache = DictResponseCache()
+        replies = [{"bundles": "nu e o listă"}, self._reply(0, 1, 2)]
+        with mock.patch("ecommerce_core.bundling_core.llm_client._call_openrouter_json", side_effect=replies) as llm:
+            results = enrich_bundles_in_batches(self.bundles, [], cache=cache)
+
+        self.assertEqual(llm.call_count, 2)
+        self.assertEqual([bundle.title for bundle in results], ["Titlu 0", "Titlu 1", "Titlu 2"])
+        self.assertEqual(list(cache.entries.values()), [self._reply(0, 1, 2)])
+
+    def test_partial_reply_is_not_cached(self):
+        cache = DictResponseCache()
+        replies = [self._reply(0, 2), self._reply(1)]
+        with mock.patch("ecommerce_core.bundling_core.llm_client._call_openrouter_json", side_effect=replies) as llm:
+            results = enrich_bundles_in_batches(self.bundles, [], cache=cache)
+
+        self.assertEqual(llm.call_count, 2)
+        self.assertTrue(all(results))
+        # Doar răspunsul complet al reîncercării (lotul cu bundle-ul 1) ajunge în cache
+        self.assertEqual(list(cache.entries.values()), [self._reply(1)])
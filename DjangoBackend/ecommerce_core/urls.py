@@ -30,4 +30,5 @@ router.register(r'events', views.SystemEventViewSet, basename='system-events')
 urlpatterns = [
     path('', include(router.urls)),
     path('bundles/generate/', views.BundleGeneratorView.as_view(), name='generate-bundles'),
+    path('bundles/generate/<str:job_id>/', views.BundleGenerationJobView.as_view(), name='generate-bundles-job'),
     ]
\ No newline at end of file
@@ -1,6 +1,8 @@
 import os
 import tempfile
-from .services import InvoiceProcessorService, run_bundle_generation_service
+from django.utils import timezone
+from .services import InvoiceProcessorService, resolve_variants_by_sku
+from .bundle_jobs import get_job, start_bundle_generation
 from rest_framework import viewsets, permissions, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
@@ -8,11 +10,18 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from .models import Bundle, MarketplaceAccount, MarketplaceListing, Order, ReturnRequest, Product, ProductVariant, BundleComponent
 from .serializers import BundleSerializer, InvoiceUploadSerializer, MarketplaceAccountSerializer, MarketplaceListingSerializer, OrderSerializer, ReturnRequestSerializer, ProductVariantListSerializer, ProductVariantDetailSerializer
-from ecommerce_trendyol.tasks import publish_trendyol_listing, set_order_status_picking, set_order_status_invoiced, import_trendyol_products_task
+from ecommerce_trendyol.tasks import publish_trendyol_listings, set_order_status_picking, set_order_status_invoiced, import_trendyol_products_task
 from ecommerce_trendyol.services import TrendyolAPIService
 from .models import SystemEvent
 from .serializers import SystemEventSerializer
 
+def _as_pk(value):
+    """ID-urile pot veni ca string din JSON ("10"); in_bulk() întoarce chei int."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
 class ProductVariantViewSet(viewsets.ModelViewSet):
     """
     API principal pentru gestionarea catalogului de produse (PIM).
@@ -124,21 +133,25 @@ class ProductVariantViewSet(viewsets.ModelViewSet):
             if not components_data:
                  return Response({"error": "Un bundle trebuie să aibă cel puțin o componentă."}, status=400)
 
+            # Rezolvăm toate componentele din două query-uri (id__in + sku__in), nu câte un get() per componentă
+            requested_ids = [comp['variant_id'] for comp in components_data if comp.get('variant_id')]
+            variants_by_id = ProductVariant.objects.filter(id__in=requested_ids, product__account=user).in_bulk()
+            variants_by_sku = resolve_variants_by_sku(
+                (comp['sku'] for comp in components_data if 'sku' in comp),
+                account=user,
+            )
+
             for comp in components_data:
                 component_variant = None
                 
                 # Cazul A: Avem ID (ideal)
                 if 'variant_id' in comp and comp['variant_id']:
-                    try:
-                        component_variant = ProductVariant.objects.get(id=comp['variant_id'], product__account=user)
-                    except ProductVariant.DoesNotExist:
-                        pass
+                    component_variant = variants_by_id.get(_as_pk(comp['variant_id']))
                 
                 # Cazul B: Avem SKU (fallback din generator)
                 if not component_variant and 'sku' in comp:
-                    try:
-                        component_variant = ProductVariant.objects.get(sku=comp['sku'], product__account=user)
-                    except ProductVariant.DoesNotExist:
+                    component_variant = variants_by_sku.get(str(comp['sku']))
+                    if component_variant is None:
                         return Response({"error": f"Componenta cu SKU '{comp['sku']}' nu a fost găsită în contul tău. Importă produsele mai întâi!"}, status=400)
 
                 if component_variant:
@@ -222,24 +235,38 @@ class MarketplaceListingViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         """
-        Interceptăm crearea pentru a seta statusul și a porni task-ul Celery.
+        Interceptăm crearea pentru a seta statusul "PENDING_CREATE".
+        Nu pornim un task per listare: task-ul periodic publish_trendyol_listings trimite
+        în fiecare minut toate listările în așteptare, grupat per cont, deci un catalog
+        creat listare cu listare pleacă în câteva cereri (și câteva verificări de batch).
         """
-        # 1. Salvează listarea cu statusul inițial "PENDING_CREATE"
-        listing = serializer.save(
+        serializer.save(
             account=self.request.user, 
             status=MarketplaceListing.Status.PENDING_CREATE
         )
 
-        # 2. Pornește task-ul Celery specific platformei
-        if listing.platform_account.platform == MarketplaceAccount.Platform.TRENDYOL:
-            # Trimite ID-ul listării către task-ul Celery
-            publish_trendyol_listing.delay(listing_id=listing.id)
-            
         # elif listing.platform_account.platform == MarketplaceAccount.Platform.EMAG:
         #     publish_emag_listing.delay(listing_id=listing.id) # Pentru viitor
         
         # Nu așteptăm finalizarea task-ului. Răspundem imediat.
 
+    @action(detail=False, methods=['post'])
+    def publish(self, request):
+        """
+        Publică imediat, grupat, listările date: {"listing_ids": [...]}.
+        Ciornele și listările eșuate trec în așteptare; cele deja trimise nu se retrimit.
+        """
+        listing_ids = [_as_pk(pk) for pk in request.data.get('listing_ids', [])]
+        listings = self.get_queryset().filter(id__in=listing_ids)
+        listings.filter(
+            status__in=[MarketplaceListing.Status.DRAFT, MarketplaceListing.Status.FAILED]
+        ).update(status=MarketplaceListing.Status.PENDING_CREATE, platform_listing_id='', updated_at=timezone.now())
+        queued = list(listings.filter(status=MarketplaceListing.Status.PENDING_CREATE, platform_listing_id='').values_list('id', flat=True))
+
+        if queued:
+            publish_trendyol_listings.delay(queued)
+        return Response({"status": "processing", "queued": len(queued)})
+
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Gestionează vizualizarea comenzilor și acțiunile pe ele.
@@ -296,7 +323,7 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
         # Logica pentru a găsi AWB-ul depinde de platformă
         if order.platform_account.platform == MarketplaceAccount.Platform.TRENDYOL:
             try:
-                service = TrendyolAPIService(user=order.account, account_id=order.platform_account.id)
+                service = TrendyolAPIService.for_account(order.platform_account)
                 
                 # Trebuie să găsim tracking number-ul. 
                 # În modelul tău Order nu ai stocat explicit 'cargoTrackingNumber'.
@@ -352,7 +379,7 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
             # Putem face asta asincron prin Celery, sau sincron. 
             # Pentru feedback rapid la user, o facem sincron acum, dar ideal e Celery.
             try:
-                service = TrendyolAPIService(user=order.account, account_id=order.platform_account.id)
+                service = TrendyolAPIService.for_account(order.platform_account)
                 service.cancel_order_item(
                     package_id=order.platform_package_id,
                     line_item_id=line_item.platform_order_line_id, # ID-ul de platformă
@@ -438,23 +465,48 @@ class BundleViewSet(viewsets.ModelViewSet):
     serializer_class = BundleSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+def _bundle_job_response(state):
+    status = state.get("status")
+    suggestions = state.get("suggestions", [])
+    return Response({
+        "status": "success" if status == "completed" else status,
+        "job_id": state.get("job_id"),
+        "stage": state.get("stage"),
+        "message": state.get("message"),
+        "cached": state.get("cached", False),
+        "count": len(suggestions),
+        "suggestions": suggestions
+    }, status=200 if status in ("completed", "error") else 202)
+
 class BundleGeneratorView(APIView):
+    """
+    POST pornește generarea ca job Celery și răspunde imediat (202) cu job_id-ul.
+    Dacă datele de intrare nu s-au schimbat de la ultima rulare, răspunde direct (200) cu rezultatul salvat.
+    """
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         try:
             limit = int(request.data.get('limit', 5))
-            suggestions = run_bundle_generation_service(limit=limit)
-            return Response({
-                "status": "success",
-                "count": len(suggestions),
-                "suggestions": suggestions
-            })
+            state = start_bundle_generation(request.user, limit)
+            return _bundle_job_response(state)
         except Exception as e:
             # Log error for debug
             import traceback
             traceback.print_exc()
             return Response({"error": f"Eroare generare: {str(e)}"}, status=500)
+
+class BundleGenerationJobView(APIView):
+    """
+    GET: starea unui job de generare + sugestiile gata până acum (pentru polling din frontend).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        state = get_job(job_id)
+        if state is None or state.get("user_id") != request.user.pk:
+            return Response({"error": "Job inexistent sau expirat."}, status=404)
+        return _bundle_job_response(state)
         
 class SystemEventViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = SystemEvent.objects.all()
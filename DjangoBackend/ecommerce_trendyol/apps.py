@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EcommerceTrendyolConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecommerce_trendyol'
+
+    def ready(self):
+        import ecommerce_trendyol.signals
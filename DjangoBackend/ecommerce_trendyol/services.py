@@ -1,9 +1,18 @@
 import requests
 import base64
 import logging
+import threading
+import time
 from django.conf import settings
-from datetime import datetime, timezone
+from django.core.cache import cache
+from django.db import transaction
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from ecommerce_core.models import Order, OrderLineItem, ProductVariant, MarketplaceAccount
+from ecommerce_core.bundle_stock import reserve_stock
+from ecommerce_core.demand import record_order_lines
+from . import transport
 
 logger = logging.getLogger(__name__)
 
@@ -16,20 +25,71 @@ class TrendyolAPIService:
     # URL-uri de bază
     BASE_URL_PRODUCT = "https://apigw.trendyol.com/integration/product"
     BASE_URL_SELLER = "https://apigw.trendyol.com/integration/product/sellers"
+    BASE_URL_INVENTORY = "https://apigw.trendyol.com/integration/inventory/sellers"
+
+    # Numărul maxim de produse acceptat într-o cerere price-and-inventory
+    STOCK_PRICE_BATCH_LIMIT = 1000
+    # Numărul maxim de produse într-o cerere de creare produse
+    CREATE_PRODUCTS_BATCH_LIMIT = 1000
+
+    # Polling comenzi: maxim 200 de pachete pe pagină, interval startDate-endDate de maxim 2 săptămâni
+    ORDERS_PAGE_SIZE = 200
+    ORDERS_MAX_RANGE = timedelta(days=14)
+
+    # Importul catalogului: produse pe pagină și pagini cerute în paralel
+    PRODUCTS_PAGE_SIZE = 100
+    PRODUCT_FETCH_WORKERS = 4
 
     
-    def __init__(self, user, account_id: int):
+    def __init__(self, user, account_id: int, account: MarketplaceAccount = None):
         """
         Initializează serviciul pentru un utilizator specific ȘI un cont specific.
+        Dacă apelantul are deja contul încărcat (ex: listing.platform_account), îl poate
+        da direct și nu se mai face nicio interogare; `user` poate lipsi în acest caz.
+        Pentru refolosirea instanțelor între task-uri, vezi `cached` / `for_account`.
         """
-        self.user = user
+        self._user = user
         self.account_id = account_id
-        self.account = self._get_account()
+        self.account = self._check_account(account) if account is not None else self._get_account()
         self.headers = self._get_auth_headers()
         
         # Construim URL-ul specific seller-ului
         self.seller_base_url = f"{self.BASE_URL_SELLER}/{self.account.seller_id}"
 
+    @property
+    def user(self):
+        return self._user if self._user is not None else self.account.user
+
+    @classmethod
+    def cached(cls, user, account_id: int):
+        """
+        Ca TrendyolAPIService(user, account_id), dar refolosește instanța din registrul
+        procesului cât timp contul nu s-a schimbat (fără interogare, fără header-e noi).
+        """
+        account_id = int(account_id)
+        version, service = _registry_get(account_id)
+        if service is None:
+            service = _registry_put(cls(user, account_id), version)
+        elif service.account.user_id != user.id:
+            logger.error(f"Contul Trendyol cu ID={account_id} nu aparține utilizatorului {user.id}")
+            raise Exception(f"Contul Marketplace (ID: {account_id}) nu a fost găsit sau nu aveți permisiunea.")
+        return service
+
+    @classmethod
+    def for_account(cls, account: MarketplaceAccount):
+        """Serviciul pentru un cont deja încărcat (ex: listing.platform_account), cu zero interogări."""
+        version, service = _registry_get(account.id)
+        if service is None:
+            service = _registry_put(cls(None, account.id, account=account), version)
+        return service
+
+    def _check_account(self, account):
+        if account.id != self.account_id or account.platform != MarketplaceAccount.Platform.TRENDYOL:
+            raise Exception(f"Contul Marketplace (ID: {account.id}) nu este un cont Trendyol.")
+        if self._user is not None and account.user_id != self._user.id:
+            raise Exception(f"Contul Marketplace (ID: {account.id}) nu a fost găsit sau nu aveți permisiunea.")
+        return account
+
     def _get_account(self):
         """
         Prelucrează contul Trendyol specific cerut de utilizator.
@@ -37,12 +97,12 @@ class TrendyolAPIService:
         try:
             account = MarketplaceAccount.objects.get(
                 id=self.account_id,
-                user=self.user, 
+                user=self._user, 
                 platform=MarketplaceAccount.Platform.TRENDYOL
             )
             return account
         except MarketplaceAccount.DoesNotExist:
-            logger.error(f"Contul Trendyol cu ID={self.account_id} nu a fost găsit SAU nu aparține utilizatorului {self.user.id}")
+            logger.error(f"Contul Trendyol cu ID={self.account_id} nu a fost găsit SAU nu aparține utilizatorului {self._user.id}")
             raise Exception(f"Contul Marketplace (ID: {self.account_id}) nu a fost găsit sau nu aveți permisiunea.")
 
     def _get_auth_headers(self):
@@ -68,12 +128,14 @@ class TrendyolAPIService:
         """
         url = f"{base_url}{endpoint}"
         try:
-            response = requests.request(
+            # Sesiune per cont, rate limit comun worker-ilor, reîncercări la 429/5xx
+            response = transport.send(
+                self.account_id,
                 method, 
                 url, 
                 headers=self.headers, 
                 params=params, 
-                json=json_data,
+                json_data=json_data,
                 timeout=15 # Adăugăm un timeout de 15 secunde
             )
             response.raise_for_status() # Aruncă excepție pentru status codes 4xx/5xx
@@ -122,6 +184,15 @@ class TrendyolAPIService:
         # Folosim URL-ul specific seller-ului
         return self._make_request("POST", self.seller_base_url, "/products", json_data=payload)
 
+    def update_price_and_inventory(self, payload: dict):
+        """
+        Actualizează stocul și prețul pentru mai multe produse (max. STOCK_PRICE_BATCH_LIMIT per cerere).
+        (POST /integration/inventory/sellers/{sellerId}/products/price-and-inventory)
+        """
+        logger.info(f"Update stoc/preț (cont {self.account_id}): {len(payload.get('items', []))} produse")
+        base_url_inv = f"{self.BASE_URL_INVENTORY}/{self.account.seller_id}"
+        return self._make_request("POST", base_url_inv, "/products/price-and-inventory", json_data=payload)
+
     def get_batch_status(self, batch_id: str):
         """
         Verifică statusul unui batch request.
@@ -130,134 +201,227 @@ class TrendyolAPIService:
         logger.info(f"Verificare batch (cont {self.account_id}): {batch_id}")
         return self._make_request("GET", self.seller_base_url, f"/products/batch-requests/{batch_id}")
     
+    ORDER_UPDATE_FIELDS = [
+        'account', 'platform_account', 'platform_order_number', 'total_price', 'currency',
+        'customer_first_name', 'customer_last_name', 'customer_email',
+        'shipping_address', 'invoice_address', 'status', 'order_date',
+    ]
+
     def process_order_data(self, order_data: dict):
         """
         Procesează datele unei comenzi (venite din Webhook sau Polling)
         și le salvează/actualizează în baza de date locală.
         """
-        package_id = str(order_data.get('id')) # shipmentPackageId
-        order_number = str(order_data.get('orderNumber'))
-        
-        # Conversie dată (Trendyol trimite timestamp în milisecunde)
-        timestamp = order_data.get('orderDate', 0)
-        order_date = datetime.fromtimestamp(timestamp / 1000.0, tz=timezone.utc)
-
-        # 1. Creare sau Actualizare Comandă (Order)
-        order, created = Order.objects.update_or_create(
-            platform_package_id=package_id,
-            defaults={
-                'account': self.user,
-                'platform_account': self.account,
-                'platform_order_number': order_number,
-                'total_price': order_data.get('totalPrice', 0),
-                'currency': order_data.get('currencyCode', 'RON'),
-                'customer_first_name': order_data.get('customerFirstName', ''),
-                'customer_last_name': order_data.get('customerLastName', ''),
-                'customer_email': order_data.get('customerEmail', ''),
-                'shipping_address': order_data.get('shipmentAddress', {}),
-                'invoice_address': order_data.get('invoiceAddress', {}),
-                'status': order_data.get('status', 'Unknown'),
-                'order_date': order_date
-            }
-        )
-
-        logger.info(f"{'Comandă nouă creată' if created else 'Comandă actualizată'}: {order_number} (Pkg: {package_id})")
-
-        # 2. Procesare Linii Comandă (Lines)
-        lines = order_data.get('lines', [])
-        
-        # Păstrăm un set cu ID-urile liniilor curente pentru a șterge ce nu mai există (caz rar la update)
-        current_line_ids = []
+        return self.process_orders_page([order_data])[0]
 
-        for line in lines:
-            line_id = str(line.get('id')) # orderLineId
+    @transaction.atomic
+    def process_orders_page(self, packages: list):
+        """
+        Salvează o pagină de pachete Trendyol (ex: un răspuns de la get_orders) cu un
+        număr fix de interogări, indiferent câte comenzi și linii are pagina:
+        comenzile cu un singur upsert, liniile existente / variantele cu câte un `__in`,
+        liniile noi cu bulk_create, statusurile schimbate cu bulk_update.
 
-            existing_line = OrderLineItem.objects.filter(
-                platform_order_line_id=line_id, 
-                order=order
-            ).first()
+        Totul într-o tranzacție: comenzile nu rămân salvate pe jumătate, iar stocul
+        (rezervat o singură dată per linie nouă), bundle-urile afectate și outbox-ul
+        marketplace se actualizează o singură dată, la commit.
+        Întoarce comenzile (Order) în ordinea pachetelor primite.
+        """
+        # Un pachet care apare de două ori în pagină: contează ultima versiune
+        packages_by_id = {str(data.get('id')): data for data in packages} # shipmentPackageId
+        if not packages_by_id:
+            return []
 
-            if existing_line:
-                # Opțional: Putem actualiza statusul, dar NU scădem stocul din nou
-                if existing_line.status != line.get('orderLineItemStatusName'):
-                    existing_line.status = line.get('orderLineItemStatusName')
-                    existing_line.save()
-                continue # Trecem la următoarea linie, stocul e deja rezolvat
+        # 1. Creare sau Actualizare Comenzi (Order), într-un singur INSERT ... ON CONFLICT
+        Order.objects.bulk_create(
+            [self._order_from_package(package_id, data) for package_id, data in packages_by_id.items()],
+            update_conflicts=True,
+            unique_fields=['platform_package_id'],
+            update_fields=self.ORDER_UPDATE_FIELDS,
+        )
+        # Blocăm comenzile până la commit: un webhook simultan pentru același pachet așteaptă
+        # și vede apoi liniile deja salvate, deci nu rezervă stocul a doua oară.
+        orders = {
+            order.platform_package_id: order
+            for order in Order.objects.select_for_update(of=('self',))
+            .select_related('platform_account')
+            .filter(platform_package_id__in=list(packages_by_id))
+        }
 
-            merchant_sku = line.get('merchantSku', '')
-            
-            # Încercăm să găsim varianta locală după SKU
-            local_variant = ProductVariant.objects.filter(
-                sku=merchant_sku, 
-                product__account=self.user
-            ).first()
-
-            if local_variant:
-                # LOGICA NOUĂ PENTRU STOC
-                qty_ordered = line.get('quantity', 0)
-                
-                if local_variant.type == ProductVariant.Type.BUNDLE:
-                    # E un bundle: scădem stocul din componente
-                    components = local_variant.bundle_components.all()
-                    for comp in components:
-                        needed_qty = comp.quantity * qty_ordered
-                        # Scădem stocul componentei (atomic ar fi ideal, dar simplificăm aici)
-                        comp_variant = comp.component_variant
-                        comp_variant.stock = max(0, comp_variant.stock - needed_qty)
-                        comp_variant.save() 
-                        # Notă: comp_variant.save() va declanșa semnalul care recalculează stocul bundle-ului
-                        # și va trimite noul stoc la Trendyol automat!
-                else:
-                    # E produs simplu
-                    local_variant.stock = max(0, local_variant.stock - qty_ordered)
-                    local_variant.save()
-
-            # Salvare Linie
-            line_item, _ = OrderLineItem.objects.update_or_create(
-                order=order,
-                platform_order_line_id=line_id,
-                defaults={
-                    'variant': local_variant,
-                    'sku': merchant_sku,
-                    'product_name': line.get('productName', ''),
-                    'quantity': line.get('quantity', 0),
-                    'price': line.get('price', 0),
-                    'vat_rate': line.get('vatBaseAmount', 0),
-                    'status': line.get('orderLineItemStatusName', '')
-                }
-            )
-            current_line_ids.append(line_item.id)
+        # 2. Linii existente și variante locale, câte o interogare pentru toată pagina
+        existing_lines = {
+            (line.order_id, line.platform_order_line_id): line
+            for line in OrderLineItem.objects.filter(order__in=orders.values()).only('id', 'order_id', 'platform_order_line_id', 'status')
+        }
+        skus = {line.get('merchantSku', '') for data in packages_by_id.values() for line in data.get('lines', [])}
+        variants = {
+            variant.sku: variant
+            for variant in ProductVariant.objects.filter(sku__in=skus, product__account_id=self.account.user_id).only('id', 'sku', 'type')
+        }
 
-            # Aici am putea scădea stocul local (rezervare), dar e mai sigur să o facem
-            # într-un pas separat de procesare a stocului.
+        new_lines = []
+        changed_lines = []
+        # Cantități comandate pe liniile NOI, per variantă locală
+        reserved = defaultdict(int)
+        for package_id, data in packages_by_id.items():
+            order = orders[package_id]
+            for line in data.get('lines', []):
+                line_id = str(line.get('id')) # orderLineId
+                line_status = line.get('orderLineItemStatusName') or ''
+
+                existing_line = existing_lines.get((order.id, line_id))
+                if existing_line:
+                    # Putem actualiza statusul, dar NU scădem stocul din nou
+                    if existing_line.status != line_status:
+                        existing_line.status = line_status
+                        changed_lines.append(existing_line)
+                    continue
+
+                merchant_sku = line.get('merchantSku', '')
+                local_variant = variants.get(merchant_sku)
+                if local_variant:
+                    reserved[local_variant] += line.get('quantity', 0)
+
+                line_item = OrderLineItem(
+                    order=order,
+                    platform_order_line_id=line_id,
+                    variant=local_variant,
+                    sku=merchant_sku,
+                    product_name=line.get('productName', ''),
+                    quantity=line.get('quantity', 0),
+                    price=line.get('price', 0),
+                    vat_rate=line.get('vatBaseAmount', 0),
+                    status=line_status,
+                )
+                # O linie repetată în același pachet se salvează o singură dată
+                existing_lines[(order.id, line_id)] = line_item
+                new_lines.append(line_item)
+
+        OrderLineItem.objects.bulk_create(new_lines)
+        OrderLineItem.objects.bulk_update(changed_lines, ['status'])
+        # bulk_create nu trimite post_save: cererea per SKU se actualizează explicit
+        record_order_lines(new_lines)
+
+        # 3. Rezervare stoc: UPDATE-uri atomice (F), nu citire-modificare-scriere
+        if reserved:
+            reserve_stock(reserved)
+
+        logger.info(
+            f"Cont {self.account_id}: {len(orders)} comenzi salvate, "
+            f"{len(new_lines)} linii noi, {len(changed_lines)} statusuri actualizate"
+        )
+        return [orders[str(data.get('id'))] for data in packages]
 
-        return order
+    def _order_from_package(self, package_id: str, order_data: dict) -> Order:
+        # Conversie dată (Trendyol trimite timestamp în milisecunde)
+        timestamp = order_data.get('orderDate', 0)
+        return Order(
+            platform_package_id=package_id,
+            account_id=self.account.user_id,
+            platform_account=self.account,
+            platform_order_number=str(order_data.get('orderNumber')),
+            total_price=order_data.get('totalPrice', 0),
+            currency=order_data.get('currencyCode', 'RON'),
+            customer_first_name=order_data.get('customerFirstName', ''),
+            customer_last_name=order_data.get('customerLastName', ''),
+            customer_email=order_data.get('customerEmail', ''),
+            shipping_address=order_data.get('shipmentAddress', {}),
+            invoice_address=order_data.get('invoiceAddress', {}),
+            status=order_data.get('status', 'Unknown'),
+            order_date=datetime.fromtimestamp(timestamp / 1000.0, tz=timezone.utc),
+        )
     
-    def get_orders(self, status="Created", start_date=None, end_date=None):
+    def get_orders(self, status="Created", start_date=None, end_date=None, page=0, size=50, order_direction="DESC"):
         """
-        Interoghează comenzile (Polling).
+        Interoghează comenzile (Polling), o pagină.
         (GET /integration/order/sellers/{sellerId}/orders)
+        Cu status=None se întorc pachetele în orice status.
+        start_date / end_date: datetime sau direct timestamp în milisecunde (int).
         """
         params = {
-            "status": status,
             "orderByField": "PackageLastModifiedDate",
-            "orderByDirection": "DESC",
-            "size": 50 # Paginare implicită
+            "orderByDirection": order_direction,
+            "page": page,
+            "size": size,
         }
+        if status:
+            params["status"] = status
 
         # Conversie date în timestamp (milisecunde)
         if start_date:
-            params["startDate"] = int(start_date.timestamp() * 1000)
+            params["startDate"] = start_date if isinstance(start_date, int) else int(start_date.timestamp() * 1000)
         if end_date:
-            params["endDate"] = int(end_date.timestamp() * 1000)
+            params["endDate"] = end_date if isinstance(end_date, int) else int(end_date.timestamp() * 1000)
 
-        logger.info(f"Polling comenzi Trendyol (Cont: {self.account_id}, Status: {status})...")
+        logger.info(f"Polling comenzi Trendyol (Cont: {self.account_id}, Status: {status or 'toate'}, Pagina: {page})...")
         # Endpoint-ul de comenzi e în folderul 'order', diferit de 'product'
         # URL de bază: https://apigw.trendyol.com/integration/order/sellers/{sellerId}/orders
         base_url_order = f"https://apigw.trendyol.com/integration/order/sellers/{self.account.seller_id}"
         
         return self._make_request("GET", base_url_order, "/orders", params=params)
 
+    def iter_order_pages(self, start_date, end_date, status=None):
+        """
+        Parcurge toate pachetele modificate între start_date și end_date (crescător după
+        PackageLastModifiedDate), câte o listă `content` pe pagină.
+        Intervalele mai lungi decât permite API-ul se împart în ferestre.
+
+        Paginare după cheie, nu după număr de pagină: fiecare cerere pornește de la cel
+        mai recent lastModifiedDate primit (inclusiv), iar pachetele deja întoarse se
+        omit. Un pachet modificat în timpul rulării iese din fereastră fără să deplaseze
+        restul rezultatelor, deci nu sare niciun pachet la granița dintre pagini (îl
+        prinde rularea următoare, cu noua dată de modificare). Numărul paginii crește
+        doar când o pagină întreagă are același lastModifiedDate.
+
+        Pagina următoare se cere pe un thread separat cât timp apelantul o procesează
+        pe cea curentă, deci timpul total ≈ max(rețea, salvare), nu suma lor.
+        """
+        windows = []
+        window_start = start_date
+        while window_start < end_date:
+            window_end = min(window_start + self.ORDERS_MAX_RANGE, end_date)
+            windows.append((int(window_start.timestamp() * 1000), int(window_end.timestamp() * 1000)))
+            window_start = window_end
+
+        size = self.ORDERS_PAGE_SIZE
+
+        def fetch(cursor, window_end, page):
+            return self.get_orders(
+                status=status, start_date=cursor, end_date=window_end,
+                page=page, size=size, order_direction="ASC",
+            )
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for cursor, window_end in windows:
+                page = 0
+                # ID-urile pachetelor deja întoarse cu lastModifiedDate == cursor
+                seen = set()
+                future = executor.submit(fetch, cursor, window_end, page)
+                while future is not None:
+                    content = future.result().get('content', [])
+                    new = [package for package in content if package.get('id') not in seen]
+
+                    # Un pachet modificat chiar acum poate veni deja cu o dată după fereastră
+                    last = max(
+                        (
+                            package.get('lastModifiedDate') or 0 for package in content
+                            if (package.get('lastModifiedDate') or 0) <= window_end
+                        ),
+                        default=0,
+                    )
+                    if last > cursor:
+                        cursor, page = last, 0
+                        seen = {package.get('id') for package in content if package.get('lastModifiedDate') == last}
+                    else:
+                        # Pagina nu a avansat data: următoarea pagină cu același start
+                        page += 1
+                        seen.update(package.get('id') for package in content)
+
+                    has_next = len(content) >= size
+                    future = executor.submit(fetch, cursor, window_end, page) if has_next else None
+                    if new:
+                        yield new
+
     def update_package_status_picking(self, package_id, lines):
         """
         Setează statusul la 'Picking'. 
@@ -343,7 +507,9 @@ class TrendyolAPIService:
         custom_headers.pop("Content-Type", None)
 
         try:
-            response = requests.post(
+            response = transport.send(
+                self.account_id,
+                "POST",
                 url, 
                 headers=custom_headers, 
                 params=params, 
@@ -356,43 +522,45 @@ class TrendyolAPIService:
             logger.error(f"Eroare la respingerea returului: {e}")
             raise
 
-    def get_all_products_generator(self, batch_size=100):
+    def get_products_page(self, page, size=PRODUCTS_PAGE_SIZE):
+        # GET /integration/product/sellers/{sellerId}/products
+        # Putem adăuga "approved": True dacă vrem doar cele aprobate
+        return self._make_request("GET", self.seller_base_url, "/products", params={"page": page, "size": size})
+
+    def iter_product_pages(self, start_page=0, size=PRODUCTS_PAGE_SIZE, workers=PRODUCT_FETCH_WORKERS):
+        """
+        Parcurge paginile de produse de la start_page până la final, în ordine, ca
+        (pagină, total_pagini, produse). Numărul de pagini îl aflăm din prima cerere;
+        restul se cer în paralel (cel mult 2 * workers pagini în zbor sau neconsumate),
+        în ritmul permis de rate limiter-ul contului.
+        """
+        first = self.get_products_page(start_page, size)
+        total_pages = first.get('totalPages', 0)
+        yield start_page, total_pages, first.get('content', [])
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = deque()
+            next_page = start_page + 1
+            while pending or next_page < total_pages:
+                while next_page < total_pages and len(pending) < 2 * workers:
+                    pending.append((next_page, executor.submit(self.get_products_page, next_page, size)))
+                    next_page += 1
+                page, future = pending.popleft()
+                yield page, total_pages, future.result().get('content', [])
+        finally:
+            # Apelantul s-a oprit (sau a eșuat): nu mai cerem paginile încă nepornite
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def get_all_products_generator(self, batch_size=PRODUCTS_PAGE_SIZE):
         """
         Generator care iterează prin toate paginile de produse de pe Trendyol.
         Returnează produsele unul câte unul pentru a nu umple memoria.
         """
-        page = 0
-        total_elements = 0
-        
         logger.info(f"Începe importul complet de produse pentru contul {self.account_id}...")
-        
-        while True:
-            params = {
-                "page": page,
-                "size": batch_size,
-                # Putem adăuga "approved": True dacă vrem doar cele aprobate
-            }
-            
-            # GET /integration/product/sellers/{sellerId}/products
-            # Folosim endpoint-ul de filtrare
-            response = self._make_request("GET", self.seller_base_url, "/products", params=params)
-            
-            content = response.get('content', [])
-            if not content:
-                break # Nu mai sunt produse
-                
-            for product in content:
-                yield product
-            
-            # Verificăm dacă am ajuns la final
-            total_elements = response.get('totalElements', 0)
-            total_pages = response.get('totalPages', 0)
-            
-            logger.info(f"Importat pagina {page}/{total_pages} (Total items: {total_elements})")
-            
-            page += 1
-            if page >= total_pages:
-                break
+        for page, total_pages, content in self.iter_product_pages(size=batch_size):
+            logger.info(f"Importat pagina {page + 1}/{total_pages}")
+            yield from content
 
     def get_common_label(self, cargo_tracking_number):
         """
@@ -447,4 +615,49 @@ class TrendyolAPIService:
             "shouldKeepPreviousStatus": True
         }
         
-        return self._make_request("POST", base_url_order, f"/shipment-packages/{package_id}/split", json_data=payload)
\ No newline at end of file
+        return self._make_request("POST", base_url_order, f"/shipment-packages/{package_id}/split", json_data=payload)
+
+
+# --- Registrul de servicii (per proces) ---
+# Task-urile construiesc des serviciul pentru aceleași conturi: păstrăm ultimele
+# instanțe, fiecare cu versiunea contului din cache-ul comun (Redis). Salvarea sau
+# ștergerea unui cont (semnal, vezi signals.py) schimbă versiunea, deci toate
+# procesele reconstruiesc serviciul la următoarea folosire.
+
+SERVICE_REGISTRY_SIZE = 256
+ACCOUNT_VERSION_KEY = "trendyol:account-version:{account_id}"
+
+_services = OrderedDict() # account_id -> (versiune, serviciu), ordinea = LRU
+_services_lock = threading.Lock()
+
+
+def account_version(account_id: int):
+    return cache.get(ACCOUNT_VERSION_KEY.format(account_id=account_id), 0)
+
+
+def invalidate_trendyol_service(account_id: int):
+    with _services_lock:
+        _services.pop(account_id, None)
+    # O valoare nouă (nu un contor): rămâne corectă și dacă cheia a fost evacuată între timp
+    cache.set(ACCOUNT_VERSION_KEY.format(account_id=account_id), time.time_ns(), None)
+
+
+def _registry_get(account_id: int):
+    """(versiunea curentă a contului, serviciul din registru sau None dacă lipsește / e expirat)."""
+    version = account_version(account_id)
+    with _services_lock:
+        entry = _services.get(account_id)
+        if entry is None or entry[0] != version:
+            return version, None
+        _services.move_to_end(account_id)
+        return version, entry[1]
+
+
+def _registry_put(service: TrendyolAPIService, version) -> TrendyolAPIService:
+    # Versiunea e citită înainte de construcție: o invalidare concurentă lasă intrarea expirată
+    with _services_lock:
+        _services[service.account_id] = (version, service)
+        _services.move_to_end(service.account_id)
+        while len(_services) > SERVICE_REGISTRY_SIZE:
+            _services.popitem(last=False)
+    return service
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from ecommerce_core.models import MarketplaceAccount
+from .services import invalidate_trendyol_service
+
+
+@receiver(post_save, sender=MarketplaceAccount)
+@receiver(post_delete, sender=MarketplaceAccount)
+def invalidate_cached_service(sender, instance, **kwargs):
+    """Credențialele / setările contului s-au schimbat: serviciile din registru se reconstruiesc."""
+    invalidate_trendyol_service(instance.id)
@@ -1,11 +1,19 @@
 import logging
+import time
+import uuid
 from datetime import datetime, timedelta#, timezone
 from django.utils import timezone
 from celery import shared_task
 from django.core.cache import cache
+from django.db import transaction
 from django.contrib.auth.models import User
-from ecommerce_core.models import MarketplaceAccount, MarketplaceListing, ProductVariant, Product, Order, ReturnRequest, ReturnLineItem
-from celery.exceptions import MaxRetriesExceededError
+from ecommerce_core.models import MarketplaceAccount, MarketplaceListing, ProductVariant, Product, Order, ReturnRequest, ReturnLineItem, PendingListingSync, StockPriceBatch, BatchStatusCheck
+from ecommerce_core.marketplace_sync import listing_stock_price
+from ecommerce_core.bundle_stock import mark_components_changed
+from ecommerce_core.batch_checks import (
+    BATCH_CHECK_LEASE, BATCH_CHECK_TIMEOUT, claim_due_batch_checks, due_batch_accounts, finish,
+    purge_finished_batch_checks, release, reschedule, track_batch,
+)
 import json
 from .services import TrendyolAPIService
 
@@ -15,6 +23,18 @@ logger = logging.getLogger(__name__)
 CATEGORIES_CACHE_KEY = "trendyol:global:categories"
 CACHE_TTL_CATEGORIES = 60 * 60 * 25 # 25 de ore
 
+# Polling comenzi: de unde începem pentru un cont nou și cât reluăm din intervalul anterior
+ORDERS_INITIAL_LOOKBACK = timedelta(days=1)
+ORDERS_SYNC_OVERLAP = timedelta(minutes=5)
+
+# Importul catalogului: ultima pagină salvată, pentru reluare după o întrerupere
+IMPORT_CHECKPOINT_KEY = "trendyol:import-products:{account_id}"
+IMPORT_CHECKPOINT_TTL = 60 * 60 * 24 * 7 # 7 zile
+
+# Publicare: ID provizoriu al listărilor rezervate pentru o cerere în curs
+PUBLISH_CLAIM_PREFIX = "sending:"
+PUBLISH_CLAIM_TIMEOUT = timedelta(minutes=15)
+
 @shared_task
 def refresh_trendyol_categories_cache(account_id=None):
     """
@@ -40,7 +60,7 @@ def refresh_trendyol_categories_cache(account_id=None):
             return
 
         # Folosim utilizatorul și ID-ul contului pentru a instanția serviciul
-        service = TrendyolAPIService(user=account.user, account_id=account.id)
+        service = TrendyolAPIService.for_account(account)
         categories_data = service.get_categories()
         
         # Salvăm datele în cache-ul Redis
@@ -50,151 +70,323 @@ def refresh_trendyol_categories_cache(account_id=None):
     except Exception as e:
         logger.error(f"Eroare la reîmprospătarea cache-ului de categorii Trendyol: {e}", exc_info=True)
 
-@shared_task(bind=True)
-def publish_trendyol_listing(self, listing_id: int):
+def _listing_item_payload(listing):
     """
-    Task Celery pentru a construi și trimite o cerere de creare produs la Trendyol.
+    Item-ul pentru cererea de creare produse al unei listări (cu variant și product încărcate).
     """
-    logger.info(f"Începe publicarea listing-ului {listing_id}...")
-    try:
-        # Preluăm listarea și modelele asociate dintr-o singură interogare
-        listing = MarketplaceListing.objects.select_related(
-            'variant', 'variant__product', 'platform_account', 'account'
-        ).get(id=listing_id)
-        
-        # 1. Extragem datele
-        variant = listing.variant
-        product = variant.product
-        
-        # 2. Logica pentru stoc și preț
-        price_to_send = listing.price_override if listing.price_override else variant.price
-        base_list_price = variant.list_price if variant.list_price else variant.price
-        list_price_to_send = max(base_list_price, price_to_send)
-
-        stock_to_send = 0
-        if listing.stock_override is not None:
-            # Trimite valoarea fixă, dar nu mai mult decât stocul real
-            stock_to_send = min(listing.stock_override, variant.stock)
-        else:
-            # Trimite stocul real
-            stock_to_send = variant.stock
-
-        # 3. Asamblare Payload
-        # (Folosim SKU-ul produsului PĂRINTE ca productMainId pentru a grupa variantele)
-        item_payload = {
-            "barcode": variant.barcode,
-            "stockCode": variant.sku,
-            "title": product.title,
-            "productMainId": product.sku, # Folosim SKU-ul părintelui
-            "brandId": int(listing.platform_brand_id), # Asigurăm că e int
-            "categoryId": int(listing.platform_category_id), # Asigurăm că e int
-            "quantity": int(stock_to_send),
-            "description": product.description,
-            "salePrice": float(price_to_send),
-            "listPrice": float(list_price_to_send), # Simplificare: listPrice = salePrice
-            "vatRate": int(listing.vat_rate), # Cota TVA
-            "images": [{"url": url} for url in variant.images],
-            "attributes": listing.platform_attributes # Acesta vine direct din JSON-ul salvat
-        }
-
-        if listing.shipment_address_id:
-            item_payload["shipmentAddressId"] = listing.shipment_address_id
-        if listing.returning_address_id:
-            item_payload["returningAddressId"] = listing.returning_address_id
-        
-        payload = {"items": [item_payload]}
-        logger.debug(f"Payload pentru listing {listing_id}: {json.dumps(payload, indent=2)}")
+    # 1. Extragem datele
+    variant = listing.variant
+    product = variant.product
+
+    # 2. Logica pentru stoc și preț
+    price_to_send = listing.price_override if listing.price_override else variant.price
+    base_list_price = variant.list_price if variant.list_price else variant.price
+    list_price_to_send = max(base_list_price, price_to_send)
+
+    stock_to_send = 0
+    if listing.stock_override is not None:
+        # Trimite valoarea fixă, dar nu mai mult decât stocul real
+        stock_to_send = min(listing.stock_override, variant.stock)
+    else:
+        # Trimite stocul real
+        stock_to_send = variant.stock
+
+    # 3. Asamblare Payload
+    # (Folosim SKU-ul produsului PĂRINTE ca productMainId pentru a grupa variantele)
+    item_payload = {
+        "barcode": variant.barcode,
+        "stockCode": variant.sku,
+        "title": product.title,
+        "productMainId": product.sku, # Folosim SKU-ul părintelui
+        "brandId": int(listing.platform_brand_id), # Asigurăm că e int
+        "categoryId": int(listing.platform_category_id), # Asigurăm că e int
+        "quantity": int(stock_to_send),
+        "description": product.description,
+        "salePrice": float(price_to_send),
+        "listPrice": float(list_price_to_send), # Simplificare: listPrice = salePrice
+        "vatRate": int(listing.vat_rate), # Cota TVA
+        "images": [{"url": url} for url in variant.images],
+        "attributes": listing.platform_attributes # Acesta vine direct din JSON-ul salvat
+    }
+
+    if listing.shipment_address_id:
+        item_payload["shipmentAddressId"] = listing.shipment_address_id
+    if listing.returning_address_id:
+        item_payload["returningAddressId"] = listing.returning_address_id
+    return item_payload
 
-        # 4. Instanțiere Serviciu și Apel API
-        service = TrendyolAPIService(user=listing.account, account_id=listing.platform_account.id)
-        response = service.create_products(payload)
-        
-        batch_id = response.get('batchRequestId')
-        if not batch_id:
-            raise Exception("Răspunsul API Trendyol nu a conținut 'batchRequestId'")
-        
-        # 5. Salvare Batch ID și Pornire Task de Polling
-        listing.platform_listing_id = batch_id
-        listing.last_sync_status = "Trimis către Trendyol. Se așteaptă procesarea batch-ului."
-        listing.save()
-        
-        # Pornim task-ul de verificare, cu o mică întârziere
-        check_trendyol_batch_status.apply_async(
-            args=[listing.id],
-            countdown=60 # Verifică prima dată peste 1 minut
+
+@shared_task
+def publish_trendyol_listing(listing_id: int):
+    """
+    Publică o singură listare (prin același drum ca publicarea grupată).
+    """
+    publish_trendyol_listings([listing_id])
+
+
+@shared_task
+def publish_trendyol_listings(listing_ids=None):
+    """
+    Publică grupat listările în așteptare (PENDING_CREATE, încă netrimise): per cont,
+    câte cel mult CREATE_PRODUCTS_BATCH_LIMIT produse într-o singură cerere.
+    Fiecare batchRequestId se salvează pe listările lui (platform_listing_id) și are
+    o singură înregistrare de verificare (BatchStatusCheck, vezi poll_trendyol_batches).
+    Fără listing_ids: toate listările în așteptare (rulare periodică, vezi CELERY_BEAT_SCHEDULE).
+    """
+    pending = MarketplaceListing.objects.filter(
+        status=MarketplaceListing.Status.PENDING_CREATE,
+        platform_listing_id='',
+        platform_account__platform=MarketplaceAccount.Platform.TRENDYOL,
+    )
+    if listing_ids is not None:
+        pending = pending.filter(id__in=listing_ids)
+    _release_stale_publish_claims()
+
+    account_ids = list(pending.order_by().values_list('platform_account_id', flat=True).distinct())
+    for account_id in account_ids:
+        try:
+            _publish_account_listings(account_id, pending.filter(platform_account_id=account_id))
+        except Exception as e:
+            # Listările netrimise rămân în așteptare pentru rularea următoare
+            logger.error(f"Eroare la publicarea listărilor pentru contul {account_id}: {e}", exc_info=True)
+
+def _publish_account_listings(account_id, pending):
+    account = MarketplaceAccount.objects.get(id=account_id)
+    service = TrendyolAPIService.for_account(account)
+    limit = TrendyolAPIService.CREATE_PRODUCTS_BATCH_LIMIT
+    while True:
+        # 1. Rezervăm listările într-o tranzacție scurtă: primesc un ID provizoriu,
+        # deci ies din `pending` pentru orice altă rulare
+        claim = f"{PUBLISH_CLAIM_PREFIX}{uuid.uuid4().hex}"
+        with transaction.atomic():
+            # skip_locked: listările pe care le rezervă chiar acum altă rulare nu se trimit de două ori
+            ids = list(
+                pending.select_for_update(skip_locked=True, of=('self',))
+                .order_by('id').values_list('id', flat=True)[:limit]
+            )
+            if not ids:
+                return
+            MarketplaceListing.objects.filter(id__in=ids).update(platform_listing_id=claim, updated_at=timezone.now())
+
+        # 2. Cererea către Trendyol (cu reîncercări și limită de rată) rulează fără tranzacție
+        listings = list(
+            MarketplaceListing.objects.filter(id__in=ids, platform_listing_id=claim)
+            .select_related('variant', 'variant__product')
+            .order_by('id')
         )
-        
-        logger.info(f"Listing-ul {listing_id} a fost trimis. Batch ID: {batch_id}. Se așteaptă verificarea.")
+        _send_publish_batch(service, listings)
 
-    except Exception as e:
-        logger.error(f"Eroare la publicarea listing-ului {listing_id}: {e}", exc_info=True)
+def _release_stale_publish_claims():
+    """
+    Listările rămase cu ID provizoriu (worker oprit în timpul trimiterii) revin în
+    așteptare după PUBLISH_CLAIM_TIMEOUT, mult peste durata unei cereri cu reîncercări.
+    """
+    released = MarketplaceListing.objects.filter(
+        platform_listing_id__startswith=PUBLISH_CLAIM_PREFIX,
+        updated_at__lt=timezone.now() - PUBLISH_CLAIM_TIMEOUT,
+    ).update(platform_listing_id='', updated_at=timezone.now())
+    if released:
+        logger.warning(f"{released} listări rezervate pentru publicare, dar netrimise, revin în așteptare")
+
+def _send_publish_batch(service, listings):
+    """
+    O cerere de creare produse pentru listările date (deja rezervate). La succes,
+    listările primesc batchRequestId-ul; la eroare (sau date invalide), statusul FAILED
+    cu motivul. Rezultatul se scrie într-o tranzacție separată, după cerere.
+    """
+    items, sent_ids = [], set()
+    for listing in listings:
         try:
-            listing = MarketplaceListing.objects.get(id=listing_id)
+            items.append(_listing_item_payload(listing))
+            sent_ids.add(listing.id)
+        except (TypeError, ValueError) as e:
+            # Ex: brandId / categoryId lipsă sau nenumerice
             listing.status = MarketplaceListing.Status.FAILED
-            listing.last_sync_status = str(e)
-            listing.save()
-        except MarketplaceListing.DoesNotExist:
-            pass # Nu putem face nimic
+            listing.last_sync_status = f"Date invalide pentru publicare: {e}"
+
+    batch_id = None
+    if items:
+        try:
+            response = service.create_products({"items": items})
+            batch_id = response.get('batchRequestId')
+            if not batch_id:
+                raise Exception("Răspunsul API Trendyol nu a conținut 'batchRequestId'")
+        except Exception as e:
+            logger.error(f"Eroare la publicarea a {len(sent_ids)} listări (cont {service.account_id}): {e}")
+            for listing in listings:
+                if listing.id in sent_ids:
+                    listing.status = MarketplaceListing.Status.FAILED
+                    listing.last_sync_status = str(e)
+            batch_id = None
+
+    if batch_id:
+        # Înainte de scriere: dacă scrierea eșuează, batch-ul poate fi regăsit din log
+        logger.info(f"Cont {service.account_id}: {len(sent_ids)} listări trimise. Batch ID: {batch_id}. Se așteaptă verificarea.")
+
+    now = timezone.now()
+    for listing in listings:
+        if batch_id and listing.id in sent_ids:
+            listing.platform_listing_id = batch_id
+            listing.last_sync_status = "Trimis către Trendyol. Se așteaptă procesarea batch-ului."
+        else:
+            listing.platform_listing_id = ''
+        listing.updated_at = now
+    try:
+        with transaction.atomic():
+            MarketplaceListing.objects.bulk_update(listings, ['status', 'platform_listing_id', 'last_sync_status', 'updated_at'])
+            if batch_id:
+                # Verificarea o face poll_trendyol_batches, odată cu celelalte batch-uri ale contului
+                track_batch(service.account_id, batch_id)
+    except Exception:
+        logger.error(
+            f"Batch {batch_id} (cont {service.account_id}) trimis, dar rezultatul nu s-a salvat pentru "
+            f"listările {sorted(sent_ids)}", exc_info=True,
+        )
+        raise
+    return batch_id
+
 
+# Statusurile unui batch care încă se procesează
+BATCH_PENDING_STATUSES = ("PENDING", "PROCESSING", "IN_PROGRESS")
 
-@shared_task(bind=True, max_retries=10) # Reîncearcă de 10 ori
-def check_trendyol_batch_status(self, listing_id: int):
+@shared_task
+def poll_trendyol_batches():
     """
-    Task Celery care face polling la Trendyol pentru a verifica statusul unui batch.
+    Verifică batch-urile Trendyol scadente (vezi ecommerce_core.batch_checks), cont cu
+    cont, cu serviciul contului refolosit. Cele încă în procesare se reprogramează cu
+    backoff exponențial; cele finalizate își aplică rezultatul pe listări.
+    Rulează la câteva secunde (CELERY_BEAT_SCHEDULE), deci un batch rapid se vede repede.
+    Fiecare cont își preia batch-urile abia când îi vine rândul, câte cel mult
+    BATCH_CHECKS_PER_ACCOUNT, deci lease-ul lor acoperă doar verificarea lor.
     """
-    logger.info(f"Verificare status pentru listing {listing_id}...")
-    try:
-        listing = MarketplaceListing.objects.get(id=listing_id)
-        
-        if not listing.platform_listing_id:
-            raise Exception(f"Listing-ul {listing_id} nu are batchRequestId salvat.")
-        
-        service = TrendyolAPIService(user=listing.account, account_id=listing.platform_account.id)
-        response = service.get_batch_status(listing.platform_listing_id)
-        
-        batch_status = response.get('status')
-        
-        if batch_status == "COMPLETED":
-            item_status = response.get('items', [{}])[0] # Luăm statusul primului item
-            
-            if item_status.get('status') == "SUCCESS":
-                listing.status = MarketplaceListing.Status.ACTIVE
-                listing.last_sync_status = "Publicat cu succes."
-                listing.save()
-                logger.info(f"Listing-ul {listing_id} este acum ACTIV.")
+    checked = 0
+    for account_id in due_batch_accounts(MarketplaceAccount.Platform.TRENDYOL):
+        checks = claim_due_batch_checks(account_id)
+        if not checks:
+            continue # Preluate între timp de o trecere paralelă
+        try:
+            checked += _poll_account_batches(checks[0].platform_account, checks)
+        except Exception as e:
+            # Cele neverificate rămân rezervate până expiră BATCH_CHECK_LEASE, apoi se reiau
+            logger.error(f"Eroare la verificarea batch-urilor contului {account_id}: {e}", exc_info=True)
+    return checked
+
+def _poll_account_batches(account, checks):
+    """Verifică batch-urile preluate și salvează fiecare rezultat imediat. Întoarce câte a verificat."""
+    service = TrendyolAPIService.for_account(account)
+    # Ne oprim cu mult înainte să expire lease-ul; restul redevin scadente pentru trecerea următoare
+    deadline = time.monotonic() + BATCH_CHECK_LEASE.total_seconds() / 2
+    for position, check in enumerate(checks):
+        if time.monotonic() > deadline:
+            release(checks[position:])
+            logger.warning(f"Cont {account.id}: {len(checks) - position} batch-uri amânate pentru trecerea următoare")
+            return position
+
+        batch_id = check.batch_request_id
+        now = timezone.now()
+        attempts = check.attempts
+        try:
+            response = service.get_batch_status(batch_id)
+            batch_status = response.get('status')
+            if batch_status in BATCH_PENDING_STATUSES:
+                if now - check.submitted_at < BATCH_CHECK_TIMEOUT:
+                    reschedule(check, now)
+                    continue
+                logger.error(f"Batch-ul {batch_id} nu s-a finalizat în {BATCH_CHECK_TIMEOUT}. Listările sale sunt setate ca Eșuate.")
+                outcome, response = BatchStatusCheck.Outcome.EXPIRED, None
+            elif batch_status == "COMPLETED":
+                outcome = BatchStatusCheck.Outcome.COMPLETED
             else:
-                listing.status = MarketplaceListing.Status.FAILED
-                listing.last_sync_status = json.dumps(item_status.get('failureReasons', 'Eroare necunoscută.'))
-                listing.save()
-                logger.error(f"Publicarea listing-ului {listing_id} a eșuat: {listing.last_sync_status}")
-        
-        elif batch_status in ["PENDING", "PROCESSING"]:
-            logger.info(f"Listing-ul {listing_id} este încă în procesare. Se reîncearcă în 5 minute.")
-            # Reîncearcă task-ul peste 5 minute (300 secunde)
-            raise self.retry(countdown=60 * 5)
-        
-        else:
+                outcome = BatchStatusCheck.Outcome.FAILED
+
+            with transaction.atomic():
+                # Rezultatul se aplică o singură dată, odată cu marcarea batch-ului ca finalizat
+                if not finish(check, outcome, now):
+                    continue
+                _apply_publish_batch_result(account.id, batch_id, response)
+            logger.info(f"Batch {batch_id} finalizat ({batch_status}) în {(now - check.submitted_at).total_seconds():.0f}s, după {check.attempts} verificări")
+
+        except Exception as e:
+            # Erori de rețea, etc.: reîncercăm la următoarea scadență
+            logger.error(f"Eroare la verificarea batch-ului {batch_id}: {e}", exc_info=True)
+            # finish() a fost anulat odată cu tranzacția; rândul e încă în așteptare, deci
+            # refacem și attempts, altfel reschedule() ar sări un pas de backoff
+            check.outcome, check.attempts, check.completed_at = BatchStatusCheck.Outcome.PENDING, attempts, None
+            reschedule(check, now)
+    return len(checks)
+
+@shared_task
+def purge_finished_batch_checks_task():
+    """Șterge verificările de batch finalizate mai vechi decât BATCH_CHECK_RETENTION (zilnic)."""
+    deleted = purge_finished_batch_checks()
+    logger.info(f"{deleted} verificări de batch finalizate șterse")
+    return deleted
+
+@shared_task
+def check_trendyol_publish_batch(account_id: int, batch_id: str):
+    """
+    Pentru task-urile programate înainte de poll_trendyol_batches: trece batch-ul în
+    tabela de verificări, de unde îl preia trecerea periodică.
+    """
+    track_batch(account_id, batch_id)
+
+def _apply_publish_batch_result(account_id, batch_id, response):
+    """
+    Rezultatul batch-ului pe listări, după barcode, cu un singur bulk_update.
+    response=None: verificarea a expirat, toate listările batch-ului devin FAILED.
+    """
+    listings = list(
+        MarketplaceListing.objects.filter(
+            platform_account_id=account_id,
+            platform_listing_id=batch_id,
+            status=MarketplaceListing.Status.PENDING_CREATE,
+        ).select_related('variant')
+    )
+    items = (response or {}).get('items') or []
+    results = {}
+    for item in items:
+        request_item = item.get('requestItem') or {}
+        results[(request_item.get('product') or request_item).get('barcode')] = item
+
+    batch_status = response.get('status') if response else None
+    now = timezone.now()
+    for listing in listings:
+        item = results.get(listing.variant.barcode)
+        if item is None and len(items) == 1 and len(listings) == 1:
+            item = items[0] # Batch-uri cu un singur produs
+        if response is None:
+            listing.status = MarketplaceListing.Status.FAILED
+            listing.last_sync_status = "Timeout: Batch-ul nu s-a finalizat în timpul de verificare."
+        elif batch_status != "COMPLETED":
             # Status necunoscut (ex: FAILED la nivel de batch)
             listing.status = MarketplaceListing.Status.FAILED
             listing.last_sync_status = f"Batch-ul a eșuat cu statusul: {batch_status}"
-            listing.save()
-            logger.error(f"Verificarea batch-ului {listing_id} a eșuat: {batch_status}")
-
-    except MaxRetriesExceededError:
-        logger.error(f"Epuizat numărul de reîncercări pentru listing {listing_id}. Setat ca Eșuat.")
-        try:
-            listing = MarketplaceListing.objects.get(id=listing_id)
+        elif item is None:
             listing.status = MarketplaceListing.Status.FAILED
-            listing.last_sync_status = "Timeout: Task-ul de verificare a expirat după multiple reîncercări."
-            listing.save()
-        except MarketplaceListing.DoesNotExist:
-            pass
-    
-    except Exception as e:
-        logger.error(f"Eroare la verificarea statusului listing-ului {listing_id}: {e}", exc_info=True)
-        # Reîncearcă pentru erori de rețea, etc.
-        raise self.retry(countdown=60) # Reîncearcă peste 1 minut
-    
+            listing.last_sync_status = "Produsul lipsește din rezultatul batch-ului."
+        elif item.get('status') == "SUCCESS":
+            listing.status = MarketplaceListing.Status.ACTIVE
+            listing.last_sync_status = "Publicat cu succes."
+        else:
+            listing.status = MarketplaceListing.Status.FAILED
+            listing.last_sync_status = json.dumps(item.get('failureReasons', 'Eroare necunoscută.'))
+        listing.updated_at = now
+    MarketplaceListing.objects.bulk_update(listings, ['status', 'last_sync_status', 'updated_at'])
+
+    active = sum(1 for listing in listings if listing.status == MarketplaceListing.Status.ACTIVE)
+    logger.info(f"Batch {batch_id}: {active} listări active, {len(listings) - active} eșuate")
+
+
+@shared_task
+def check_trendyol_batch_status(listing_id: int):
+    """
+    Verificarea per listare, pentru task-urile programate înainte de publicarea grupată:
+    verifică batch-ul din care face parte listarea.
+    """
+    listing = MarketplaceListing.objects.filter(id=listing_id).values_list('platform_account_id', 'platform_listing_id').first()
+    if listing and listing[1] and not listing[1].startswith(PUBLISH_CLAIM_PREFIX):
+        track_batch(*listing)
+
 @shared_task
 def process_trendyol_webhook_order(data: dict, seller_id: str):
     """
@@ -216,7 +408,7 @@ def process_trendyol_webhook_order(data: dict, seller_id: str):
             return
 
         # Instanțiem serviciul
-        service = TrendyolAPIService(user=account.user, account_id=account.id)
+        service = TrendyolAPIService.for_account(account)
         
         # Procesăm datele folosind metoda creată la Pasul 2
         service.process_order_data(data)
@@ -233,34 +425,38 @@ def process_trendyol_webhook_order(data: dict, seller_id: str):
 @shared_task
 def sync_trendyol_orders_periodic():
     """
-    Task periodic care verifică comenzile 'Created' pentru TOATE conturile Trendyol active.
+    Task periodic care preia comenzile noi sau modificate pentru TOATE conturile Trendyol active.
     Funcționează ca backup pentru Webhook-uri.
+
+    Fiecare cont își ține watermark-ul (orders_synced_until): cerem doar pachetele
+    cu PackageLastModifiedDate după ultima sincronizare reușită, în orice status,
+    toate paginile. Watermark-ul avansează doar după ce toate paginile au fost salvate;
+    la o eroare, rularea următoare reia intervalul (procesarea e idempotentă).
     """
     logger.info("Începe sincronizarea periodică a comenzilor Trendyol...")
     
     # Iterăm prin toate conturile Trendyol
     accounts = MarketplaceAccount.objects.filter(platform=MarketplaceAccount.Platform.TRENDYOL)
 
-    target_statuses = ["Created", "Picking", "Shipped", "Delivered", "Cancelled", "Returned"]
-    
     for account in accounts:
         try:
-            service = TrendyolAPIService(user=account.user, account_id=account.id)
+            service = TrendyolAPIService.for_account(account)
             end_date = timezone.now()
-            start_date = end_date - timedelta(days=1)
-            
-            for status in target_statuses:
-                try:
-                    response = service.get_orders(status=status, start_date=start_date, end_date=end_date)
-                    orders_content = response.get('content', [])
-                    
-                    if orders_content:
-                        logger.info(f"Cont {account.name}: Găsite {len(orders_content)} comenzi cu status {status}")
-                        for order_data in orders_content:
-                            service.process_order_data(order_data)
-                except Exception as e:
-                    logger.warning(f"Eroare la preluarea statusului {status} pentru {account.name}: {e}")
-                    
+            if account.orders_synced_until:
+                # Suprapunere mică: pachete modificate chiar în timpul rulării anterioare
+                start_date = account.orders_synced_until - ORDERS_SYNC_OVERLAP
+            else:
+                start_date = end_date - ORDERS_INITIAL_LOOKBACK
+
+            packages = 0
+            for orders_content in service.iter_order_pages(start_date, end_date):
+                if orders_content:
+                    # Toată pagina într-o tranzacție, cu un număr fix de interogări
+                    service.process_orders_page(orders_content)
+                    packages += len(orders_content)
+
+            MarketplaceAccount.objects.filter(id=account.id).update(orders_synced_until=end_date)
+            logger.info(f"Cont {account.name}: {packages} pachete modificate din {start_date:%Y-%m-%d %H:%M}")
         except Exception as e:
             logger.error(f"Eroare critică la sincronizarea contului {account.id}: {e}")
 
@@ -272,8 +468,8 @@ def set_order_status_picking(order_id):
     Trimite statusul 'Picking' la Trendyol.
     """
     try:
-        order = Order.objects.get(id=order_id)
-        service = TrendyolAPIService(user=order.account, account_id=order.platform_account.id)
+        order = Order.objects.select_related('platform_account').get(id=order_id)
+        service = TrendyolAPIService.for_account(order.platform_account)
         
         # Construim lista de linii necesară pentru API
         lines_payload = []
@@ -300,8 +496,8 @@ def set_order_status_invoiced(order_id, invoice_number):
     Trimite statusul 'Invoiced' la Trendyol.
     """
     try:
-        order = Order.objects.get(id=order_id)
-        service = TrendyolAPIService(user=order.account, account_id=order.platform_account.id)
+        order = Order.objects.select_related('platform_account').get(id=order_id)
+        service = TrendyolAPIService.for_account(order.platform_account)
         
         lines_payload = []
         for item in order.items.all():
@@ -328,7 +524,7 @@ def sync_trendyol_claims_periodic():
     accounts = MarketplaceAccount.objects.filter(platform=MarketplaceAccount.Platform.TRENDYOL)
     for account in accounts:
         try:
-            service = TrendyolAPIService(user=account.user, account_id=account.id)
+            service = TrendyolAPIService.for_account(account)
             response = service.get_claims(status="WaitingInAction")
             claims = response.get('content', [])
             
@@ -375,8 +571,8 @@ def sync_trendyol_claims_periodic():
 def approve_return_task(claim_db_id):
     """ Task asincron pentru aprobare """
     try:
-        ret_req = ReturnRequest.objects.get(id=claim_db_id)
-        service = TrendyolAPIService(user=ret_req.account, account_id=ret_req.platform_account.id)
+        ret_req = ReturnRequest.objects.select_related('platform_account').get(id=claim_db_id)
+        service = TrendyolAPIService.for_account(ret_req.platform_account)
         
         # Colectăm ID-urile liniilor
         item_ids = [item.claim_line_item_id for item in ret_req.items.all()]
@@ -392,148 +588,261 @@ def approve_return_task(claim_db_id):
 # Recomandarea mea: Execută reject-ul sincron în View sau salvează fișierul temporar pe S3 și trimite calea către Celery.
 # Pentru simplitate acum, vom face reject-ul direct în View, nu prin Task.
 
+def _stock_price_item(listing):
+    stock, price = listing_stock_price(listing)
+    return {
+        "barcode": listing.variant.barcode,
+        "quantity": int(stock),
+        "salePrice": float(price),
+        "listPrice": float(price)
+    }
+
 @shared_task
 def update_trendyol_stock_price(listing_id: int):
     """
-    Trimite actualizarea de stoc/preț pentru o singură listare.
+    Trimite imediat actualizarea de stoc/preț pentru o singură listare.
+    Salvările de variante nu mai folosesc acest task: ele trec prin outbox
+    (vezi flush_trendyol_stock_price_updates).
     """
     try:
-        listing = MarketplaceListing.objects.select_related('variant').get(id=listing_id)
-        
-        # Calculăm valorile (luăm override dacă există, altfel valoarea din variantă)
-        stock = listing.stock_override if listing.stock_override is not None else listing.variant.stock
-        price = listing.price_override if listing.price_override is not None else listing.variant.price
-        
-        payload = {
-            "items": [
-                {
-                    "barcode": listing.variant.barcode,
-                    "quantity": int(stock),
-                    "salePrice": float(price),
-                    "listPrice": float(price)
-                }
-            ]
-        }
-        
-        service = TrendyolAPIService(user=listing.account, account_id=listing.platform_account.id)
-        
-        # Apelăm endpoint-ul de inventory
-        # Notă: Trebuie să expui metoda în service (folosind _make_request pe endpoint-ul corect)
-        # URL: /integration/inventory/sellers/{sellerId}/products/price-and-inventory
-        
-        base_url_inv = f"https://apigw.trendyol.com/integration/inventory/sellers/{service.account.seller_id}"
-        response = service._make_request("POST", base_url_inv, "/products/price-and-inventory", json_data=payload)
+        listing = MarketplaceListing.objects.select_related('variant', 'platform_account').get(id=listing_id)
+        service = TrendyolAPIService.for_account(listing.platform_account)
+        response = service.update_price_and_inventory({"items": [_stock_price_item(listing)]})
         
         logger.info(f"Update stoc trimis pt {listing.variant.sku}. Batch: {response.get('batchRequestId')}")
         
     except Exception as e:
         logger.error(f"Eroare update stoc listing {listing_id}: {e}")
 
+@shared_task
+def flush_trendyol_stock_price_updates():
+    """
+    Task periodic: trimite listările marcate în outbox (PendingListingSync), grupate pe
+    cont, în loturi de până la STOCK_PRICE_BATCH_LIMIT produse. Pentru fiecare barcode
+    pleacă o singură dată stocul/prețul curent, oricâte salvări au fost între timp.
+    """
+    started = timezone.now()
+    pending = PendingListingSync.objects.filter(
+        marked_at__lte=started,
+        listing__platform_account__platform=MarketplaceAccount.Platform.TRENDYOL,
+    )
+    account_ids = list(pending.values_list('listing__platform_account_id', flat=True).distinct())
+
+    for account_id in account_ids:
+        try:
+            _flush_account_stock_price(account_id, started)
+        except Exception as e:
+            # Rândurile rămân în outbox și se retrimit la următoarea rulare
+            logger.error(f"Eroare la trimiterea stoc/preț pentru contul {account_id}: {e}", exc_info=True)
+
+def _flush_account_stock_price(account_id, started):
+    account = MarketplaceAccount.objects.get(id=account_id)
+    pending = PendingListingSync.objects.filter(marked_at__lte=started, listing__platform_account_id=account_id)
+
+    # Ultimul stoc/preț per barcode (două listări pe același barcode => una singură trimisă)
+    items_by_barcode = {}
+    listing_ids_by_barcode = {}
+    listings = (
+        MarketplaceListing.objects.filter(pending_sync__in=pending, status=MarketplaceListing.Status.ACTIVE)
+        .select_related('variant')
+        .order_by('id')
+    )
+    for listing in listings:
+        item = _stock_price_item(listing)
+        items_by_barcode[item["barcode"]] = item
+        listing_ids_by_barcode.setdefault(item["barcode"], []).append(listing.id)
+
+    # Listările care nu mai sunt active nu mai au ce trimite
+    pending.exclude(listing__status=MarketplaceListing.Status.ACTIVE).delete()
+    if not items_by_barcode:
+        return
+
+    service = TrendyolAPIService.for_account(account)
+    barcodes = list(items_by_barcode)
+    limit = TrendyolAPIService.STOCK_PRICE_BATCH_LIMIT
+    for offset in range(0, len(barcodes), limit):
+        batch = barcodes[offset:offset + limit]
+        response = service.update_price_and_inventory({"items": [items_by_barcode[b] for b in batch]})
+        batch_id = response.get('batchRequestId') or ''
+        StockPriceBatch.objects.create(
+            platform_account=account, batch_request_id=batch_id, item_count=len(batch), barcodes=batch
+        )
+        # Ștergem doar marcajele acoperite de acest lot; o listare re-marcată după `started` rămâne
+        sent_ids = [listing_id for b in batch for listing_id in listing_ids_by_barcode[b]]
+        pending.filter(listing_id__in=sent_ids).delete()
+        logger.info(f"Cont {account.name}: lot stoc/preț cu {len(batch)} produse trimis. Batch: {batch_id}")
+
 @shared_task
 def import_trendyol_products_task(account_id):
     """
     Importă toate produsele existente de pe Trendyol în PIM-ul local.
+
+    Paginile se descarcă în paralel (iter_product_pages) și se salvează pe rând, fiecare
+    cu câteva operații bulk, într-o tranzacție. bulk_create / bulk_update nu trimit
+    semnale, deci produsele importate nu pleacă înapoi spre Trendyol.
+    După fiecare pagină salvăm un checkpoint în cache: dacă task-ul e întrerupt,
+    rularea următoare continuă de la pagina următoare.
     """
     logger.info(f"Start task import produse pentru contul {account_id}")
-    
+    checkpoint_key = IMPORT_CHECKPOINT_KEY.format(account_id=account_id)
+
     try:
         account = MarketplaceAccount.objects.get(id=account_id)
-        service = TrendyolAPIService(user=account.user, account_id=account.id)
-        
-        stats = {"created_products": 0, "created_variants": 0, "linked_listings": 0}
-        
-        # Iterăm prin toate produsele folosind generatorul din service
-        for t_prod in service.get_all_products_generator():
-            
-            # 1. Extragere date cheie
-            # Trendyol structurează ciudat: un item în listă este de fapt o variantă.
-            # Gruparea se face după 'productMainId'.
-            
-            main_id = t_prod.get('productMainId') or f"GEN-{t_prod.get('productCode')}"
-            title = t_prod.get('title')
-            brand_name = t_prod.get('brand', 'Generic')
-            description = t_prod.get('description', '')
-            
-            barcode = t_prod.get('barcode')
-            sku = t_prod.get('stockCode') or barcode # SKU Variantă
-            
-            quantity = t_prod.get('quantity', 0)
-            sale_price = t_prod.get('salePrice', 0)
-            list_price = t_prod.get('listPrice', 0)
-
-            vat_rate = t_prod.get('vatRate', 21)
+        service = TrendyolAPIService.for_account(account)
+        size = TrendyolAPIService.PRODUCTS_PAGE_SIZE
 
-            shipment_addr_id = t_prod.get('shipmentAddressId')
-            return_addr_id = t_prod.get('returningAddressId')
-            
-            images = t_prod.get('images', [])
-            image_urls = [img['url'] for img in images]
-            
-            # Atribute (Culoare, Mărime etc)
-            attributes_data = t_prod.get('attributes') or []
-            attributes = {}
-            for attr in attributes_data:
-                # Luăm numele și valoarea, ignorând null-urile
-                a_name = attr.get('attributeName')
-                a_val = attr.get('attributeValue')
-                if a_name and a_val:
-                    attributes[a_name] = a_val
-
-            # 2. Gestionare PRODUS PĂRINTE (PIM Product)
-            # Căutăm după SKU-ul părintelui (productMainId) SAU creăm unul nou
-            product, prod_created = Product.objects.get_or_create(
-                sku=main_id,
-                account=account.user,
-                defaults={
-                    'title': title,
-                    'brand': brand_name,
-                    'description': description
-                }
-            )
-            if prod_created:
-                stats["created_products"] += 1
-
-            # 3. Gestionare VARIANTĂ (PIM Variant)
-            # Căutăm după SKU-ul variantei
-            variant, var_created = ProductVariant.objects.update_or_create(
-                sku=sku,
-                product=product,
-                defaults={
-                    'barcode': barcode,
-                    'stock': quantity,      # Sincronizăm stocul inițial
-                    'price': sale_price,    # Sincronizăm prețul
-                    'list_price': list_price,
-                    'images': image_urls,
-                    'attributes': attributes
-                }
-            )
-            if var_created:
-                stats["created_variants"] += 1
-
-            # 4. Gestionare LISTING (Legătura)
-            # Creăm legătura ca să știm că acest produs e deja pe Trendyol
-            listing, list_created = MarketplaceListing.objects.update_or_create(
-                variant=variant,
-                platform_account=account,
-                defaults={
-                    'account': account.user,
-                    'status': MarketplaceListing.Status.ACTIVE, # E deja acolo
-                    'platform_listing_id': t_prod.get('productContentId') or '',
-                    'platform_brand_id': str(t_prod.get('brandId', '')),
-                    'platform_category_id': str(t_prod.get('pimCategoryId', '')),
-                    'last_sync_status': "Importat automat din Trendyol",
-                    # Putem salva și atributele specifice platformei dacă vrem
-                    'platform_attributes': t_prod.get('attributes', []),
-                    'vat_rate': vat_rate,
-                    'shipment_address_id': shipment_addr_id,
-                    'returning_address_id': return_addr_id
-                }
+        checkpoint = cache.get(checkpoint_key)
+        if checkpoint and checkpoint.get("size") == size:
+            start_page, stats = checkpoint["page"] + 1, checkpoint["stats"]
+            logger.info(f"Reluăm importul contului {account_id} de la pagina {start_page}")
+        else:
+            start_page = 0
+            stats = {"created_products": 0, "created_variants": 0, "linked_listings": 0, "skipped": 0}
+
+        started = time.monotonic()
+        imported = 0
+        for page, total_pages, content in service.iter_product_pages(start_page=start_page, size=size):
+            with transaction.atomic():
+                _import_products_page(account, content, stats)
+            cache.set(checkpoint_key, {"page": page, "size": size, "stats": stats}, IMPORT_CHECKPOINT_TTL)
+
+            imported += len(content)
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Import cont {account_id}: pagina {page + 1}/{total_pages}, "
+                f"{imported} produse în {elapsed:.1f}s ({imported / elapsed if elapsed else 0:.0f} produse/s)"
             )
-            if list_created:
-                stats["linked_listings"] += 1
-                
+
+        cache.delete(checkpoint_key)
+        elapsed = time.monotonic() - started
+        stats["seconds"] = round(elapsed, 1)
+        stats["items_per_second"] = round(imported / elapsed, 1) if elapsed else 0
         logger.info(f"Import finalizat cu succes: {stats}")
         return stats
 
     except Exception as e:
-        logger.error(f"Eroare la importul produselor: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Eroare la importul produselor: {e}", exc_info=True)
+
+
+def _trendyol_item_fields(t_prod):
+    """
+    Câmpurile PIM dintr-un item Trendyol. Trendyol structurează ciudat: un item în
+    listă este de fapt o variantă; gruparea în produse se face după 'productMainId'.
+    """
+    barcode = t_prod.get('barcode')
+    # Atribute (Culoare, Mărime etc), ignorând null-urile
+    attributes = {
+        attr.get('attributeName'): attr.get('attributeValue')
+        for attr in t_prod.get('attributes') or []
+        if attr.get('attributeName') and attr.get('attributeValue')
+    }
+    return {
+        "main_id": t_prod.get('productMainId') or f"GEN-{t_prod.get('productCode')}",
+        "title": t_prod.get('title'),
+        "brand": t_prod.get('brand', 'Generic'),
+        "description": t_prod.get('description', ''),
+        "barcode": barcode,
+        "sku": t_prod.get('stockCode') or barcode, # SKU Variantă
+        "stock": t_prod.get('quantity', 0),
+        "price": t_prod.get('salePrice', 0),
+        "list_price": t_prod.get('listPrice', 0),
+        "images": [img['url'] for img in t_prod.get('images', [])],
+        "attributes": attributes,
+    }
+
+
+def _import_products_page(account, content, stats):
+    """
+    Salvează o pagină de produse Trendyol: produse părinte (create dacă lipsesc),
+    variante (create sau actualizate) și listările care le leagă de cont.
+    Un număr fix de interogări per pagină, oricâte produse are.
+    """
+    user_id = account.user_id
+    items = [(t_prod, _trendyol_item_fields(t_prod)) for t_prod in content]
+    now = timezone.now()
+
+    # 1. Produse părinte: creăm doar ce lipsește (ca get_or_create)
+    main_ids = {fields["main_id"] for _, fields in items}
+    known = set(Product.objects.filter(sku__in=main_ids, account_id=user_id).values_list('sku', flat=True))
+    new_products = {}
+    for _, fields in items:
+        if fields["main_id"] not in known and fields["main_id"] not in new_products:
+            new_products[fields["main_id"]] = Product(
+                sku=fields["main_id"], account_id=user_id,
+                title=fields["title"], brand=fields["brand"], description=fields["description"],
+            )
+    # SKU-ul de produs e unic global: unul luat de alt cont se ignoră (și itemii lui, mai jos)
+    Product.objects.bulk_create(new_products.values(), ignore_conflicts=True)
+    product_ids = dict(Product.objects.filter(sku__in=main_ids, account_id=user_id).values_list('sku', 'id'))
+    stats["created_products"] += len(product_ids) - len(known)
+
+    # 2. Variante: după SKU, în produsul lor (ca update_or_create(sku, product))
+    variant_fields = ['barcode', 'stock', 'price', 'list_price', 'images', 'attributes']
+    existing = {
+        variant.sku: variant
+        for variant in ProductVariant.objects.filter(sku__in={fields["sku"] for _, fields in items})
+    }
+    to_create, to_update, imported = {}, {}, []
+    for t_prod, fields in items:
+        product_id = product_ids.get(fields["main_id"])
+        variant = existing.get(fields["sku"]) or to_create.get(fields["sku"])
+        if product_id is None or (variant is not None and variant.product_id != product_id):
+            logger.warning(f"Import cont {account.id}: SKU {fields['sku']} ({fields['main_id']}) aparține altui produs, ignorat")
+            stats["skipped"] += 1
+            continue
+        if variant is None:
+            variant = ProductVariant(sku=fields["sku"], product_id=product_id)
+            to_create[variant.sku] = variant
+        elif variant.pk:
+            variant.updated_at = now
+            to_update[variant.sku] = variant
+        for name in variant_fields:
+            setattr(variant, name, fields[name])
+        imported.append((t_prod, variant))
+
+    ProductVariant.objects.bulk_create(to_create.values())
+    ProductVariant.objects.bulk_update(to_update.values(), variant_fields + ['updated_at'])
+    stats["created_variants"] += len(to_create)
+    if not imported:
+        return
+    variant_ids = dict(
+        ProductVariant.objects.filter(sku__in=[variant.sku for _, variant in imported]).values_list('sku', 'id')
+    )
+
+    # 3. Listări (legătura cu contul): upsert pe (variant, platform_account)
+    linked = set(
+        MarketplaceListing.objects.filter(platform_account=account, variant_id__in=variant_ids.values())
+        .values_list('variant_id', flat=True)
+    )
+    listings = {}
+    for t_prod, variant in imported:
+        variant_id = variant_ids[variant.sku]
+        listings[variant_id] = MarketplaceListing(
+            variant_id=variant_id,
+            platform_account=account,
+            account_id=user_id,
+            status=MarketplaceListing.Status.ACTIVE, # E deja acolo
+            platform_listing_id=t_prod.get('productContentId') or '',
+            platform_brand_id=str(t_prod.get('brandId', '')),
+            platform_category_id=str(t_prod.get('pimCategoryId', '')),
+            last_sync_status="Importat automat din Trendyol",
+            # Putem salva și atributele specifice platformei dacă vrem
+            platform_attributes=t_prod.get('attributes', []),
+            vat_rate=t_prod.get('vatRate', 21),
+            shipment_address_id=t_prod.get('shipmentAddressId'),
+            returning_address_id=t_prod.get('returningAddressId'),
+        )
+    MarketplaceListing.objects.bulk_create(
+        listings.values(),
+        update_conflicts=True,
+        unique_fields=['variant', 'platform_account'],
+        update_fields=[
+            'account', 'status', 'platform_listing_id', 'platform_brand_id', 'platform_category_id',
+            'last_sync_status', 'platform_attributes', 'vat_rate', 'shipment_address_id',
+            'returning_address_id', 'updated_at',
+        ],
+    )
+    stats["linked_listings"] += len(set(listings) - linked)
+
+    # Stocul bundle-urilor locale care conțin variantele importate se recalculează la commit
+    mark_components_changed(variant_ids.values())
@@ -1,3 +1,105 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ecommerce_core import demand
+from ecommerce_core.models import BundleComponent, DemandFeature, MarketplaceAccount, Order, OrderLineItem, Product, ProductVariant
+from .services import TrendyolAPIService
+
+
+def _package(package_id, lines, status="Created"):
+    return {
+        "id": package_id,
+        "orderNumber": f"ORD-{package_id}",
+        "orderDate": 1760000000000,
+        "totalPrice": 100,
+        "status": status,
+        "lines": [
+            {"id": line_id, "merchantSku": sku, "quantity": qty, "price": 10, "orderLineItemStatusName": status}
+            for line_id, sku, qty in lines
+        ],
+    }
+
+
+class ProcessOrdersPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="seller")
+        cls.account = MarketplaceAccount.objects.create(
+            user=cls.user, platform=MarketplaceAccount.Platform.TRENDYOL, name="Trendyol RO", seller_id="1"
+        )
+        product = Product.objects.create(account=cls.user, sku="P", title="Produs", brand="Brand")
+        cls.simples = [
+            ProductVariant.objects.create(product=product, sku=f"S{i}", barcode=f"B{i}", stock=100, price=10)
+            for i in range(20)
+        ]
+        cls.bundle = ProductVariant.objects.create(
+            product=product, sku="SET", barcode="BSET", stock=0, price=30, type=ProductVariant.Type.BUNDLE
+        )
+        BundleComponent.objects.create(bundle_variant=cls.bundle, component_variant=cls.simples[0], quantity=2)
+
+    def setUp(self):
+        self.service = TrendyolAPIService(user=self.user, account_id=self.account.id)
+
+    def _page(self, packages, lines_per_package, first_id=1):
+        return [
+            _package(package_id, [(package_id * 100 + i, f"S{i % 20}", 1) for i in range(lines_per_package)])
+            for package_id in range(first_id, first_id + packages)
+        ]
+
+    def _queries(self, page):
+        with CaptureQueriesContext(connection) as ctx:
+            self.service.process_orders_page(page)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # Prima rulare construiește tabela de cerere; o facem în afara măsurătorii
+        self.service.process_orders_page(self._page(1, 1))
+        # Pachete noi, cu aceeași cantitate pe fiecare SKU (un singur UPDATE de stoc);
+        # 80 de linii rămân sub limita de parametri per INSERT a SQLite
+        small = self._page(2, 3, first_id=10)
+        large = self._page(10, 8, first_id=20)
+
+        self.assertEqual(self._queries(small), self._queries(large))
+
+    def test_page_query_count(self):
+        self.service.process_orders_page(self._page(1, 1))
+        page = self._page(5, 10, first_id=10)
+
+        # upsert comenzi, blocare comenzi, linii existente, variante, insert linii,
+        # conturi cu cerere, linii anterioare, blocare cerere, update cerere, insert cerere,
+        # stoc (o singură cantitate), listări de marcat, plus 2 x 2 savepoint-uri
+        # (tranzacția paginii și cea din jurul insert-ului de cerere)
+        with self.assertNumQueries(16):
+            self.service.process_orders_page(page)
+
+    def test_replay_is_idempotent_and_updates_status(self):
+        page = [_package(1, [(10, "S1", 3), (11, "SET", 2)])]
+        self.service.process_orders_page(page)
+        stock_after_first = dict(ProductVariant.objects.values_list("sku", "stock"))
+        self.assertEqual(stock_after_first["S1"], 97)
+        self.assertEqual(stock_after_first["S0"], 96)
+
+        replay = [_package(1, [(10, "S1", 3), (11, "SET", 2)], status="Picking")]
+        orders = self.service.process_orders_page(replay)
+
+        self.assertEqual(dict(ProductVariant.objects.values_list("sku", "stock")), stock_after_first)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(orders[0].status, "Picking")
+        self.assertEqual(
+            set(OrderLineItem.objects.values_list("platform_order_line_id", "status")),
+            {("10", "Picking"), ("11", "Picking")},
+        )
+
+    def test_demand_is_built_once_when_lines_have_no_features(self):
+        # Linii fără SKU: nu produc cerere, deci contul rămâne fără rânduri DemandFeature
+        with mock.patch.object(demand, "rebuild_demand_features", wraps=demand.rebuild_demand_features) as rebuild:
+            self.service.process_orders_page([_package(1, [(10, "", 1)])])
+            self.service.process_orders_page([_package(2, [(20, "", 1)])])
+            demand.account_demand(self.user)
 
-# Create your tests here.
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertFalse(DemandFeature.objects.filter(account=self.user).exists())
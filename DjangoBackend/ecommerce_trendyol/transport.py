@@ -0,0 +1,266 @@
+"""
+Transportul HTTP către API-ul Trendyol.
+
+- o sesiune requests (keep-alive, pool de conexiuni) per cont, per proces;
+- un token bucket per cont, ținut în Redis, deci comun tuturor worker-ilor Celery
+  (fallback: un bucket local procesului, dacă Redis nu e disponibil);
+- reîncercări cu backoff exponențial și jitter la 429/5xx/erori de rețea, cu
+  respectarea header-ului Retry-After;
+- metrici per endpoint (cereri, erori, reîncercări, latență), în Redis.
+
+TrendyolAPIService trimite toate cererile prin `send`.
+"""
+import email.utils
+import logging
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 10
+
+# Limita Trendyol: 50 de cereri la 10 secunde per seller
+RATE_LIMIT_REQUESTS = 50
+RATE_LIMIT_PERIOD = 10.0
+
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+# Un Retry-After mai lung nu îl așteptăm într-un worker: întoarcem răspunsul
+MAX_RETRY_AFTER = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# La 5xx / erori de rețea repetăm doar cererile idempotente; POST doar la 429 (neprocesat)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+
+BUCKET_KEY = "trendyol:ratelimit:{account_id}"
+METRICS_KEY = "trendyol:metrics"
+
+# Rezervă un token (soldul poate deveni negativ) și întoarce câte secunde trebuie
+# așteptat până la el. Timpul vine de la Redis, deci ceasurile worker-ilor nu contează.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) * 2 + 1)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+_sessions: Dict[int, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def account_session(account_id: int) -> requests.Session:
+    """Sesiunea contului, creată la primul apel; folosită și de thread-urile de prefetch."""
+    session = _sessions.get(account_id)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(account_id)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[account_id] = session
+    return session
+
+
+_redis_client = None
+_redis_script = None
+
+
+def _redis():
+    """Conexiunea Redis din cache-ul Django (django_redis) sau None dacă nu există."""
+    global _redis_client
+    if _redis_client is None:
+        try:
+            from django_redis import get_redis_connection
+
+            _redis_client = get_redis_connection("default")
+        except Exception:
+            _redis_client = False
+    return _redis_client or None
+
+
+class _LocalBucket:
+    """Același algoritm ca scriptul Lua, pentru un singur proces."""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.ts) * self.rate) - 1
+            self.ts = now
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+_local_buckets: Dict[int, _LocalBucket] = {}
+
+
+def _reserve_token(account_id: int) -> float:
+    global _redis_script
+    capacity, rate = RATE_LIMIT_REQUESTS, RATE_LIMIT_REQUESTS / RATE_LIMIT_PERIOD
+    client = _redis()
+    if client is not None:
+        try:
+            if _redis_script is None:
+                _redis_script = client.register_script(TOKEN_BUCKET_LUA)
+            wait = _redis_script(keys=[BUCKET_KEY.format(account_id=account_id)], args=[capacity, rate])
+            return float(wait)
+        except Exception as e:
+            logger.warning(f"Rate limiter Redis indisponibil, folosim limita locală: {e}")
+    with _sessions_lock:
+        bucket = _local_buckets.setdefault(account_id, _LocalBucket(capacity, rate))
+    return bucket.reserve()
+
+
+def acquire(account_id: int) -> None:
+    """Blochează până când contul are voie să mai trimită o cerere."""
+    wait = _reserve_token(account_id)
+    if wait > 0:
+        time.sleep(wait)
+
+
+_ID_SEGMENT = re.compile(r"/(?:\d+|[0-9a-fA-F-]{16,})(?=/|$)")
+
+
+def endpoint_label(method: str, url: str) -> str:
+    """Ex: 'GET /integration/order/sellers/{id}/orders' (ID-urile nu multiplică metricile)."""
+    return f"{method.upper()} {_ID_SEGMENT.sub('/{id}', urlsplit(url).path)}"
+
+
+_local_metrics: Dict[str, float] = defaultdict(float)
+
+
+def record_metric(endpoint: str, latency: float, error: bool = False, retried: bool = False) -> None:
+    fields = {f"{endpoint}|requests": 1, f"{endpoint}|latency_ms": int(latency * 1000)}
+    if error:
+        fields[f"{endpoint}|errors"] = 1
+    if retried:
+        fields[f"{endpoint}|retries"] = 1
+    logger.debug(f"Trendyol {endpoint}: {latency * 1000:.0f} ms{' (eroare)' if error else ''}")
+
+    client = _redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            for field, value in fields.items():
+                pipe.hincrby(METRICS_KEY, field, value)
+            pipe.execute()
+            return
+        except Exception:
+            pass
+    for field, value in fields.items():
+        _local_metrics[field] += value
+
+
+def endpoint_metrics() -> Dict[str, Dict[str, float]]:
+    """{endpoint: {requests, errors, retries, avg_ms}}, agregat de la ultima resetare a cheii."""
+    raw: Dict[str, float] = dict(_local_metrics)
+    client = _redis()
+    if client is not None:
+        try:
+            raw = {
+                (key.decode() if isinstance(key, bytes) else key): float(value)
+                for key, value in client.hgetall(METRICS_KEY).items()
+            }
+        except Exception:
+            pass
+    metrics: Dict[str, Dict[str, float]] = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0, "latency_ms": 0})
+    for field, value in raw.items():
+        endpoint, name = field.rsplit("|", 1)
+        metrics[endpoint][name] = value
+    for values in metrics.values():
+        values["avg_ms"] = values.pop("latency_ms") / values["requests"] if values["requests"] else 0.0
+    return dict(metrics)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # Poate fi și o dată HTTP
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: worker-ii care au primit 429 în același timp nu revin împreună
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def send(account_id: int, method: str, url: str, *, headers=None, params=None, json_data=None, files=None, timeout=15):
+    """
+    Trimite cererea respectând limita contului și întoarce ultimul răspuns (inclusiv
+    4xx/5xx, după epuizarea reîncercărilor); erorile de rețea se propagă ca
+    requests.exceptions.RequestException. Cererile cu fișiere nu se repetă.
+    """
+    method = method.upper()
+    session = account_session(account_id)
+    endpoint = endpoint_label(method, url)
+    attempt = 0
+    while True:
+        attempt += 1
+        acquire(account_id)
+        started = time.monotonic()
+        try:
+            response = session.request(
+                method, url, headers=headers, params=params, json=json_data, files=files, timeout=timeout
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            can_retry = attempt < MAX_ATTEMPTS and method in IDEMPOTENT_METHODS and not files
+            record_metric(endpoint, time.monotonic() - started, error=not can_retry, retried=can_retry)
+            if not can_retry:
+                raise
+            delay = _backoff(attempt)
+            logger.warning(f"Trendyol {endpoint}: {e}; reîncercare {attempt}/{MAX_ATTEMPTS - 1} peste {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        status = response.status_code
+        can_retry = (
+            status in RETRY_STATUSES
+            and attempt < MAX_ATTEMPTS
+            and (method in IDEMPOTENT_METHODS or status == 429)
+            and not files
+        )
+        delay = None
+        if can_retry:
+            retry_after = _retry_after(response)
+            if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+                can_retry = False
+            else:
+                delay = _backoff(attempt) if retry_after is None else retry_after + random.uniform(0, 1)
+        record_metric(endpoint, time.monotonic() - started, error=status >= 400 and not can_retry, retried=can_retry)
+        if not can_retry:
+            return response
+        logger.warning(f"Trendyol {endpoint}: HTTP {status}; reîncercare {attempt}/{MAX_ATTEMPTS - 1} peste {delay:.1f}s")
+        time.sleep(delay)
@@ -113,7 +113,7 @@ class BrandSearchView(APIView, AccountIDMixin): # <-- Am adăugat AccountIDMixin
         logger.info(f"Cache miss pentru brand: {cache_key}. Se apelează API-ul.")
         try:
             # Instanțiem serviciul cu contul corect
-            service = TrendyolAPIService(user=request.user, account_id=account_id)
+            service = TrendyolAPIService.cached(request.user, account_id)
             brand_data = service.get_brand_by_name(brand_name)
             
             cache.set(cache_key, brand_data, timeout=CACHE_TTL_DYNAMIC)
@@ -149,7 +149,7 @@ class CategoryAttributeView(APIView, AccountIDMixin): # <-- Am adăugat AccountI
         logger.info(f"Cache miss pentru atribute: {cache_key}. Se apelează API-ul.")
         try:
             # Instanțiem serviciul cu contul corect
-            service = TrendyolAPIService(user=request.user, account_id=account_id)
+            service = TrendyolAPIService.cached(request.user, account_id)
             attribute_data = service.get_attributes(category_id)
             
             cache.set(cache_key, attribute_data, timeout=CACHE_TTL_DYNAMIC)